@@ -0,0 +1,99 @@
+import re
+import hmac
+import base64
+import hashlib
+
+import encryption
+
+# Images pasted into notes are kept out of the note itself. Each one is encrypted on its
+# own and stored once under a content hash (see the attachment methods in storage.py);
+# the note's HTML only references it as <img src="att:<hash>" width=.. height=..>. Notes
+# stay small, the same image pasted into several notes is stored once, and an image is
+# only read and decrypted when the editor actually paints it. Attachments that no note
+# or revision references any more are deleted by the integrity check.
+#
+# The hash is an HMAC keyed from the vault key rather than a plain SHA-256, so attachment
+# names don't reveal which (publicly known) images a vault contains.
+
+ATTACHMENT_SCHEME = 'att'
+
+_REFERENCE = re.compile(r'src="att:([0-9a-f]{64})"')
+_DATA_IMAGE = re.compile(r'<img\b([^>]*?)\bsrc="data:image/[\w.+-]+;base64,([A-Za-z0-9+/=\s]+)"([^>]*)>')
+
+_MIME_TYPES = (
+    (b'\x89PNG', 'image/png'),
+    (b'\xff\xd8', 'image/jpeg'),
+    (b'GIF8', 'image/gif'),
+    (b'BM', 'image/bmp'),
+)
+
+
+def attachment_id(key, data):
+    mac_key = hashlib.sha256(b'attachments' + base64.urlsafe_b64decode(key)).digest()
+    return hmac.new(mac_key, data, hashlib.sha256).hexdigest()
+
+
+def attachment_url(digest):
+    return f"{ATTACHMENT_SCHEME}:{digest}"
+
+
+def digest_from_url(url):
+    # The digest for an att: URL, None for anything else
+    if url.startswith(ATTACHMENT_SCHEME + ':'):
+        return url[len(ATTACHMENT_SCHEME) + 1:]
+    return None
+
+
+def references(html):
+    return set(_REFERENCE.findall(html))
+
+
+def mime_type(data):
+    for magic, mime in _MIME_TYPES:
+        if data.startswith(magic):
+            return mime
+    return 'application/octet-stream'
+
+
+class AttachmentStore:
+    def __init__(self, storage):
+        self.storage = storage
+
+    def put(self, key, data):
+        # Stores `data` unless an identical attachment already exists; returns its digest
+        digest = attachment_id(key, data)
+        if not self.storage.has_attachment(digest):
+            self.storage.write_attachment(digest, encryption.encrypt_data(key, data))
+        return digest
+
+    def get(self, key, digest):
+        return encryption.decrypt_data(key, self.storage.read_attachment(digest))
+
+
+def externalize_images(html, put):
+    # Moves inline data: images out of `html`; put(bytes) stores one and returns its digest
+    def replace(match):
+        before, payload, after = match.groups()
+        data = base64.b64decode(''.join(payload.split()))
+        attributes = before.strip()
+        if 'width=' not in before + after or 'height=' not in before + after:
+            # Without both, the editor has to decode the image just to lay the note out
+            from PyQt6.QtGui import QImage
+            image = QImage.fromData(data)
+            if not image.isNull():
+                attributes = f'{attributes} width="{image.width()}" height="{image.height()}"'.strip()
+        if attributes:
+            attributes += ' '
+        return f'<img {attributes}src="{attachment_url(put(data))}"{after}>'
+    return _DATA_IMAGE.sub(replace, html)
+
+
+def inline_images(html, get):
+    # The reverse, for exports: get(digest) returns the image bytes
+    def replace(match):
+        try:
+            data = get(match.group(1))
+        except Exception:
+            return match.group(0)
+        return f'src="data:{mime_type(data)};base64,{base64.b64encode(data).decode("ascii")}"'
+    return _REFERENCE.sub(replace, html)
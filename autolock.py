@@ -0,0 +1,59 @@
+import time
+
+from PyQt6.QtCore import QObject, QEvent, QTimer, pyqtSignal
+
+# Idle detection for the auto-lock. Installed as an event filter on the application, it
+# sees keyboard and mouse input for every window and dialog. It runs for every event the
+# app handles (paints, timers, mouse moves), so it does nothing but a set lookup; input
+# only records a timestamp, and the single timer checks it when it fires and re-arms for
+# the remainder.
+
+DEFAULT_POLICY = {
+    # 0 turns the auto-lock off
+    'idle_minutes': 10,
+}
+
+# Mouse moves are left out: they are by far the most frequent events, and a click, key
+# or scroll comes soon enough from anyone actually working
+_ACTIVITY = frozenset((
+    QEvent.Type.KeyPress,
+    QEvent.Type.MouseButtonPress,
+    QEvent.Type.Wheel,
+))
+
+
+class IdleMonitor(QObject):
+    idle = pyqtSignal()
+
+    def __init__(self, policy=None, parent=None):
+        super().__init__(parent)
+        self.policy = dict(DEFAULT_POLICY, **(policy or {}))
+        self._last_input = time.monotonic()
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._check)
+
+    @property
+    def limit_ms(self):
+        return int(self.policy['idle_minutes'] * 60_000)
+
+    def start(self):
+        # (Re)starts counting from now; a no-op when the auto-lock is off
+        self._last_input = time.monotonic()
+        if self.limit_ms > 0:
+            self._timer.start(self.limit_ms)
+
+    def stop(self):
+        self._timer.stop()
+
+    def eventFilter(self, obj, event):
+        if event.type() in _ACTIVITY:
+            self._last_input = time.monotonic()
+        return False
+
+    def _check(self):
+        remaining = self.limit_ms - (time.monotonic() - self._last_input) * 1000
+        if remaining > 0:
+            self._timer.start(int(remaining) + 1)
+        else:
+            self.idle.emit()
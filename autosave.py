@@ -0,0 +1,68 @@
+import time
+
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
+
+# Decides when the open note gets autosaved. Every edit restarts a debounce whose length
+# grows with the document size and with what saves have actually been costing (a
+# moving average), so small notes save quickly and large ones aren't re-encrypted on
+# every pause. A cap on the time since the first unsaved edit makes sure continuous
+# typing still gets saved.
+
+DEFAULT_POLICY = {
+    'base_delay_ms': 1500,
+    'delay_per_100k_chars_ms': 1000,
+    # Extra debounce per ms a save takes (averaged)
+    'save_cost_factor': 10,
+    'min_delay_ms': 1000,
+    'max_delay_ms': 15000,
+    # Longest an edit may stay unsaved while typing continues
+    'max_unsaved_ms': 30000,
+}
+
+_COST_SMOOTHING = 0.3
+
+
+class AutosaveScheduler(QObject):
+    due = pyqtSignal()
+
+    def __init__(self, policy=None, parent=None):
+        super().__init__(parent)
+        self.policy = dict(DEFAULT_POLICY, **(policy or {}))
+        self.save_cost_ms = 0.0
+        self._dirty_since = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._fire)
+
+    def delay_for(self, doc_chars):
+        p = self.policy
+        delay = (p['base_delay_ms'] + p['delay_per_100k_chars_ms'] * doc_chars / 100_000
+                 + p['save_cost_factor'] * self.save_cost_ms)
+        return int(min(p['max_delay_ms'], max(p['min_delay_ms'], delay)))
+
+    def note_changed(self, doc_chars):
+        now = time.monotonic()
+        if self._dirty_since is None:
+            self._dirty_since = now
+        remaining = self.policy['max_unsaved_ms'] - (now - self._dirty_since) * 1000
+        self._timer.start(max(0, int(min(self.delay_for(doc_chars), remaining))))
+
+    def saved(self, seconds=None):
+        # Call after every save (auto or manual) with how long it took
+        if seconds is not None:
+            cost = seconds * 1000
+            self.save_cost_ms = cost if not self.save_cost_ms else \
+                self.save_cost_ms + _COST_SMOOTHING * (cost - self.save_cost_ms)
+        self.cancel()
+
+    def cancel(self):
+        self._timer.stop()
+        self._dirty_since = None
+
+    @property
+    def pending(self):
+        return self._timer.isActive()
+
+    def _fire(self):
+        self._dirty_since = None
+        self.due.emit()
@@ -0,0 +1,241 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import datetime
+
+import encryption
+from note_format import unpack_note
+from history import NoteHistory
+
+# Incremental snapshots of the vault. Note ciphertexts are stored once, content-addressed
+# by their SHA-256, under <backup dir>/objects; each snapshot is a small encrypted
+# manifest (note id -> object hash + storage stamp) under <backup dir>/snapshots. A note
+# whose storage stamp hasn't moved since the previous snapshot is not even read again, and
+# unchanged notes share one object across every snapshot that contains them.
+#
+# Attachments are already immutable and content-named, so each is copied as an object
+# only the first time a snapshot sees it.
+#
+# The vault config (salt + password verifier, not secret) is copied alongside, since the
+# snapshots are useless without it.
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_SUFFIX = '.snap'
+
+
+def _objects_dir(backup_dir):
+    return os.path.join(backup_dir, 'objects')
+
+
+def _snapshots_dir(backup_dir):
+    return os.path.join(backup_dir, 'snapshots')
+
+
+def _object_path(backup_dir, digest):
+    # Two-character fan-out keeps directories small on big vaults
+    return os.path.join(_objects_dir(backup_dir), digest[:2], digest)
+
+
+def _write_atomic(path, data):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def list_snapshots(backup_dir):
+    # Snapshot names, oldest first
+    try:
+        names = os.listdir(_snapshots_dir(backup_dir))
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len(SNAPSHOT_SUFFIX)] for name in names if name.endswith(SNAPSHOT_SUFFIX))
+
+
+def load_snapshot(backup_dir, key, name):
+    with open(os.path.join(_snapshots_dir(backup_dir), name + SNAPSHOT_SUFFIX), 'rb') as f:
+        data = json.loads(encryption.decrypt_data(key, f.read()).decode('utf-8'))
+    if data.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version in {name}")
+    return data
+
+
+def _new_snapshot_name(backup_dir):
+    base = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+    existing = set(list_snapshots(backup_dir))
+    name, n = base, 1
+    while name in existing:
+        n += 1
+        name = f"{base}-{n}"
+    return name
+
+
+def _store_object(backup_dir, blob, result):
+    digest = hashlib.sha256(blob).hexdigest()
+    path = _object_path(backup_dir, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, blob)
+        result['copied'] += 1
+        result['bytes_copied'] += len(blob)
+    else:
+        result['reused'] += 1
+    return digest
+
+
+def create_snapshot(storage, key, backup_dir, config_path=None, progress=None, should_stop=None):
+    # Returns {'snapshot': name, 'notes': n, 'copied': n, 'bytes_copied': n, 'reused': n}
+    os.makedirs(_objects_dir(backup_dir), exist_ok=True)
+    os.makedirs(_snapshots_dir(backup_dir), exist_ok=True)
+    if config_path and os.path.exists(config_path):
+        shutil.copyfile(config_path, os.path.join(backup_dir, os.path.basename(config_path)))
+
+    previous, previous_attachments = {}, {}
+    snapshots = list_snapshots(backup_dir)
+    if snapshots:
+        try:
+            baseline = load_snapshot(backup_dir, key, snapshots[-1])
+            previous, previous_attachments = baseline['notes'], baseline.get('attachments', {})
+        except Exception:
+            # Unreadable (or other password) baseline: hash everything again
+            previous, previous_attachments = {}, {}
+
+    listing = storage.list_notes()
+    notes = {}
+    result = {'snapshot': None, 'notes': len(listing), 'copied': 0, 'bytes_copied': 0, 'reused': 0}
+    for done, (note_id, stamp) in enumerate(sorted(listing.items()), 1):
+        if should_stop and should_stop():
+            return result
+        old = previous.get(note_id)
+        if old and tuple(old['stamp']) == tuple(stamp) and os.path.exists(_object_path(backup_dir, old['hash'])):
+            notes[note_id] = old
+            result['reused'] += 1
+        else:
+            try:
+                blob = storage.read(note_id)
+            except Exception:
+                # Deleted between listing and reading
+                continue
+            notes[note_id] = {'hash': _store_object(backup_dir, blob, result), 'stamp': list(stamp)}
+        if progress:
+            progress(done, len(listing))
+
+    attachments = {}
+    for name in storage.list_attachments():
+        if should_stop and should_stop():
+            return result
+        digest = previous_attachments.get(name)
+        if digest and os.path.exists(_object_path(backup_dir, digest)):
+            attachments[name] = digest
+        else:
+            attachments[name] = _store_object(backup_dir, storage.read_attachment(name), result)
+
+    name = _new_snapshot_name(backup_dir)
+    payload = json.dumps({'version': SNAPSHOT_VERSION, 'created': int(time.time() * 1000), 'notes': notes,
+                          'attachments': attachments}, separators=(',', ':'))
+    # The manifest goes last: a snapshot only exists once all of its objects do
+    _write_atomic(os.path.join(_snapshots_dir(backup_dir), name + SNAPSHOT_SUFFIX),
+                  encryption.encrypt_data(key, payload.encode('utf-8')))
+    result['snapshot'] = name
+    return result
+
+
+def _read_object(backup_dir, digest):
+    with open(_object_path(backup_dir, digest), 'rb') as f:
+        blob = f.read()
+    if hashlib.sha256(blob).hexdigest() != digest:
+        raise ValueError(f"Backup object {digest[:12]} is corrupted")
+    return blob
+
+
+def _restore_attachments(storage, backup_dir, attachments):
+    # Attachments never change, so only missing ones are written back
+    for name, digest in attachments.items():
+        if not storage.has_attachment(name):
+            storage.write_attachment(name, _read_object(backup_dir, digest))
+
+
+def _check_note(key, blob, snapshot, note_id):
+    # A note that doesn't decrypt under the current key (say, backed up before a password
+    # change) must never replace the live one
+    try:
+        unpack_note(key, blob)
+    except Exception:
+        raise ValueError(f"{note_id} in snapshot {snapshot} doesn't decrypt with this vault's password; "
+                         "nothing was restored") from None
+    return blob
+
+
+def restore_note(storage, key, backup_dir, snapshot, note_id):
+    data = load_snapshot(backup_dir, key, snapshot)
+    entry = data['notes'].get(note_id)
+    if entry is None:
+        raise KeyError(f"{note_id} is not in snapshot {snapshot}")
+    blob = _check_note(key, _read_object(backup_dir, entry['hash']), snapshot, note_id)
+    _restore_attachments(storage, backup_dir, data.get('attachments', {}))
+    storage.write(note_id, blob)
+
+
+def restore_vault(storage, key, backup_dir, snapshot, batch_size=500, progress=None):
+    # Makes the vault match the snapshot: changed notes are rewritten, notes created
+    # since are removed along with their history. Notes that are already identical aren't
+    # touched. Every note to be rewritten is decrypted first, and nothing is written unless
+    # all of them decrypt under `key`.
+    # Returns {'restored': n, 'unchanged': n, 'removed': n}
+    data = load_snapshot(backup_dir, key, snapshot)
+    notes = data['notes']
+    current = storage.list_notes()
+    result = {'restored': 0, 'unchanged': 0, 'removed': 0}
+    changed = []
+    for done, (note_id, entry) in enumerate(sorted(notes.items()), 1):
+        if note_id in current:
+            try:
+                if hashlib.sha256(storage.read(note_id)).hexdigest() == entry['hash']:
+                    result['unchanged'] += 1
+                    continue
+            except Exception:
+                pass
+        # Checked now, read again when written, so the whole snapshot isn't held in memory
+        _check_note(key, _read_object(backup_dir, entry['hash']), snapshot, note_id)
+        changed.append(note_id)
+        if progress:
+            progress(done, len(notes))
+    _restore_attachments(storage, backup_dir, data.get('attachments', {}))
+    for start in range(0, len(changed), batch_size):
+        storage.write_many([(note_id, _read_object(backup_dir, notes[note_id]['hash']))
+                            for note_id in changed[start:start + batch_size]])
+    result['restored'] = len(changed)
+    history = NoteHistory(storage)
+    for note_id in current:
+        if note_id not in notes:
+            storage.delete(note_id)
+            history.delete(note_id)
+            result['removed'] += 1
+    return result
+
+
+def prune_snapshots(backup_dir, key, keep):
+    # Keeps the newest `keep` snapshots and deletes objects none of them reference.
+    # Returns (snapshots removed, objects removed)
+    snapshots = list_snapshots(backup_dir)
+    if keep <= 0 or len(snapshots) <= keep:
+        return 0, 0
+    # Read every kept manifest before deleting anything, so a bad one aborts the prune
+    referenced = set()
+    for name in snapshots[-keep:]:
+        data = load_snapshot(backup_dir, key, name)
+        referenced.update(entry['hash'] for entry in data['notes'].values())
+        referenced.update(data.get('attachments', {}).values())
+    for name in snapshots[:-keep]:
+        os.remove(os.path.join(_snapshots_dir(backup_dir), name + SNAPSHOT_SUFFIX))
+    removed = 0
+    for dirpath, _dirnames, filenames in os.walk(_objects_dir(backup_dir)):
+        for fname in filenames:
+            if fname not in referenced:
+                os.remove(os.path.join(dirpath, fname))
+                removed += 1
+    return len(snapshots) - keep, removed
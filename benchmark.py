@@ -0,0 +1,268 @@
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import html
+import tempfile
+import tracemalloc
+try:
+    import resource
+except ImportError:
+    # Not on Windows; peak RSS is then left out of the memory table
+    resource = None
+
+import encryption
+from note_index import NoteIndex, NoteRecord
+from note_format import pack_note, unpack_note, read_header, pack_text_note, text_chunks, open_note
+from storage import BACKENDS, open_backend
+
+# Headless benchmarks. Run e.g.
+#   python benchmark.py storage --notes 10000 --size 2000
+#   python benchmark.py memory --counts 1000,4000,16000
+#   python benchmark.py large --sizes 1,10,50
+# --legacy writes notes in the old single-token format, for comparison.
+
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - start, result
+
+
+def _note_payload(i, size):
+    body = ''.join(random.choices('abcdefghijklmnopqrstuvwxyz ', k=size))
+    return f"# Note {i}\n\n<p>{body}</p>"
+
+
+def _note_blob(key, i, size, legacy=False):
+    if legacy:
+        return encryption.encrypt_data(key, _note_payload(i, size).encode('utf-8'))
+    return pack_note(key, _note_payload(i, size))
+
+
+def bench_storage(kind, key, blobs, workdir):
+    notes_dir = os.path.join(workdir, 'notes')
+    db_path = os.path.join(workdir, 'vault.db')
+    note_ids = [f"20240101_{i:08d}.enc" for i in range(len(blobs))]
+    results = {}
+
+    storage = open_backend(kind, notes_dir, db_path)
+    results['create (bulk)'], _ = _timed(storage.write_many, list(zip(note_ids, blobs)))
+    storage.close()
+
+    # Open + list: what startup pays before any decryption
+    def open_and_list():
+        backend = open_backend(kind, notes_dir, db_path)
+        return backend, backend.list_notes()
+    results['open + list'], (storage, listing) = _timed(open_and_list)
+
+    # Cold title scan: read every note's header, as load_notes does without an index
+    def cold_titles():
+        index = NoteIndex(storage)
+        for note_id, stamp in listing.items():
+            index.update(note_id, read_header(storage, key, note_id)['title'], stamp)
+        index.save(key)
+    results['titles (no index)'], _ = _timed(cold_titles)
+
+    def warm_titles():
+        index = NoteIndex(storage)
+        index.load(key)
+        return [index.lookup(note_id, stamp) for note_id, stamp in storage.list_notes().items()]
+    results['titles (index)'], _ = _timed(warm_titles)
+
+    sample = random.sample(note_ids, min(200, len(note_ids)))
+
+    def read_sample():
+        for note_id in sample:
+            unpack_note(key, storage.read(note_id))
+    elapsed, _ = _timed(read_sample)
+    results['open note (avg)'] = elapsed / len(sample)
+
+    text = unpack_note(key, blobs[0])
+
+    def save_sample():
+        for note_id in sample:
+            storage.write(note_id, pack_note(key, text))
+    elapsed, _ = _timed(save_sample)
+    results['save note (avg)'] = elapsed / len(sample)
+
+    storage.close()
+    return results
+
+
+def run_storage(args):
+    key = encryption.derive_key('benchmark', b'0' * 16)
+    print(f"Encrypting {args.notes} notes of ~{args.size} bytes...")
+    blobs = [_note_blob(key, i, args.size, args.legacy) for i in range(args.notes)]
+    kinds = BACKENDS if args.backend == 'all' else (args.backend,)
+    table = {}
+    for kind in kinds:
+        workdir = tempfile.mkdtemp(prefix=f"notes-bench-{kind}-")
+        try:
+            table[kind] = bench_storage(kind, key, blobs, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    rows = list(next(iter(table.values())))
+    print(f"{'':<20}" + ''.join(f"{kind:>14}" for kind in kinds))
+    for row in rows:
+        print(f"{row:<20}" + ''.join(f"{table[kind][row] * 1000:>12.2f}ms" for kind in kinds))
+
+
+def bench_memory(kind, key, count, size, workdir, legacy=False):
+    # Unlock without an index, under tracemalloc: every note's header is read once and
+    # only its list entry is kept. `retained` has to grow with the vault, the transient part
+    # (peak - retained) should stay at about one note however many there are.
+    notes_dir = os.path.join(workdir, 'notes')
+    db_path = os.path.join(workdir, 'vault.db')
+    storage = open_backend(kind, notes_dir, db_path)
+    # Written in batches of ~4 MB so that setting up doesn't inflate the RSS column
+    batch = max(1, 4_000_000 // max(1, size))
+    for start in range(0, count, batch):
+        storage.write_many([(f"20240101_{i:08d}.enc", _note_blob(key, i, size, legacy))
+                            for i in range(start, min(count, start + batch))])
+    storage.close()
+
+    tracemalloc.start()
+    storage = open_backend(kind, notes_dir, db_path)
+    baseline, _ = tracemalloc.get_traced_memory()
+    index = NoteIndex(storage)
+    notes = []
+    for note_id, stamp in storage.list_notes().items():
+        title = read_header(storage, key, note_id)['title']
+        index.update(note_id, title, stamp)
+        notes.append(NoteRecord(note_id, title))
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    storage.close()
+    return {'retained': current - baseline, 'transient': peak - current}
+
+
+def run_memory(args):
+    key = encryption.derive_key('benchmark', b'0' * 16)
+    counts = [int(count) for count in args.counts.split(',')]
+    print(f"{'notes':>8}{'retained':>14}{'per note':>12}{'transient':>14}{'peak RSS':>12}")
+    for count in counts:
+        workdir = tempfile.mkdtemp(prefix="notes-bench-memory-")
+        try:
+            row = bench_memory(args.backend, key, count, args.size, workdir, args.legacy)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        # ru_maxrss is in KB on Linux (bytes on macOS) and never goes down, so it only
+        # shows growth across rows
+        rss = f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:>10.1f}MB" if resource else f"{'-':>12}"
+        print(f"{count:>8}{row['retained'] / 1024:>12.1f}KB{row['retained'] / count:>11.0f}B"
+              f"{row['transient'] / 1024:>12.1f}KB{rss}")
+
+
+def _large_text(size):
+    # ~`size` bytes of plain text in lines of a few words, some with markup
+    words = [''.join(random.choices('abcdefghijklmnopqrstuvwxyz', k=random.randint(2, 9))) for _ in range(500)]
+    lines = [' '.join(random.choices(words, k=12)) for _ in range(1000)]
+    lines[::20] = [f"## {line}" for line in lines[::20]]
+    lines[5::20] = [f"**{line}**" for line in lines[5::20]]
+    text = []
+    total = 0
+    while total < size:
+        line = random.choice(lines)
+        text.append(line)
+        total += len(line) + 1
+    return '\n'.join(text)
+
+
+def bench_large(kind, key, text, rich, workdir):
+    # Open and save latency of one big note: the rich editor (HTML note, QTextEdit) against
+    # the large-document editor (text note read and written in chunks, QPlainTextEdit).
+    # Both include decryption/encryption and storage, as the app pays them.
+    from PyQt6.QtWidgets import QTextEdit
+    from large_notes import DEFAULT_POLICY as LARGE_NOTE_POLICY, fill_editor
+    from ui_main import LargeNoteEdit
+    storage = open_backend(kind, os.path.join(workdir, 'notes'), os.path.join(workdir, 'vault.db'))
+    note_id = "20240101_00000000.enc"
+    title = "Large note"
+    results = {}
+
+    if rich:
+        editor = QTextEdit()
+        body = ''.join(f"<p>{html.escape(line)}</p>" for line in text.split('\n'))
+        storage.write(note_id, pack_note(key, f"# {title}\n\n{body}"))
+
+        def load_rich():
+            editor.setHtml(unpack_note(key, storage.read(note_id)).split('\n\n', 1)[1])
+        results['rich load'], _ = _timed(load_rich)
+
+        def save_rich():
+            storage.write(note_id, pack_note(key, f"# {title}\n\n{editor.toHtml()}"))
+        results['rich save'], _ = _timed(save_rich)
+        editor.deleteLater()
+
+    editor = LargeNoteEdit()
+    storage.write_parts(note_id, pack_text_note(key, title, text_chunks(text)))
+
+    def load_large():
+        with storage.read_stream(note_id) as stream:
+            _header, chunks = open_note(key, stream)
+            next(chunks)
+            # As the app does it: highlighting goes on once the text is in, below the limit
+            editor.set_highlighting(False)
+            fill_editor(editor, chunks)
+            editor.set_highlighting(len(text) <= LARGE_NOTE_POLICY['highlight_max_kb'] * 1024)
+            if editor.highlighter:
+                # Otherwise deferred to the event loop, where the app pays for it all the same
+                editor.highlighter.rehighlight()
+    results['large load'], _ = _timed(load_large)
+
+    def save_large():
+        storage.write_parts(note_id, pack_text_note(key, title, text_chunks(editor.toPlainText())))
+    results['large save'], _ = _timed(save_large)
+    editor.deleteLater()
+    storage.close()
+    return results
+
+
+def run_large(args):
+    from PyQt6.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    key = encryption.derive_key('benchmark', b'0' * 16)
+    columns = ('rich load', 'rich save', 'large load', 'large save')
+    print(f"{'size':>8}" + ''.join(f"{column:>14}" for column in columns))
+    for size_mb in [float(size) for size in args.sizes.split(',')]:
+        text = _large_text(int(size_mb * 1048576))
+        workdir = tempfile.mkdtemp(prefix="notes-bench-large-")
+        try:
+            row = bench_large(args.backend, key, text, size_mb <= args.rich_max_mb, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        app.processEvents()
+        # The rich editor is skipped above --rich-max-mb; it takes minutes there
+        print(f"{size_mb:>6g}MB" + ''.join(f"{row[column]:>13.2f}s" if column in row else f"{'-':>14}"
+                                          for column in columns))
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Encrypted notepad benchmarks")
+    suites = parser.add_subparsers(dest='suite', required=True)
+    storage_cmd = suites.add_parser('storage', help="compare storage backends")
+    storage_cmd.add_argument('--notes', type=int, default=2000)
+    storage_cmd.add_argument('--size', type=int, default=2000, help="approximate note size in bytes")
+    storage_cmd.add_argument('--backend', choices=BACKENDS + ('all',), default='all')
+    storage_cmd.add_argument('--legacy', action='store_true', help="old single-token note files")
+    storage_cmd.set_defaults(run=run_storage)
+    memory_cmd = suites.add_parser('memory', help="memory held after unlocking vaults of growing size")
+    memory_cmd.add_argument('--counts', default='1000,4000,16000', help="comma-separated vault sizes")
+    memory_cmd.add_argument('--size', type=int, default=2000, help="approximate note size in bytes")
+    memory_cmd.add_argument('--backend', choices=BACKENDS, default='directory')
+    memory_cmd.add_argument('--legacy', action='store_true', help="old single-token note files")
+    memory_cmd.set_defaults(run=run_memory)
+    large_cmd = suites.add_parser('large', help="open/save latency of one big note, rich vs large-document editor")
+    large_cmd.add_argument('--sizes', default='1,10,50', help="comma-separated note sizes in MB")
+    large_cmd.add_argument('--rich-max-mb', type=float, default=10, help="largest size also run in the rich editor")
+    large_cmd.add_argument('--backend', choices=BACKENDS, default='directory')
+    large_cmd.set_defaults(run=run_large)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    args.run(args)
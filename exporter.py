@@ -0,0 +1,201 @@
+import io
+import os
+import html
+import time
+import struct
+import tarfile
+import zipfile
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+
+import encryption
+from attachments import AttachmentStore, inline_images
+from note_format import unpack_note_and_format, FORMAT_HTML, FORMAT_TEXT
+
+# Streaming export of the whole vault into one archive. Notes are decrypted, rendered
+# and written one at a time straight into the archive stream, so memory stays bounded
+# by the largest single note no matter how big the vault is. The archive can itself be
+# encrypted with a separate export password (see EncryptedExportWriter).
+
+EXPORT_FORMATS = {'txt': "Plain text", 'md': "Markdown", 'html': "HTML"}
+ARCHIVE_EXTENSIONS = ('.zip', '.tar.gz', '.tgz', '.tar')
+
+EXPORT_MAGIC = b'ENCNOTES-EXPORT1'
+EXPORT_ITERATIONS = 200_000
+CHUNK_SIZE = 64 * 1024
+
+
+def archive_kind(path):
+    lower = path.lower()
+    if lower.endswith('.zip'):
+        return 'zip'
+    if lower.endswith(('.tar.gz', '.tgz')):
+        return 'tar.gz'
+    if lower.endswith('.tar'):
+        return 'tar'
+    raise ValueError(f"Unsupported archive type: {path}")
+
+
+def split_note(decrypted):
+    # (title, html_body) from the stored '# title' + HTML format
+    lines = decrypted.splitlines()
+    if lines and lines[0].startswith('#'):
+        return lines[0][1:].strip(), '\n'.join(lines[1:]).lstrip('\n')
+    return "Untitled", decrypted
+
+
+def render_note(title, body, fmt, body_format=FORMAT_HTML):
+    if body_format == FORMAT_TEXT:
+        # Notes from the large-document editor are plain text already
+        if fmt == 'html':
+            return f"<pre>{html.escape(body)}</pre>"
+        if fmt == 'md':
+            return f"# {title}\n\n{body}"
+        return body
+    if fmt == 'html':
+        return body
+    from PyQt6.QtGui import QTextDocument
+    doc = QTextDocument()
+    doc.setHtml(body)
+    if fmt == 'md':
+        return f"# {title}\n\n{doc.toMarkdown()}"
+    return doc.toPlainText()
+
+
+def safe_name(title):
+    return ''.join(c for c in title if c.isalnum() or c in (' ', '_')).rstrip()
+
+
+def export_name(note_id, title, fmt):
+    stem = note_id[:-4] if note_id.endswith('.enc') else note_id
+    return f"{stem}_{safe_name(title)}.{fmt}"
+
+
+class EncryptedExportWriter(io.RawIOBase):
+    # Write-only stream that encrypts everything written to it with AES-GCM in 64 KiB
+    # chunks. Layout: magic | salt(16) | iterations(u32) | nonce prefix(8), then per
+    # chunk: length(u32) | ciphertext. The chunk index is part of the nonce and the last
+    # chunk is authenticated as such, so reordering or truncation is detected.
+    def __init__(self, raw, password):
+        super().__init__()
+        self._raw = raw
+        salt = os.urandom(16)
+        self._aead = AESGCM(encryption.derive_raw_key(password, salt, EXPORT_ITERATIONS))
+        self._prefix = os.urandom(8)
+        self._counter = 0
+        self._buffer = bytearray()
+        self._position = 0
+        raw.write(EXPORT_MAGIC + salt + struct.pack('>I', EXPORT_ITERATIONS) + self._prefix)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        # zipfile tracks offsets through tell() on unseekable streams
+        return self._position
+
+    def _emit(self, chunk, last):
+        nonce = self._prefix + struct.pack('>I', self._counter)
+        sealed = self._aead.encrypt(nonce, bytes(chunk), b'last' if last else b'')
+        self._raw.write(struct.pack('>I', len(sealed)) + sealed)
+        self._counter += 1
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) > CHUNK_SIZE:
+            self._emit(self._buffer[:CHUNK_SIZE], False)
+            del self._buffer[:CHUNK_SIZE]
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._emit(self._buffer, True)
+            self._buffer.clear()
+            self._raw.close()
+        super().close()
+
+
+def decrypt_export(src_path, dst_path, password):
+    with open(src_path, 'rb') as src, open(dst_path, 'wb') as dst:
+        header = src.read(len(EXPORT_MAGIC) + 28)
+        if not header.startswith(EXPORT_MAGIC):
+            raise ValueError("Not an encrypted notes export")
+        salt = header[16:32]
+        iterations = struct.unpack('>I', header[32:36])[0]
+        prefix = header[36:44]
+        aead = AESGCM(encryption.derive_raw_key(password, salt, iterations))
+        counter = 0
+        while True:
+            length_bytes = src.read(4)
+            if len(length_bytes) < 4:
+                raise ValueError("Export is truncated")
+            sealed = src.read(struct.unpack('>I', length_bytes)[0])
+            nonce = prefix + struct.pack('>I', counter)
+            try:
+                dst.write(aead.decrypt(nonce, sealed, b''))
+            except Exception:
+                # Not a middle chunk; it has to be the authenticated last one
+                dst.write(aead.decrypt(nonce, sealed, b'last'))
+                break
+            counter += 1
+
+
+class _ArchiveSink:
+    def __init__(self, stream, kind):
+        self.kind = kind
+        if kind == 'zip':
+            self.archive = zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED)
+        else:
+            # Stream mode ('w|'): tarfile never seeks back
+            self.archive = tarfile.open(fileobj=stream, mode='w|gz' if kind == 'tar.gz' else 'w|')
+
+    def add(self, name, data):
+        if self.kind == 'zip':
+            with self.archive.open(name, 'w', force_zip64=True) as member:
+                member.write(data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self.archive.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        self.archive.close()
+
+
+def export_archive(storage, key, notes, path, fmt='txt', password=None, progress=None, should_stop=None):
+    # `notes` is a list of (note_id, title). Returns {'exported': n, 'failed': [(note_id, error)], 'path': p}.
+    kind = archive_kind(path)
+    if password:
+        path += '.enc'
+    result = {'exported': 0, 'failed': [], 'path': path}
+    raw = open(path, 'wb')
+    stream = EncryptedExportWriter(raw, password) if password else raw
+    sink = _ArchiveSink(stream, kind)
+    used_names = set()
+    attachments = AttachmentStore(storage)
+    try:
+        for done, (note_id, title) in enumerate(notes, 1):
+            if should_stop and should_stop():
+                break
+            try:
+                decrypted, body_format = unpack_note_and_format(key, storage.read(note_id))
+                stored_title, body = split_note(decrypted)
+                if fmt == 'html' and body_format == FORMAT_HTML:
+                    # Exported pages carry their images inline, decrypted
+                    body = inline_images(body, lambda digest: attachments.get(key, digest))
+                name = export_name(note_id, stored_title or title, fmt)
+                if name in used_names:
+                    name = f"{done}_{name}"
+                used_names.add(name)
+                sink.add(name, render_note(stored_title or title, body, fmt, body_format).encode('utf-8'))
+                result['exported'] += 1
+            except Exception as e:
+                result['failed'].append((note_id, str(e)))
+            if progress:
+                progress(done, len(notes))
+    finally:
+        sink.close()
+        stream.close()
+    return result
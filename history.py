@@ -0,0 +1,166 @@
+import json
+import zlib
+import time
+import difflib
+import threading
+
+import encryption
+
+# Per-note revision history, kept in the storage backend's metadata as "history-<note id>".
+# The container lists revisions oldest first with their time and size in the clear; the
+# content of every revision is encrypted on its own, so browsing the list decrypts
+# nothing and viewing one revision only decrypts the chain back to its keyframe.
+#
+# Revisions are forward line diffs against the previous revision, with a full copy
+# (keyframe) every KEYFRAME_EVERY revisions to keep that chain short. Pruning drops the
+# oldest revisions and turns the new oldest one into a keyframe.
+
+HISTORY_VERSION = 1
+KEYFRAME_EVERY = 10
+DEFAULT_POLICY = {
+    'max_revisions': 50,
+    'max_age_days': 90,
+    'max_bytes': 1024 * 1024,
+    # Autosaves closer together than this share one revision; manual saves always get one
+    'min_interval_s': 300,
+}
+
+# Saves (UI thread) and background pruning both rewrite the container
+_lock = threading.Lock()
+
+
+def _meta_name(note_id):
+    stem = note_id[:-4] if note_id.endswith('.enc') else note_id
+    return f"history-{stem}"
+
+
+def _make_delta(old_lines, new_lines):
+    # Copy ranges from the previous revision plus inserted lines
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append(new_lines[j1:j2])
+    return ops
+
+
+def _apply_delta(old_lines, ops):
+    lines = []
+    for op in ops:
+        if len(op) == 2 and isinstance(op[0], int):
+            lines.extend(old_lines[op[0]:op[1]])
+        else:
+            lines.extend(op)
+    return lines
+
+
+def _seal(key, payload):
+    return encryption.encrypt_data(key, zlib.compress(json.dumps(payload).encode('utf-8'))).decode('ascii')
+
+
+def _open(key, data):
+    return json.loads(zlib.decompress(encryption.decrypt_data(key, data.encode('ascii'))).decode('utf-8'))
+
+
+class NoteHistory:
+    def __init__(self, storage, policy=None):
+        self.storage = storage
+        self.policy = dict(DEFAULT_POLICY, **(policy or {}))
+
+    def _load(self, note_id):
+        raw = self.storage.read_meta(_meta_name(note_id))
+        if not raw:
+            return []
+        try:
+            data = json.loads(raw.decode('utf-8'))
+        except Exception:
+            return []
+        if data.get('version') != HISTORY_VERSION:
+            return []
+        return data['revisions']
+
+    def _save(self, note_id, revisions):
+        if not revisions:
+            self.storage.delete_meta(_meta_name(note_id))
+            return
+        payload = json.dumps({'version': HISTORY_VERSION, 'revisions': revisions}, separators=(',', ':'))
+        self.storage.write_meta(_meta_name(note_id), payload.encode('utf-8'))
+
+    def revisions(self, note_id):
+        # [(index, time_ms, size)] oldest first; nothing is decrypted
+        return [(i, rev['time'], rev['size']) for i, rev in enumerate(self._load(note_id))]
+
+    def _text_at(self, key, revisions, index):
+        start = index
+        while 'full' not in revisions[start]:
+            start -= 1
+        lines = _open(key, revisions[start]['full'])
+        for rev in revisions[start + 1:index + 1]:
+            lines = _apply_delta(lines, _open(key, rev['delta']))
+        return '\n'.join(lines)
+
+    def text(self, key, note_id, index):
+        return self._text_at(key, self._load(note_id), index)
+
+    def lines(self, key, note_id):
+        # Every line any revision stored (keyframes and the lines deltas insert), without
+        # rebuilding the revisions themselves
+        for rev in self._load(note_id):
+            if 'full' in rev:
+                yield from _open(key, rev['full'])
+            else:
+                for op in _open(key, rev['delta']):
+                    if not (len(op) == 2 and isinstance(op[0], int)):
+                        yield from op
+
+    def record(self, key, note_id, text, manual=False, now_ms=None):
+        # Adds `text` (the note as it was before a save overwrote it); it may be a callable
+        # returning the text, only called when a revision is due. Returns True when a
+        # revision was written.
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        with _lock:
+            revisions = self._load(note_id)
+            if revisions and not manual and now_ms - revisions[-1]['time'] < self.policy['min_interval_s'] * 1000:
+                return False
+            if callable(text):
+                text = text()
+            lines = text.split('\n')
+            entry = {'time': now_ms, 'size': len(text.encode('utf-8'))}
+            since_keyframe = next((n for n, rev in enumerate(reversed(revisions)) if 'full' in rev), None)
+            if since_keyframe is None or since_keyframe + 1 >= KEYFRAME_EVERY:
+                entry['full'] = _seal(key, lines)
+            else:
+                previous = self._text_at(key, revisions, len(revisions) - 1).split('\n')
+                if previous == lines:
+                    return False
+                entry['delta'] = _seal(key, _make_delta(previous, lines))
+            revisions.append(entry)
+            self._save(note_id, revisions)
+            return True
+
+    def prune(self, key, note_id, now_ms=None):
+        # Applies the retention policy; returns the number of revisions dropped
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        with _lock:
+            revisions = self._load(note_id)
+            drop = max(0, len(revisions) - self.policy['max_revisions'])
+            cutoff = now_ms - self.policy['max_age_days'] * 86_400_000
+            while drop < len(revisions) and revisions[drop]['time'] < cutoff:
+                drop += 1
+            stored = [len(rev.get('full') or rev['delta']) for rev in revisions]
+            while drop < len(revisions) - 1 and sum(stored[drop:]) > self.policy['max_bytes']:
+                drop += 1
+            if not drop:
+                return 0
+            kept = revisions[drop:]
+            if kept and 'full' not in kept[0]:
+                lines = self._text_at(key, revisions, drop).split('\n')
+                kept[0] = {'time': kept[0]['time'], 'size': kept[0]['size'], 'full': _seal(key, lines)}
+            self._save(note_id, kept)
+            return drop
+
+    def delete(self, note_id):
+        with _lock:
+            self.storage.delete_meta(_meta_name(note_id))
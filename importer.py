@@ -0,0 +1,179 @@
+import os
+import re
+import json
+import html
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import encryption
+from note_ids import new_note_filename
+from note_format import pack_note
+
+# Bulk import of plaintext / Markdown / HTML files. Conversion and encryption run in a
+# process pool; the resulting blobs are written in batches and the title index is
+# updated once at the end. A small encrypted manifest (storage metadata "import")
+# remembers which source files were already imported, so an interrupted import can
+# simply be run again.
+
+IMPORT_EXTENSIONS = ('.txt', '.md', '.markdown', '.html', '.htm')
+MANIFEST_NAME = 'import'
+
+
+def find_sources(root):
+    sources = []
+    for dirpath, _dirnames, filenames in os.walk(root):
+        for fname in filenames:
+            if fname.lower().endswith(IMPORT_EXTENSIONS):
+                sources.append(os.path.abspath(os.path.join(dirpath, fname)))
+    sources.sort()
+    return sources
+
+
+def _inline_markdown(text):
+    text = html.escape(text, quote=False)
+    text = re.sub(r'\*\*(.+?)\*\*|__(.+?)__', lambda m: f"<b>{m.group(1) or m.group(2)}</b>", text)
+    text = re.sub(r'(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?!\w)|(?<!\w)_(?!\s)(.+?)(?<!\s)_(?!\w)',
+                  lambda m: f"<i>{m.group(1) or m.group(2)}</i>", text)
+    text = re.sub(r'`([^`]+)`', r'<code>\1</code>', text)
+    return text
+
+
+def markdown_to_html(text):
+    # Deliberately small: headings, emphasis, inline code, lists and paragraphs, which is
+    # all the editor can represent anyway
+    parts = []
+    for line in text.splitlines():
+        stripped = line.strip()
+        heading = re.match(r'^(#{1,6})\s+(.*)$', stripped)
+        item = re.match(r'^[-*+]\s+(.*)$', stripped)
+        if heading:
+            level = min(len(heading.group(1)), 3)
+            parts.append(f"<h{level}>{_inline_markdown(heading.group(2))}</h{level}>")
+        elif item:
+            parts.append(f"<ul><li>{_inline_markdown(item.group(1))}</li></ul>")
+        elif stripped:
+            parts.append(f"<p>{_inline_markdown(stripped)}</p>")
+        else:
+            parts.append("<p></p>")
+    return ''.join(parts) or "<p></p>"
+
+
+def text_to_html(text):
+    return ''.join(f"<p>{html.escape(line, quote=False)}</p>" for line in text.splitlines()) or "<p></p>"
+
+
+def convert_file(path):
+    # Returns (title, html_body) for a source file
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        text = f.read()
+    stem = os.path.splitext(os.path.basename(path))[0]
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.html', '.htm'):
+        match = re.search(r'<title[^>]*>(.*?)</title>', text, re.IGNORECASE | re.DOTALL) \
+            or re.search(r'<h1[^>]*>(.*?)</h1>', text, re.IGNORECASE | re.DOTALL)
+        title = html.unescape(re.sub(r'<[^>]+>', '', match.group(1))).strip() if match else ''
+        return title or stem, text
+    if ext in ('.md', '.markdown'):
+        lines = text.splitlines()
+        if lines and re.match(r'^#\s+', lines[0]):
+            return lines[0].lstrip('#').strip() or stem, markdown_to_html('\n'.join(lines[1:]).lstrip('\n'))
+        return stem, markdown_to_html(text)
+    return stem, text_to_html(text)
+
+
+_worker_key = None
+
+
+def _init_worker(key):
+    global _worker_key
+    _worker_key = key
+
+
+def _convert_and_encrypt(path):
+    try:
+        title, body = convert_file(path)
+        # Titles are stored on the first line, so keep them to one line
+        title = ' '.join(title.split())
+        blob = pack_note(_worker_key, f"# {title}\n\n{body}")
+        return path, title, blob, None
+    except Exception as e:
+        return path, None, None, str(e)
+
+
+def _source_stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def load_manifest(storage, key):
+    try:
+        return json.loads(encryption.decrypt_data(key, storage.read_meta(MANIFEST_NAME)).decode('utf-8'))
+    except Exception:
+        return {}
+
+
+def save_manifest(storage, key, manifest):
+    storage.write_meta(MANIFEST_NAME, encryption.encrypt_data(key, json.dumps(manifest).encode('utf-8')))
+
+
+def import_folder(storage, key, root, index=None, workers=None, batch_size=200, progress=None, should_stop=None):
+    # Returns {'imported': [(note_id, title, stamp, modified_ms)], 'skipped': n, 'failed': [(path, error)]}.
+    # When `index` is given it is updated (once, at the end) and saved.
+    manifest = load_manifest(storage, key)
+    sources = find_sources(root)
+    pending = [p for p in sources if manifest.get(p, {}).get('stamp') != _source_stamp(p)]
+    result = {'imported': [], 'skipped': len(sources) - len(pending), 'failed': []}
+    total = len(pending)
+    if progress:
+        progress(0, total)
+    if not pending:
+        return result
+    batch = []
+    batch_sources = []
+    taken = set()
+
+    def exists(name):
+        return name in taken or storage.stamp(name) is not None
+
+    def flush():
+        storage.write_many(batch)
+        now = int(time.time() * 1000)
+        for (note_id, _blob), (path, title) in zip(batch, batch_sources):
+            stamp = storage.stamp(note_id)
+            result['imported'].append((note_id, title, stamp, now))
+            manifest[path] = {'stamp': _source_stamp(path), 'note': note_id}
+        # Persist progress with every batch so a rerun resumes from here
+        save_manifest(storage, key, manifest)
+        batch.clear()
+        batch_sources.clear()
+
+    # Spawned (not forked) workers: the GUI runs imports from a thread of a Qt process
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(key,)) as pool:
+        done = 0
+        for path, title, blob, error in pool.map(_convert_and_encrypt, pending, chunksize=16):
+            done += 1
+            if error is not None:
+                result['failed'].append((path, error))
+            else:
+                # Re-importing a changed source replaces the note it created last time
+                note_id = manifest.get(path, {}).get('note') or new_note_filename(exists)
+                taken.add(note_id)
+                batch.append((note_id, blob))
+                batch_sources.append((path, title))
+                if len(batch) >= batch_size:
+                    flush()
+            if progress:
+                progress(done, total)
+            if should_stop and should_stop():
+                pool.shutdown(cancel_futures=True)
+                break
+        if batch:
+            flush()
+    if index is not None:
+        for note_id, title, stamp, modified in result['imported']:
+            index.update(note_id, title, stamp, modified)
+        index.save(key)
+    return result
@@ -0,0 +1,238 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import binascii
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from cryptography.fernet import Fernet
+
+from storage import open_backend
+from note_format import split_tokens, text_frames, body_format, unpack_note, FORMAT_TEXT
+from history import NoteHistory
+from attachments import references
+
+# Vault integrity check. Every note is a Fernet token (version | timestamp | IV |
+# ciphertext | HMAC-SHA256, base64url), or a header token and a body token or run of
+# chunk tokens (see note_format.py); workers check the structure and the HMAC of each themselves, so a bad file can be told apart from a good one encrypted with another
+# key, and only then decrypt. Each worker opens its own backend and reads the notes it
+# checks, so reading is spread across processes as well.
+
+OK = 'ok'
+TRUNCATED = 'truncated'       # too short / cut off mid-block
+CORRUPT = 'corrupt'           # well formed, but the HMAC doesn't match
+FOREIGN = 'foreign'           # not a note token at all
+UNDECRYPTABLE = 'undecryptable'  # authentic, but the plaintext is unusable
+UNREADABLE = 'unreadable'     # storage error
+PROBLEMS = (TRUNCATED, CORRUPT, FOREIGN, UNDECRYPTABLE, UNREADABLE)
+# A read error may be transient, so only notes whose bytes were seen to be bad are moved
+QUARANTINABLE = (TRUNCATED, CORRUPT, FOREIGN, UNDECRYPTABLE)
+
+QUARANTINE_DIR = 'quarantine'
+
+_FERNET_VERSION = 0x80
+_HEADER = 1 + 8 + 16
+_MAC = 32
+
+_worker_state = {}
+
+
+def _init_worker(key, storage_kind, notes_dir, db_path):
+    _worker_state['key'] = key
+    _worker_state['signing_key'] = base64.urlsafe_b64decode(key)[:16]
+    _worker_state['storage'] = open_backend(storage_kind, notes_dir, db_path)
+
+
+def check_token(token, key, signing_key, texts=None):
+    # Returns (status, detail); the plaintext of a good token is added to `texts`, if given
+    try:
+        raw = base64.urlsafe_b64decode(token)
+    except (binascii.Error, ValueError):
+        stripped = token.rstrip(b'=')
+        if not stripped or not all(c in b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_'
+                                   for c in stripped):
+            return FOREIGN, "not a base64 token"
+        # Valid characters but an impossible length. A token cut off mid-character still
+        # starts with the token version; anything else is damage, not a short write
+        head = base64.urlsafe_b64decode(stripped[:len(stripped) // 4 * 4])
+        if head[:1] == bytes([_FERNET_VERSION]):
+            return TRUNCATED, "base64 cut short"
+        return CORRUPT, "damaged base64"
+    if not raw or raw[0] != _FERNET_VERSION:
+        return FOREIGN, "unknown token version"
+    body = len(raw) - _HEADER - _MAC
+    if body < 16 or body % 16:
+        return TRUNCATED, f"{len(raw)} bytes is not a whole number of blocks"
+    expected = hmac.new(signing_key, raw[:-_MAC], hashlib.sha256).digest()
+    if not hmac.compare_digest(expected, raw[-_MAC:]):
+        return CORRUPT, "HMAC mismatch (damaged, or encrypted with another password)"
+    try:
+        text = Fernet(key).decrypt(token).decode('utf-8')
+    except Exception as e:
+        return UNDECRYPTABLE, type(e).__name__
+    if texts is not None:
+        texts.append(text)
+    return OK, ""
+
+
+def check_note(blob, key, signing_key, texts=None):
+    # `texts` collects the text of an HTML body (see check_token); text bodies have no images
+    try:
+        header, body = split_tokens(blob)
+    except ValueError as e:
+        return TRUNCATED, str(e)
+    if header is not None:
+        status, detail = check_token(header, key, signing_key)
+        if status != OK:
+            return status, f"header: {detail}"
+        try:
+            parsed = json.loads(Fernet(key).decrypt(header))
+            text = body_format(parsed) == FORMAT_TEXT
+        except Exception as e:
+            return UNDECRYPTABLE, f"header: {type(e).__name__}"
+        if text:
+            return _check_text_body(body, parsed.get('chunks'), key, signing_key)
+    return check_token(body, key, signing_key, texts)
+
+
+def _check_text_body(body, chunks, key, signing_key):
+    try:
+        frames = text_frames(body)
+    except ValueError as e:
+        return TRUNCATED, str(e)
+    if len(frames) != chunks:
+        return TRUNCATED, f"{len(frames)} of {chunks} chunks"
+    for n, token in enumerate(frames):
+        status, detail = check_token(token, key, signing_key)
+        if status != OK:
+            return status, f"chunk {n}: {detail}"
+    return OK, ""
+
+
+def _check_note(note_id):
+    try:
+        blob = _worker_state['storage'].read(note_id)
+    except Exception as e:
+        return note_id, UNREADABLE, 0, str(e)
+    texts = []
+    status, detail = check_note(blob, _worker_state['key'], _worker_state['signing_key'], texts)
+    used = set()
+    if status == OK:
+        # Attachments the note or any of its revisions point at
+        try:
+            for text in texts:
+                used |= references(text)
+            history = NoteHistory(_worker_state['storage'])
+            used |= references('\n'.join(history.lines(_worker_state['key'], note_id)))
+        except Exception:
+            used = None
+    return note_id, status, len(blob), detail, used
+
+
+def scan_vault(storage, key, storage_kind, notes_dir, db_path, index=None, workers=None,
+               progress=None, should_stop=None):
+    # Returns {'checked', 'bytes', 'seconds', 'problems': [(note_id, status, detail)],
+    #          'orphans': [index entries without a note], plus what sweep_attachments needs:
+    #          'stamps' and 'attachments' as listed before the scan, and 'references' (None
+    #          if they aren't all known)}
+    stamps = storage.list_notes()
+    note_ids = sorted(stamps)
+    result = {'checked': 0, 'bytes': 0, 'seconds': 0.0, 'problems': [], 'orphans': [],
+              'stamps': stamps, 'attachments': storage.list_attachments(), 'references': set()}
+    if index is not None:
+        existing = set(note_ids)
+        result['orphans'] = sorted(note_id for note_id in index.entries if note_id not in existing)
+    total = len(note_ids)
+    if progress:
+        progress(0, total)
+    start = time.perf_counter()
+    if note_ids:
+        # Spawned (not forked) workers: the GUI runs this from a thread of a Qt process
+        context = multiprocessing.get_context('spawn')
+        initargs = (key, storage_kind, os.path.abspath(notes_dir), os.path.abspath(db_path))
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=initargs) as pool:
+            for note_id, status, size, detail, used in pool.map(_check_note, note_ids, chunksize=32):
+                result['checked'] += 1
+                result['bytes'] += size
+                if status != OK:
+                    result['problems'].append((note_id, status, detail))
+                if used is None or result['references'] is None:
+                    result['references'] = None
+                else:
+                    result['references'] |= used
+                if progress:
+                    progress(result['checked'], total)
+                if should_stop and should_stop():
+                    pool.shutdown(cancel_futures=True)
+                    break
+    result['seconds'] = time.perf_counter() - start
+    if result['problems'] or result['checked'] < total:
+        # A note that couldn't be checked may well reference images, so nothing is swept
+        result['references'] = None
+    return result
+
+
+def sweep_attachments(storage, key, result, in_use=()):
+    # Deletes attachments that existed when the scan in `result` started and that no note
+    # or revision references. Notes saved since the scan are read again; `in_use` adds
+    # references that aren't saved anywhere yet (the open editor). Returns the number of
+    # attachments removed.
+    if result.get('references') is None:
+        return 0
+    used = set(result['references']) | set(in_use)
+    history = NoteHistory(storage)
+    for note_id, stamp in storage.list_notes().items():
+        if result['stamps'].get(note_id) != stamp:
+            used |= references(unpack_note(key, storage.read(note_id)))
+            used |= references('\n'.join(history.lines(key, note_id)))
+    unused = [name for name in result['attachments'] if name not in used]
+    for name in unused:
+        storage.delete_attachment(name)
+    return len(unused)
+
+
+def throughput(result):
+    seconds = max(result['seconds'], 1e-9)
+    return result['checked'] / seconds, result['bytes'] / seconds / (1024 * 1024)
+
+
+def format_report(result):
+    notes_per_s, mb_per_s = throughput(result)
+    lines = [f"Checked {result['checked']} notes ({result['bytes'] / (1024 * 1024):.1f} MB) in "
+             f"{result['seconds']:.2f}s: {notes_per_s:.0f} notes/s, {mb_per_s:.1f} MB/s."]
+    if not result['problems'] and not result['orphans']:
+        lines.append("No problems found.")
+    for note_id, status, detail in result['problems']:
+        lines.append(f"{status}: {note_id} ({detail})" if detail else f"{status}: {note_id}")
+    if result['orphans']:
+        lines.append(f"{len(result['orphans'])} index entries point at missing notes.")
+    return '\n'.join(lines)
+
+
+def quarantine(storage, note_ids, quarantine_dir=QUARANTINE_DIR, index=None):
+    # Moves bad notes out of the vault into quarantine_dir, bytes kept as-is. A note is
+    # only deleted once its copy is on disk; notes that can't be read or copied stay in
+    # the vault. Returns (moved note ids, [(note_id, error)] for those left in place).
+    os.makedirs(quarantine_dir, exist_ok=True)
+    moved = []
+    failed = []
+    for note_id in note_ids:
+        try:
+            data = storage.read(note_id)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            with open(os.path.join(quarantine_dir, f"{note_id}.{stamp}"), 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            storage.delete(note_id)
+        except Exception as e:
+            failed.append((note_id, str(e)))
+            continue
+        if index is not None:
+            index.remove(note_id)
+        moved.append(note_id)
+    return moved, failed
@@ -0,0 +1,77 @@
+import re
+
+from PyQt6.QtGui import QSyntaxHighlighter, QTextCharFormat, QTextCursor, QColor, QFont
+
+# Large-document mode. QTextEdit with rich HTML gets slow with multi-megabyte notes
+# (setHtml/toHtml, whole-document format merges), so big notes are edited as plain text
+# in a QPlainTextEdit instead, with light Markdown-style highlighting, and stored in the
+# chunked text format of note_format.py: loading decrypts and inserts one chunk at a
+# time, saving encrypts the editor text chunk by chunk straight into the note file.
+#
+# Notes already stored as text always open this way. Rich notes above the threshold are
+# offered the switch when opened; formatting and images don't survive it, so it is never
+# done silently.
+
+DEFAULT_POLICY = {
+    # Rich notes larger than this (in stored bytes) are offered the large-document editor
+    'threshold_kb': 1024,
+    # Highlighting runs over every line once when a note opens; above this the text is
+    # shown unhighlighted
+    'highlight_max_kb': 2048,
+}
+
+
+def is_large(size, policy):
+    return size is not None and size > policy['threshold_kb'] * 1024
+
+
+def fill_editor(editor, chunks, progress=None):
+    # Replaces the text of a QPlainTextEdit with the pieces from `chunks` as they come,
+    # without undo history. progress(chars so far) is called after each piece.
+    document = editor.document()
+    document.setUndoRedoEnabled(False)
+    try:
+        editor.clear()
+        cursor = QTextCursor(document)
+        for chunk in chunks:
+            cursor.insertText(chunk)
+            if progress:
+                progress(document.characterCount())
+    finally:
+        # Also starts a fresh undo stack
+        document.setUndoRedoEnabled(True)
+    document.setModified(False)
+
+
+def _format(color=None, bold=False, italic=False, underline=False, monospace=False):
+    fmt = QTextCharFormat()
+    if color:
+        fmt.setForeground(QColor(color))
+    if bold:
+        fmt.setFontWeight(QFont.Weight.Bold)
+    if italic:
+        fmt.setFontItalic(True)
+    if underline:
+        fmt.setFontUnderline(True)
+    if monospace:
+        fmt.setFontFamilies(['Consolas', 'Menlo', 'DejaVu Sans Mono', 'monospace'])
+    return fmt
+
+
+class MarkupHighlighter(QSyntaxHighlighter):
+    # Headings, **bold**, *italic*/_italic_, `code` and links; line by line, no state
+    # carried between lines, so an edit only ever re-highlights the lines it touched
+    RULES = (
+        (re.compile(r'^#{1,6}\s.*$'), _format('#aad8ff', bold=True)),
+        (re.compile(r'\*\*[^*\n]+\*\*'), _format(bold=True)),
+        (re.compile(r'(?<![*\w])\*[^*\s][^*\n]*\*(?!\*)|(?<!\w)_[^_\s][^_\n]*_(?!\w)'), _format(italic=True)),
+        (re.compile(r'`[^`\n]+`'), _format('#ffd479', monospace=True)),
+        (re.compile(r'https?://\S+'), _format('#66b3ff', underline=True)),
+    )
+
+    def highlightBlock(self, text):
+        if not text:
+            return
+        for pattern, fmt in self.RULES:
+            for match in pattern.finditer(text):
+                self.setFormat(match.start(), match.end() - match.start(), fmt)
@@ -1,179 +1,750 @@
+import io
 import sys
 import os
-import json
-import base64
-import datetime
-import random
-import string
-
-from PyQt6.QtWidgets import (
-    QApplication, QDialog, QHBoxLayout, QPushButton
-)
-from PyQt6.QtWidgets import QLineEdit
-from PyQt6.QtCore import QTimer
-
-from ui_main import MainWindowUI, CustomDialog, CustomMessageDialog
+import argparse
+import time
+import hashlib
+import getpass
+import atexit
+
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QTimer, QThread, QEventLoop, pyqtSignal
+
+from ui_main import MainWindowUI, DialogManager, HistoryDialog
+from watcher import NotesWatcher
+from note_index import NoteIndex, NoteRecord, SORT_ORDERS
+from note_ids import new_note_filename, created_ms
+from note_format import (pack_note, unpack_note, unpack_note_and_format, read_header, note_title, upgrade_notes,
+                         open_note, pack_text_note, text_chunks, body_format, FORMAT_TEXT)
+from storage import BACKENDS, open_backend, migrate, note_write_lock
+from importer import import_folder
+from exporter import EXPORT_FORMATS, export_archive, decrypt_export
+from history import NoteHistory
+from attachments import AttachmentStore, externalize_images, references
+from integrity import scan_vault, format_report, quarantine, sweep_attachments, QUARANTINE_DIR, QUARANTINABLE
+from backup import create_snapshot, list_snapshots, load_snapshot, restore_note, restore_vault, prune_snapshots
+from vault_lock import VaultLock, HEARTBEAT_INTERVAL
+from settings import Settings
 import encryption
+import verification
+import metrics
+from autosave import AutosaveScheduler
+from autolock import IdleMonitor
+from large_notes import DEFAULT_POLICY as LARGE_NOTE_POLICY, is_large, fill_editor
+from profiling import Profiler, ENV_VAR as PROFILE_ENV_VAR
 
 NOTES_DIR = "notes"
 CONFIG_FILE = "config.json"
+VAULT_DB = "vault.db"
+LOCK_FILE = "vault.lock"
+# Failed-login backoff; kept out of config.json, which gets copied into backups
+LOGIN_STATE_FILE = "login_state.json"
+
+# One per process: started by --profile / NOTES_PROFILE, or toggled with Ctrl+Shift+P
+profiler = Profiler()
+
+class FunctionTask(QThread):
+    # Runs fn() off the UI thread, for work that needs no storage (e.g. key derivation)
+    def __init__(self, fn):
+        super().__init__()
+        self.fn = fn
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.fn()
+        except Exception as e:
+            self.error = str(e)
+
+class BackgroundTask(QThread):
+    # Runs job(storage, progress, should_stop) off the UI thread; used for imports and exports
+    progress = pyqtSignal(int, int)
 
-def random_string(length=6):
-    return ''.join(random.choices(string.ascii_lowercase + string.digits, k=length))
+    def __init__(self, storage_kind, job):
+        super().__init__()
+        self.storage_kind = storage_kind
+        self.job = job
+        self.result = None
+        self.error = None
+
+    def run(self):
+        # Own backend instance: SQLite connections can't be shared across threads
+        storage = open_backend(self.storage_kind, NOTES_DIR, VAULT_DB)
+        try:
+            self.result = self.job(storage, self.progress.emit, self.isInterruptionRequested)
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            storage.close()
 
 class EncryptedNotesApp:
     def __init__(self):
         self.app = QApplication(sys.argv)
-        self.window = MainWindowUI()
+        self.config = load_settings()
+        self.window = MainWindowUI(self.config.get('window'))
+        self.dialogs = DialogManager(self.window)
+        # A bytearray, so locking can overwrite it (see lock_vault)
         self.key = None
         self.password_verified = False
-        os.makedirs(NOTES_DIR, exist_ok=True)
-        self.config = encryption.load_config(CONFIG_FILE)
-        self.auto_save_timer = QTimer()
-        self.auto_save_timer.setInterval(3000)  # 3 seconds
-        self.auto_save_timer.setSingleShot(True)
-        self.last_saved_content = None
+        self.locked = False
+        self.lock_state = None
+        self.storage_kind = self.config.get('storage', 'directory')
+        self.storage = open_backend(self.storage_kind, NOTES_DIR, VAULT_DB)
+        self.import_thread = None
+        self.export_thread = None
+        self.backup_thread = None
+        self.check_thread = None
+        self.upgrade_thread = None
+        self.autosave = AutosaveScheduler(self.config.get('autosave'))
+        self.idle_monitor = IdleMonitor(self.config.get('autolock'))
+        # Hash of the editor HTML as last loaded/saved; the text itself is on disk
+        self.last_saved_hash = None
+        self.current_disk_hash = None
+        self.watcher = NotesWatcher(self.storage)
+        self.index = NoteIndex(self.storage)
+        self.sort_order = 'modified'
+        self.index_flush_timer = QTimer()
+        self.index_flush_timer.setInterval(2000)
+        self.index_flush_timer.setSingleShot(True)
+        self.index_flush_timer.timeout.connect(self.flush_index)
+        self.history = NoteHistory(self.storage, self.config.get('history'))
+        self.large_policy = dict(LARGE_NOTE_POLICY, **(self.config.get('large_notes') or {}))
+        # Large rich notes the user chose to keep in the rich editor this session
+        self.keep_rich = set()
+        self.history_pending = set()
+        self.attachments = AttachmentStore(self.storage)
+        self.window.text_edit.attachment_saver = lambda data: self.attachments.put(self.key, data)
+        self.window.text_edit.attachment_loader = lambda digest: self.attachments.get(self.key, digest)
+        self.history_thread = None
+        self.history_prune_timer = QTimer()
+        self.history_prune_timer.setInterval(60_000)
+        self.history_prune_timer.setSingleShot(True)
+        self.history_prune_timer.timeout.connect(self.prune_history)
+        # A lock asked for while a background task runs is retried until it can happen
+        self.lock_retry_timer = QTimer()
+        self.lock_retry_timer.setInterval(500)
+        self.lock_retry_timer.setSingleShot(True)
+        self.lock_retry_timer.timeout.connect(lambda: self.lock_vault(requested=True))
+        # Only one instance may write to the vault; others open it read-only
+        self.vault_lock = VaultLock(LOCK_FILE)
+        self.read_only = False
+        self.lock_timer = QTimer()
+        self.lock_timer.setInterval(HEARTBEAT_INTERVAL * 1000)
+        self.lock_timer.timeout.connect(self.check_vault_lock)
+        self.prefetched = {}
+        self.login_throttle = verification.LoginThrottle(LOGIN_STATE_FILE)
 
     def run(self):
-        if not self.config:
+        self.read_only = not self.vault_lock.acquire()
+        if self.config.damaged:
+            # Setting a new password here would orphan every existing note
+            self.dialogs.message("Settings Unreadable", f"{CONFIG_FILE} could not be read: "
+                                 f"{'; '.join(self.config.problems)}. Fix or restore it (backups keep a copy) "
+                                 "and start again.")
+            self.vault_lock.release()
+            return
+        if not self.config.configured:
+            if self.read_only:
+                self.dialogs.message("Vault In Use", "Another instance is setting up this vault. Try again once it is done.")
+                return
             # First time setup: ask to set password
             if not self.set_password_dialog():
+                self.vault_lock.release()
                 return
+            self.prepare_unlock()
         else:
-            # Existing user: ask password to unlock
-            if not self.login_dialog():
+            # Existing user: ask password to unlock; the vault is read and the window set
+            # up while the key is derived
+            if not self.login_dialog(work=self.prepare_unlock):
+                self.vault_lock.release()
                 return
 
-        self.load_notes()
+        self.index.load(self.key, self.prefetched.pop('index', None))
+        self.load_notes(self.prefetched.pop('snapshot', None))
         self.disable_text_edit()  # Ensure text area is disabled until a note is selected
-        self.setup_connections()
+        self.reopen_last_note()
+        self.lock_timer.start()
+        self.app.aboutToQuit.connect(self.shutdown)
         self.window.show()
-        self.auto_save_timer.timeout.connect(self.auto_save)
+        self.autosave.due.connect(self.auto_save)
+        self.app.installEventFilter(self.idle_monitor)
+        self.idle_monitor.idle.connect(self.lock_vault)
+        self.idle_monitor.start()
+        self.upgrade_note_files()
         sys.exit(self.app.exec())
 
+    def shutdown(self):
+        self.flush_autosave()
+        self.save_ui_state()
+        for thread in (self.import_thread, self.export_thread, self.backup_thread, self.history_thread,
+                       self.check_thread, self.upgrade_thread):
+            if thread:
+                thread.requestInterruption()
+                thread.wait()
+        if self.import_thread:
+            # Once, after every thread has stopped: an interrupted import still indexes
+            # the notes it got in
+            self.on_import_finished()
+        self.flush_index()
+        self.storage.close()
+        self.vault_lock.release()
+
+    def save_ui_state(self):
+        # A read-only instance leaves config.json to the one that owns the vault
+        if self.read_only:
+            return
+        self.config['window'] = self.window.save_state()
+        if self.locked and self.lock_state:
+            current = self.lock_state[0]
+        else:
+            current = getattr(self, 'current_filename', None)
+        if current:
+            self.config['last_note'] = current
+        else:
+            self.config.pop('last_note', None)
+        try:
+            self.config.save()
+        except OSError:
+            pass
+
+    def apply_read_only(self):
+        for button in (self.window.new_file_button, self.window.save_button, self.window.delete_button,
+                       self.window.import_button):
+            button.setEnabled(not self.read_only)
+        if hasattr(self, 'current_filename'):
+            self.window.editor.setReadOnly(self.read_only)
+        if self.read_only:
+            owner = self.vault_lock.read_owner() or {}
+            self.window.show_status(f"Read-only: vault is open in another instance (pid {owner.get('pid', '?')}).", 0)
+        else:
+            self.window.show_status("")
+
+    def check_vault_lock(self):
+        if self.read_only:
+            # Promote to writer once the primary instance has gone away
+            if self.vault_lock.acquire():
+                self.read_only = False
+                self.apply_read_only()
+                self.dialogs.notify("Vault lock acquired; editing enabled.")
+            return
+        self.vault_lock.heartbeat()
+        if not self.vault_lock.held:
+            self.autosave.cancel()
+            self.read_only = True
+            self.apply_read_only()
+
+    def schedule_index_flush(self):
+        if self.index.dirty and not self.read_only:
+            self.index_flush_timer.start()
+
+    def flush_index(self):
+        self.index_flush_timer.stop()
+        if self.index.dirty and not self.read_only and self.key:
+            try:
+                self.index.save(self.key)
+            except Exception:
+                pass
+
+    def prepare_unlock(self):
+        # Everything startup needs that doesn't need the key
+        try:
+            self.prefetched['index'] = self.storage.read_meta('index')
+        except Exception:
+            self.prefetched['index'] = None
+        self.prefetched['snapshot'] = self.watcher.reset()
+        last_note = self.config.get('last_note')
+        if last_note in self.prefetched['snapshot']:
+            try:
+                self.prefetched['last_note'] = (last_note, self.storage.read(last_note))
+            except Exception:
+                pass
+        self.setup_connections()
+        self.apply_read_only()
+        self.window.ensurePolished()
+
     def set_password_dialog(self):
-        dialog = CustomDialog(self.window, "Set Password", "Set a password to encrypt your notes:")
-        dialog.input_field.setEchoMode(QLineEdit.EchoMode.Password)
-        if dialog.exec() == QDialog.DialogCode.Accepted:
-            password = dialog.get_text()
+        if self.config.configured or self.config.damaged:
+            # Only ever for a vault without a password: a new salt orphans every note
+            raise RuntimeError("refusing to set a new password over existing password settings")
+        password = self.dialogs.prompt("Set Password", "Set a password to encrypt your notes:", password=True)
+        if password is not None:
             if not password:
                 return False
-            pw_hash = encryption.create_password_hash(password)
-            encryption.save_config(pw_hash, CONFIG_FILE)
-            self.key = encryption.derive_key(password, base64.b64decode(pw_hash['salt']))
+            task = FunctionTask(lambda: verification.enroll(password))
+            self.dialogs.wait("Setting Up", "Deriving the encryption key...", task)
+            if task.result is None:
+                self.dialogs.message("Error", f"Could not set the password: {task.error}")
+                return False
+            entries, key = task.result
+            self.config.update(entries)
+            self.config.save()
+            self.key = bytearray(key)
             self.password_verified = True
             return True
         return False
 
-    def login_dialog(self):
-        for _ in range(3):
-            dialog = CustomDialog(self.window, "Enter Password", "Enter password to unlock:")
-            dialog.input_field.setEchoMode(QLineEdit.EchoMode.Password)
-            if dialog.exec() == QDialog.DialogCode.Accepted:
-                password = dialog.get_text()
+    def login_dialog(self, title="Enter Password", work=None):
+        # `work()` runs on the UI thread during the first key derivation. Wrong passwords
+        # are only limited by the (persistent) backoff, not by a number of tries.
+        while True:
+            wait = self.login_throttle.remaining()
+            if wait > 0 and not self.dialogs.countdown(
+                    "Too Many Attempts", "Wrong password too many times. Try again in {seconds} s.", wait):
+                return False
+            password = self.dialogs.prompt(title, "Enter password to unlock:", password=True)
+            if password is not None:
                 if not password:
                     return False
-                salt = base64.b64decode(self.config['salt'])
-                stored_hash = base64.b64decode(self.config['hash'])
-                if encryption.verify_password(password, salt, stored_hash):
-                    self.key = encryption.derive_key(password, salt)
+                task = FunctionTask(lambda: verification.unlock(self.config, password))
+                self.dialogs.wait("Unlocking", "Deriving the key...", task, work)
+                work = None
+                if task.error is not None:
+                    self.dialogs.message("Error", f"Could not unlock the vault: {task.error}")
+                    return False
+                if task.result is not None:
+                    self.login_throttle.succeeded()
+                    self.key = bytearray(task.result)
                     self.password_verified = True
+                    if verification.upgrade_config(self.config, self.key) and not self.read_only:
+                        self.config.save()
                     return True
                 else:
-                    dialog = CustomMessageDialog(self.window, "Incorrect Password", "Password incorrect. Try again.")
-                    dialog.exec()
+                    self.login_throttle.failed()
+                    self.dialogs.message("Incorrect Password", "Password incorrect. Try again.")
             else:
                 return False
-        return False
 
-    def load_notes(self):
+    def _read_note_file(self, fname):
+        return unpack_note(self.key, self.storage.read(fname))
+
+    def _created(self, fname):
+        return self.index.entries.get(fname, {}).get('created') or created_ms(fname)
+
+    def _pack_note(self, fname, content, modified=None):
+        return pack_note(self.key, content, self._created(fname), modified)
+
+    @staticmethod
+    def _content_hash(decrypted):
+        return hashlib.sha256(decrypted.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _hashing(chunks, digest):
+        # Passes `chunks` through, adding them to `digest`; the result matches _content_hash
+        # of the joined text
+        for chunk in chunks:
+            digest.update(chunk.encode('utf-8'))
+            yield chunk
+
+    def load_notes(self, snapshot=None):
+        # `snapshot` is a listing just taken with watcher.reset(), if the caller has one
         self.notes = []
         self.window.list_widget.clear()
-        for fname in sorted(os.listdir(NOTES_DIR), reverse=True):
-            if fname.endswith('.enc'):
+        if snapshot is None:
+            snapshot = self.watcher.reset()
+        readable = []
+        unreadable = []
+        for fname in snapshot:
+            # Only notes whose file changed since the index was written get read, and then
+            # just their header
+            title = self.index.lookup(fname, snapshot[fname])
+            if title is None:
                 try:
-                    path = os.path.join(NOTES_DIR, fname)
-                    with open(path, 'rb') as f:
-                        encrypted = f.read()
-                    decrypted = encryption.decrypt_data(self.key, encrypted).decode('utf-8')
-                    first_line = decrypted.splitlines()[0].strip()
-                    title = first_line[1:].strip() if first_line.startswith('#') else "Untitled"
-                    self.notes.append({'filename': fname, 'title': title})
-                    self.window.list_widget.addItem(title)
+                    header = read_header(self.storage, self.key, fname)
                 except Exception:
-                    pass
+                    unreadable.append(fname)
+                    continue
+                title = header['title']
+                self.index.update(fname, title, snapshot[fname], header.get('modified'), header.get('created'))
+            readable.append(fname)
+        # Ordering is served entirely from the index
+        for fname in self.index.sorted_ids(readable, self.sort_order):
+            title = self.index.entries[fname]['title']
+            self.notes.append(NoteRecord(fname, title))
+            self.window.list_widget.addItem(title)
+        self.index.prune(snapshot)
+        if hasattr(self, 'current_filename'):
+            self.window.list_widget.setCurrentRow(self._find_note_row(self.current_filename))
+        self.schedule_index_flush()
+        if unreadable:
+            self.window.show_status(f"{len(unreadable)} notes could not be read; run the integrity check "
+                                    "from the export menu.", 10000)
+
+    def _find_note_row(self, filename):
+        for i, note in enumerate(self.notes):
+            if note.filename == filename:
+                return i
+        return -1
+
+    def _upsert_note_entry(self, filename, title):
+        # Keep self.notes and the list widget in sync without a full reload; the entry is
+        # (re)placed at its position in the current sort order (the index must be updated first)
+        list_widget = self.window.list_widget
+        row = self._find_note_row(filename)
+        was_current = row >= 0 and row == list_widget.currentRow()
+        key = self.index.sort_key(filename, self.sort_order)
+        target = 0
+        for i, note in enumerate(self.notes):
+            if i != row and self.index.sort_key(note.filename, self.sort_order) < key:
+                target += 1
+        if row >= 0:
+            if row == target:
+                if self.notes[row].title != title:
+                    self.notes[row].title = title
+                    list_widget.item(row).setText(title)
+                return row
+            del self.notes[row]
+            list_widget.takeItem(row)
+        self.notes.insert(target, NoteRecord(filename, title))
+        list_widget.insertItem(target, title)
+        if was_current:
+            list_widget.setCurrentRow(target)
+        return target
+
+    def set_sort_order(self, order):
+        if order == self.sort_order:
+            return
+        self.sort_order = order
+        current = getattr(self, 'current_filename', None)
+        ordered = self.index.sorted_ids([note.filename for note in self.notes], order)
+        self.notes = [NoteRecord(fname, self.index.entries[fname]['title']) for fname in ordered]
+        list_widget = self.window.list_widget
+        list_widget.clear()
+        list_widget.addItems([note.title for note in self.notes])
+        if current:
+            list_widget.setCurrentRow(self._find_note_row(current))
+
+    def _index_note(self, filename, title, modified=None, created=None):
+        stamp = self.watcher.stamp(filename)
+        if stamp is not None:
+            self.index.update(filename, title, stamp, modified, created)
+            self.schedule_index_flush()
+
+    def _remove_note_entry(self, filename):
+        row = self._find_note_row(filename)
+        if row >= 0:
+            del self.notes[row]
+            self.window.list_widget.takeItem(row)
 
     def select_note_in_list(self, filename):
         for i in range(self.window.list_widget.count()):
-            if self.notes[i]['filename'] == filename:
+            if self.notes[i].filename == filename:
                 self.window.list_widget.setCurrentRow(i)
                 self.load_note(self.window.list_widget.currentItem())
                 break
 
+    def reopen_last_note(self):
+        # Opens the note that was open at the last exit, from the copy read during unlock
+        last_note = self.config.get('last_note')
+        if last_note and self._find_note_row(last_note) >= 0:
+            self.select_note_in_list(last_note)
+        self.prefetched.pop('last_note', None)
+
+    def _editor_html(self):
+        with metrics.timed('toHtml') as timing:
+            html = self.window.text_edit.toHtml()
+            timing.nbytes = len(html)
+        return html
+
+    def _set_editor_html(self, html):
+        with metrics.timed('setHtml', len(html)):
+            self.window.text_edit.setHtml(html)
+
+    @metrics.instrument('load_note')
     def load_note(self, item):
         idx = self.window.list_widget.row(item)
         note = self.notes[idx]
+        self.flush_autosave()
         try:
-            with open(os.path.join(NOTES_DIR, note['filename']), 'rb') as f:
-                encrypted = f.read()
-            decrypted = encryption.decrypt_data(self.key, encrypted).decode('utf-8')
-            lines = decrypted.splitlines()
-            if lines and lines[0].startswith('#'):
-                content = '\n'.join(lines[1:]).lstrip('\n')
+            prefetched = self.prefetched.pop('last_note', None)
+            if prefetched and prefetched[0] == note.filename:
+                stream = io.BytesIO(prefetched[1])
             else:
-                content = decrypted
-            self.current_filename = note['filename']
-            self.window.text_edit.setReadOnly(False)
-            self.window.text_edit.setHtml(content)
-            self.auto_save()
+                stream = self.storage.read_stream(note.filename)
+            with stream:
+                header, chunks = open_note(self.key, stream)
+                if body_format(header) == FORMAT_TEXT:
+                    # Read, decrypted and shown a chunk at a time
+                    digest = hashlib.sha256()
+                    chunks = self._hashing(chunks, digest)
+                    next(chunks)  # the '# title' line
+                    self._show_large_note(note.filename, chunks)
+                    self.current_disk_hash = digest.hexdigest()
+                    return
+                decrypted = next(chunks)
+            content = self._note_body(decrypted)
+            if is_large(header.get('size', len(decrypted)), self.large_policy) and self._use_large_editor(note, header):
+                self._convert_to_large_note(note, decrypted, content)
+                return
+            if self.window.large_mode:
+                # Out of large-document mode, and the big text out of memory
+                self.disable_text_edit()
+            if 'data:image' in content and not self.read_only:
+                # Notes from before attachments: images move out on the next save
+                content = externalize_images(content, self.window.text_edit.attachment_saver)
+            self.current_filename = note.filename
+            self.current_disk_hash = self._content_hash(decrypted)
+            self.watcher.watch_file(self.current_filename)
+            self.window.text_edit.setReadOnly(self.read_only)
+            self._set_editor_html(content)
+            # Baseline for change detection; opening a note must not rewrite it (or bump its
+            # modified time)
+            self.last_saved_hash = self._content_hash(self._editor_html())
+            self.window.text_edit.document().setModified(False)
+            # setHtml counts as an edit; nothing is pending for a freshly opened note
+            self.autosave.cancel()
         except Exception as e:
-            dialog = CustomMessageDialog(self.window, "Error", f"Failed to load note: {e}")
-            dialog.exec()
+            self.dialogs.message("Error", f"Failed to load note: {e}")
+
+    def _use_large_editor(self, note, header):
+        if note.filename in self.keep_rich:
+            return False
+        if self.read_only:
+            # Nothing gets saved, so nothing is lost
+            return True
+        size = header.get('size') or 0
+        if self.dialogs.confirm(
+                "Large Note",
+                f"This note is {size / 1048576:.1f} MB. Open it in the large-document editor? It is much "
+                "faster, but edits plain text: formatting and images are dropped from the note.",
+                confirm_text="Open as Text"):
+            return True
+        self.keep_rich.add(note.filename)
+        return False
+
+    def _convert_to_large_note(self, note, decrypted, content):
+        from PyQt6.QtGui import QTextDocument
+        doc = QTextDocument()
+        doc.setHtml(content)
+        # Images are object placeholders in the plain text
+        text = doc.toPlainText().replace('\ufffc', '')
+        self._show_large_note(note.filename, text_chunks(text))
+        self.current_disk_hash = self._content_hash(decrypted)
+        if not self.read_only:
+            # The rich version stays in the history, so the switch can be undone from there
+            self.record_revision(note.filename, decrypted, manual=True)
+            self.window.plain_edit.document().setModified(True)
+            self.save_current_note(auto=True)
+
+    def _show_large_note(self, filename, chunks):
+        # Fills the large-document editor from the body text in `chunks`. The note only
+        # becomes current once all of it is in, so a failure can't leave half a note to save.
+        self.disable_text_edit()
+        self.window.set_large_mode(True)
+        editor = self.window.plain_edit
+        editor.set_highlighting(False)
+
+        def progress(chars):
+            self.window.show_status(f"Loading note... {chars / 1048576:.0f}M characters", 0)
+            # Paint what is there so far; no input until the note is complete
+            self.app.processEvents(QEventLoop.ProcessEventsFlag.ExcludeUserInputEvents)
+        try:
+            with metrics.timed('load_large_note') as timing:
+                fill_editor(editor, chunks, progress)
+                timing.nbytes = editor.document().characterCount()
+        except Exception:
+            editor.clear()
+            self.window.set_large_mode(False)
+            raise
+        finally:
+            self.apply_read_only()
+        editor.set_highlighting(editor.document().characterCount() <= self.large_policy['highlight_max_kb'] * 1024)
+        self.current_filename = filename
+        self.watcher.watch_file(filename)
+        editor.setReadOnly(self.read_only)
+        self.last_saved_hash = None
+        self.autosave.cancel()
+
+    def _write_large_note(self, title, modified):
+        # Writes the large-document editor's text as a text note; returns its content hash
+        digest = hashlib.sha256(f"# {title}\n\n".encode('utf-8'))
+        with metrics.timed('save_large_note') as timing:
+            text = self.window.plain_edit.toPlainText()
+            timing.nbytes = len(text)
+            chunks = self._hashing(text_chunks(text), digest)
+            parts = pack_text_note(self.key, title, chunks, self._created(self.current_filename), modified)
+            self.storage.write_parts(self.current_filename, parts)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _note_body(decrypted):
+        lines = decrypted.splitlines()
+        if lines and lines[0].startswith('#'):
+            return '\n'.join(lines[1:]).lstrip('\n')
+        return decrypted
 
     def disable_text_edit(self):
-        self.window.text_edit.setReadOnly(True)
-        self.window.text_edit.clear()
+        self.autosave.cancel()
+        for editor in (self.window.text_edit, self.window.plain_edit):
+            editor.setReadOnly(True)
+            editor.clear()
+        self.window.plain_edit.set_highlighting(False)
+        self.window.set_large_mode(False)
         if hasattr(self, 'current_filename'):
             delattr(self, 'current_filename')
+        self.current_disk_hash = None
+        self.watcher.watch_file(None)
 
+    @metrics.instrument('save_current_note')
     def save_current_note(self, auto=False):
+        if self.read_only:
+            if not auto:
+                self.dialogs.notify("Read-only: the vault is open in another instance.")
+            return
         if not hasattr(self, 'current_filename'):
             if not auto:
-                dialog = CustomMessageDialog(self.window, "No Note Selected", "Please select or create a note first.")
-                dialog.exec()
+                self.dialogs.message("No Note Selected", "Please select or create a note first.")
             return
-        title = self.notes[self.window.list_widget.currentRow()]['title']
-        content = self.window.text_edit.toHtml()
-        full_content = f"# {title}\n\n{content}"
-        enc_data = encryption.encrypt_data(self.key, full_content.encode('utf-8'))
+        if self.watcher.is_stale(self.current_filename):
+            # An external write hasn't been merged yet; resolve it before overwriting the file
+            self.watcher.scan()
+            if not hasattr(self, 'current_filename'):
+                return
+        started = time.perf_counter()
+        # By id, not the list selection: a click on another note may already have moved it
+        title = self.notes[self._find_note_row(self.current_filename)].title
+        modified = int(time.time() * 1000)
+        if self.window.large_mode:
+            # No revisions: diffing multi-megabyte notes would cost more than the save itself
+            content_hash = None
+            write = lambda: self._write_large_note(title, modified)
+        else:
+            content = self._editor_html()
+            full_content = f"# {title}\n\n{content}"
+            content_hash = self._content_hash(content)
+            if self.last_saved_hash is not None and content_hash != self.last_saved_hash:
+                # What is about to be overwritten is read back from disk, and only if a
+                # revision is actually taken
+                filename = self.current_filename
+                self.record_revision(filename, lambda: self._read_note_file(filename), manual=not auto)
+            enc_data = self._pack_note(self.current_filename, full_content, modified)
+
+            def write():
+                self.storage.write(self.current_filename, enc_data)
+                return self._content_hash(full_content)
         try:
-            with open(os.path.join(NOTES_DIR, self.current_filename), 'wb') as f:
-                f.write(enc_data)
-            self.last_saved_content = content
+            # Never between the format upgrade's check of this note and its rewrite
+            with note_write_lock:
+                disk_hash = write()
+            self.watcher.acknowledge(self.current_filename)
+            self._index_note(self.current_filename, title, modified=modified)
+            self._upsert_note_entry(self.current_filename, title)
+            self.current_disk_hash = disk_hash
+            self.last_saved_hash = content_hash
+            self.window.editor.document().setModified(False)
+            self.autosave.saved(time.perf_counter() - started)
             if not auto:
-                dialog = CustomMessageDialog(self.window, "Saved", "Note saved successfully.")
-                dialog.exec()
+                self.dialogs.notify("Note saved successfully.")
         except Exception as e:
             if not auto:
-                dialog = CustomMessageDialog(self.window, "Error", f"Failed to save note: {e}")
-                dialog.exec()
+                self.dialogs.message("Error", f"Failed to save note: {e}")
+
+    def record_revision(self, filename, previous, manual=False):
+        # Keeps what a save is about to overwrite; history trouble must never block the save
+        try:
+            if self.history.record(self.key, filename, previous, manual=manual):
+                self.history_pending.add(filename)
+                if not self.history_prune_timer.isActive():
+                    self.history_prune_timer.start()
+        except Exception:
+            pass
+
+    def prune_history(self):
+        if self.history_thread or not self.history_pending:
+            return
+        pending, self.history_pending = self.history_pending, set()
+        key, policy = self.key, self.history.policy
+
+        def job(storage, progress, should_stop):
+            history = NoteHistory(storage, policy)
+            for filename in pending:
+                if should_stop():
+                    break
+                history.prune(key, filename)
+
+        self.history_thread = BackgroundTask(self.storage_kind, job)
+        self.history_thread.finished.connect(self.on_history_pruned)
+        self.history_thread.start()
+
+    def on_history_pruned(self):
+        self.history_thread = None
+        if self.history_pending:
+            self.history_prune_timer.start()
+
+    def show_history(self):
+        if not hasattr(self, 'current_filename'):
+            self.dialogs.message("No Note Selected", "Please select a note to see its history.")
+            return
+        from PyQt6.QtWidgets import QDialog
+        import datetime
+        filename = self.current_filename
+        revisions = list(reversed(self.history.revisions(filename)))
+        if not revisions:
+            self.dialogs.notify("This note has no earlier revisions yet.")
+            return
+        if not hasattr(self, 'history_dialog'):
+            self.history_dialog = HistoryDialog(self.window)
+            self.history_dialog.preview.attachment_loader = self.window.text_edit.attachment_loader
+        dialog = self.history_dialog
+        labels = [f"{datetime.datetime.fromtimestamp(t / 1000):%Y-%m-%d %H:%M}   {size / 1024:.1f} KB"
+                  for _index, t, size in revisions]
+        # By id: the list selection may have moved, or be empty
+        row = self._find_note_row(filename)
+        title = self.notes[row].title if row >= 0 else "Untitled"
+        dialog.configure(f"History: {title}", labels)
+        selected = {}
+
+        def preview(row):
+            if row < 0:
+                return
+            try:
+                selected['text'] = self.history.text(self.key, filename, revisions[row][0])
+                dialog.show_preview(self._note_body(selected['text']))
+                dialog.restore_btn.setEnabled(not self.read_only)
+            except Exception as e:
+                dialog.preview.setPlainText(f"Could not read this revision: {e}")
+                dialog.restore_btn.setEnabled(False)
+
+        dialog.revision_changed.connect(preview)
+        try:
+            accepted = dialog.exec() == QDialog.DialogCode.Accepted
+        finally:
+            dialog.revision_changed.disconnect(preview)
+        if accepted and 'text' in selected and getattr(self, 'current_filename', None) == filename:
+            if self.window.large_mode:
+                # Revisions are rich text: the current text is kept as a revision, the
+                # restored one written as a rich note and reopened in the rich editor
+                if self._is_dirty():
+                    self.save_current_note()
+                self.record_revision(filename, lambda: self._read_note_file(filename), manual=True)
+                modified = int(time.time() * 1000)
+                content = f"# {title}\n\n{self._note_body(selected['text'])}"
+                with note_write_lock:
+                    self.storage.write(filename, self._pack_note(filename, content, modified))
+                self.watcher.acknowledge(filename)
+                self._index_note(filename, title, modified=modified)
+                self.keep_rich.add(filename)
+                self.select_note_in_list(filename)
+                return
+            # Saving the restored text records the current one as a revision, so this is undoable
+            self._set_editor_html(self._note_body(selected['text']))
+            self.save_current_note()
 
     def create_new_note(self):
-        dialog = CustomDialog(self.window, "Create New Note", "Enter a title for the new note:")
-        if dialog.exec() == QDialog.DialogCode.Accepted:
-            title = dialog.get_text()
+        if self.read_only:
+            return
+        title = self.dialogs.prompt("Create New Note", "Enter a title for the new note:")
+        if title is not None:
             if not title:
-                msg_dialog = CustomMessageDialog(self.window, "Empty Title", "Please enter a title for the new note.")
-                msg_dialog.exec()
+                self.dialogs.message("Empty Title", "Please enter a title for the new note.")
                 return
-            date_str = datetime.datetime.now().strftime("%Y%m%d")
-            rand_str = random_string(6)
-            filename = f"{date_str}_{rand_str}.enc"
+            filename = new_note_filename(exists=lambda name: self.storage.stamp(name) is not None)
             content = f"# {title}\n\n<p></p>"
-            enc_data = encryption.encrypt_data(self.key, content.encode('utf-8'))
-            with open(os.path.join(NOTES_DIR, filename), 'wb') as f:
-                f.write(enc_data)
-            self.load_notes()
+            modified = int(time.time() * 1000)
+            self.storage.write(filename, self._pack_note(filename, content, modified))
+            self.watcher.acknowledge(filename)
+            self._index_note(filename, title, modified=modified)
+            self._upsert_note_entry(filename, title)
             self.select_note_in_list(filename)
 
     def export_all_notes(self):
@@ -181,115 +752,794 @@ class EncryptedNotesApp:
         folder = QFileDialog.getExistingDirectory(self.window, "Select Export Folder")
         if not folder:
             return
+        failed = []
         for note in self.notes:
             try:
-                with open(os.path.join(NOTES_DIR, note['filename']), 'rb') as f:
-                    encrypted = f.read()
-                decrypted = encryption.decrypt_data(self.key, encrypted).decode('utf-8')
+                decrypted, fmt = unpack_note_and_format(self.key, self.storage.read(note.filename))
                 lines = decrypted.splitlines()
                 if lines and lines[0].startswith('#'):
                     content = '\n'.join(lines[1:]).lstrip('\n')
                 else:
                     content = decrypted
-                from PyQt6.QtGui import QTextDocument
-                doc = QTextDocument()
-                doc.setHtml(content)
-                plain_text = doc.toPlainText()
-                safe_title = ''.join(c for c in note['title'] if c.isalnum() or c in (' ', '_')).rstrip()
-                export_name = f"{note['filename']}_{safe_title}.txt"
+                if fmt == FORMAT_TEXT:
+                    plain_text = self._note_body(decrypted)
+                else:
+                    from PyQt6.QtGui import QTextDocument
+                    doc = QTextDocument()
+                    doc.setHtml(content)
+                    plain_text = doc.toPlainText()
+                safe_title = ''.join(c for c in note.title if c.isalnum() or c in (' ', '_')).rstrip()
+                export_name = f"{note.filename}_{safe_title}.txt"
                 export_path = os.path.join(folder, export_name)
                 with open(export_path, 'w', encoding='utf-8') as ef:
                     ef.write(plain_text)
             except Exception:
-                pass
-        dialog = CustomMessageDialog(self.window, "Export Complete", "All notes exported successfully.")
-        dialog.exec()
+                failed.append(note.title)
+        if failed:
+            self.dialogs.message("Export Incomplete",
+                                 f"{len(failed)} notes could not be exported: {', '.join(failed[:5])}"
+                                 f"{'…' if len(failed) > 5 else ''}. Run the integrity check for details.")
+        else:
+            self.dialogs.message("Export Complete", "All notes exported successfully.")
+
+    def export_archive(self):
+        if self.export_thread:
+            return
+        from PyQt6.QtWidgets import QFileDialog
+        filters = ";;".join(f"{label} in zip (*.zip);;{label} in tar.gz (*.tar.gz)"
+                            for label in EXPORT_FORMATS.values())
+        path, chosen = QFileDialog.getSaveFileName(self.window, "Export Notes to Archive", "notes.zip", filters)
+        if not path:
+            return
+        # Some platform dialogs report no filter at all
+        fmt = next((ext for ext, label in EXPORT_FORMATS.items() if chosen.startswith(label)), 'html')
+        suffix = '.zip' if '*.zip' in chosen else '.tar.gz'
+        if not path.lower().endswith(('.zip', '.tar.gz', '.tgz', '.tar')):
+            path += suffix
+        password = self.dialogs.prompt("Export Password",
+                                       "Optional password to encrypt the archive with (leave empty for none):",
+                                       password=True)
+        if password is None:
+            return
+        if password:
+            # A typo here would leave the archive undecryptable for good
+            repeated = self.dialogs.prompt("Export Password", "Repeat the export password:", password=True)
+            if repeated is None:
+                return
+            if repeated != password:
+                self.dialogs.message("Export Password", "The passwords don't match. Nothing was exported.")
+                return
+        key = self.key
+        notes = [(note.filename, note.title) for note in self.notes]
+        self.export_thread = BackgroundTask(
+            self.storage_kind,
+            lambda storage, progress, should_stop: export_archive(storage, key, notes, path, fmt, password or None,
+                                                                  progress=progress, should_stop=should_stop))
+        self.export_thread.progress.connect(
+            lambda done, total: self.window.show_status(f"Exporting {done}/{total}...", 0))
+        self.export_thread.finished.connect(self.on_export_finished)
+        self.window.export_button.setEnabled(False)
+        self.export_thread.start()
+
+    def on_export_finished(self):
+        thread = self.export_thread
+        if thread is None:
+            return
+        self.export_thread = None
+        self.window.export_button.setEnabled(True)
+        if thread.error:
+            self.window.show_status("")
+            self.dialogs.message("Export Failed", f"Failed to export notes: {thread.error}")
+            return
+        result = thread.result
+        summary = f"Exported {result['exported']} notes to {os.path.basename(result['path'])}"
+        if result['failed']:
+            summary += f", {len(result['failed'])} failed"
+        self.window.show_status(summary + ".", 8000)
+
+    def backup_vault(self):
+        if self.backup_thread:
+            return
+        from PyQt6.QtWidgets import QFileDialog
+        folder = QFileDialog.getExistingDirectory(self.window, "Select Backup Folder", self.config.get('backup_dir', ''))
+        if not folder:
+            return
+        if self.config.get('backup_dir') != folder:
+            self.config['backup_dir'] = folder
+            if not self.read_only:
+                self.config.save()
+        # Unsaved edits would otherwise miss the snapshot
+        if self._is_dirty():
+            self.save_current_note(auto=True)
+        key = self.key
+        self.backup_thread = BackgroundTask(
+            self.storage_kind,
+            lambda storage, progress, should_stop: create_snapshot(storage, key, folder, CONFIG_FILE,
+                                                                   progress=progress, should_stop=should_stop))
+        self.backup_thread.progress.connect(
+            lambda done, total: self.window.show_status(f"Backing up {done}/{total}...", 0))
+        self.backup_thread.finished.connect(self.on_backup_finished)
+        self.backup_thread.start()
+
+    def on_backup_finished(self):
+        thread = self.backup_thread
+        if thread is None:
+            return
+        self.backup_thread = None
+        if thread.error:
+            self.window.show_status("")
+            self.dialogs.message("Backup Failed", f"Failed to back up notes: {thread.error}")
+            return
+        result = thread.result
+        if result['snapshot'] is None:
+            self.window.show_status("Backup cancelled.", 4000)
+            return
+        self.window.show_status(f"Snapshot {result['snapshot']}: {result['copied']} changed notes copied, "
+                                f"{result['reused']} unchanged.", 8000)
+
+    def toggle_profiling(self):
+        if profiler.active:
+            path = profiler.stop()
+            self.window.show_status(f"Profile written to {path}.", 8000)
+        else:
+            # Keep the format of a session profile, if one was asked for
+            extension = '.json' if (profiler.path or '').lower().endswith('.json') else '.pstats'
+            profiler.start(Profiler.default_path(extension))
+            self.window.show_status("Profiling… press Ctrl+Shift+P again to stop.", 0)
+
+    def check_integrity(self):
+        if self.check_thread:
+            return
+        key, kind = self.key, self.storage_kind
+        self.check_thread = BackgroundTask(
+            self.storage_kind,
+            lambda storage, progress, should_stop: scan_vault(storage, key, kind, NOTES_DIR, VAULT_DB,
+                                                              progress=progress, should_stop=should_stop))
+        self.check_thread.progress.connect(
+            lambda done, total: self.window.show_status(f"Checking {done}/{total}...", 0))
+        self.check_thread.finished.connect(self.on_integrity_checked)
+        self.check_thread.start()
+
+    def on_integrity_checked(self):
+        thread = self.check_thread
+        if thread is None:
+            return
+        self.check_thread = None
+        self.window.show_status("")
+        if thread.error:
+            self.dialogs.message("Integrity Check Failed", f"Failed to check the vault: {thread.error}")
+            return
+        result = thread.result
+        # The index belongs to this thread, so orphans are looked up here
+        existing = self.storage.list_notes()
+        result['orphans'] = [note_id for note_id in self.index.entries if note_id not in existing]
+        report = format_report(result)
+        bad = [note_id for note_id, status, _detail in result['problems'] if status in QUARANTINABLE]
+        if not bad or self.read_only:
+            if result['orphans'] and not self.read_only:
+                self.index.prune(self.storage.list_notes())
+                self.schedule_index_flush()
+            if not self.read_only:
+                removed = self._sweep_attachments(result)
+                if removed:
+                    report += f"\nRemoved {removed} images no note uses any more."
+            self.dialogs.message("Integrity Check", report)
+            return
+        if self.dialogs.confirm("Integrity Check", f"{report}\n\nMove the {len(bad)} damaged notes to "
+                                f"'{QUARANTINE_DIR}'?", confirm_text="Quarantine", danger=True):
+            if getattr(self, 'current_filename', None) in bad:
+                self.disable_text_edit()
+            try:
+                moved, failed = quarantine(self.storage, bad, QUARANTINE_DIR, index=self.index)
+            except OSError as e:
+                self.dialogs.message("Quarantine Failed", f"Could not move the damaged notes: {e}")
+                return
+            for note_id in moved:
+                self.watcher.acknowledge(note_id)
+                self.history.delete(note_id)
+            self.index.prune(self.storage.list_notes())
+            self.load_notes()
+            self.flush_index()
+            if failed:
+                self.dialogs.message("Quarantine Incomplete",
+                                     f"Moved {len(moved)} notes to {QUARANTINE_DIR}. {len(failed)} could not be "
+                                     f"copied and were left in the vault: "
+                                     + '; '.join(f"{note_id} ({error})" for note_id, error in failed[:5]))
+            else:
+                self.dialogs.notify(f"Moved {len(moved)} notes to {QUARANTINE_DIR}.")
+
+    def _sweep_attachments(self, result):
+        # Images pasted into the open note are stored before the note is saved
+        in_use = set()
+        if hasattr(self, 'current_filename') and not self.window.large_mode:
+            in_use = references(self._editor_html())
+        try:
+            return sweep_attachments(self.storage, self.key, result, in_use)
+        except Exception:
+            # Nothing lost: unused images just stay until the next check
+            return 0
+
+    def upgrade_note_files(self):
+        # Rewrites notes still in the old single-token format in the background
+        if self.read_only or self.upgrade_thread:
+            return
+        key = self.key
+        times = {fname: (entry.get('created'), entry.get('modified')) for fname, entry in self.index.entries.items()}
+        skip = {getattr(self, 'current_filename', None)}
+        self.upgrade_thread = BackgroundTask(
+            self.storage_kind,
+            lambda storage, progress, should_stop: upgrade_notes(storage, key, times, skip, progress, should_stop))
+        self.upgrade_thread.finished.connect(self.on_upgrade_finished)
+        self.upgrade_thread.start()
+
+    def on_upgrade_finished(self):
+        thread, self.upgrade_thread = self.upgrade_thread, None
+        if thread is None or thread.error or not thread.result:
+            return
+        for note_id, stamp, header in thread.result:
+            if stamp is not None:
+                self.watcher.acknowledge(note_id)
+                self.index.update(note_id, header['title'], stamp, header['modified'], header['created'])
+        self.schedule_index_flush()
+
+    def import_notes(self):
+        if self.read_only or self.import_thread:
+            return
+        from PyQt6.QtWidgets import QFileDialog
+        folder = QFileDialog.getExistingDirectory(self.window, "Select Folder to Import")
+        if not folder:
+            return
+        # The import reloads the list once at the end; per-file change events are noise
+        self.watcher.suspend()
+        key = self.key
+        self.import_thread = BackgroundTask(
+            self.storage_kind,
+            lambda storage, progress, should_stop: import_folder(storage, key, folder, progress=progress,
+                                                                 should_stop=should_stop))
+        self.import_thread.progress.connect(
+            lambda done, total: self.window.show_status(f"Importing {done}/{total}...", 0))
+        self.import_thread.finished.connect(self.on_import_finished)
+        self.window.import_button.setEnabled(False)
+        self.import_thread.start()
+
+    def on_import_finished(self):
+        thread = self.import_thread
+        if thread is None:
+            return
+        self.import_thread = None
+        self.watcher.resume()
+        self.window.import_button.setEnabled(not self.read_only)
+        if thread.error:
+            self.window.show_status("")
+            self.dialogs.message("Import Failed", f"Failed to import notes: {thread.error}")
+            return
+        result = thread.result
+        for note_id, title, stamp, modified in result['imported']:
+            self.index.update(note_id, title, stamp, modified)
+        self.load_notes()
+        self.flush_index()
+        summary = f"Imported {len(result['imported'])} notes"
+        if result['skipped']:
+            summary += f", {result['skipped']} already imported"
+        if result['failed']:
+            summary += f", {len(result['failed'])} failed"
+        self.window.show_status(summary + ".", 8000)
 
     def delete_note(self):
+        if self.read_only:
+            return
         if not hasattr(self, 'current_filename'):
-            dialog = CustomMessageDialog(self.window, "No Note Selected", "Please select a note to delete.")
-            dialog.exec()
+            self.dialogs.message("No Note Selected", "Please select a note to delete.")
             return
         
         current_row = self.window.list_widget.currentRow()
         if current_row < 0:
-            dialog = CustomMessageDialog(self.window, "No Note Selected", "Please select a note to delete.")
-            dialog.exec()
+            self.dialogs.message("No Note Selected", "Please select a note to delete.")
             return
         
         note = self.notes[current_row]
-        title = note['title']
+        title = note.title
         
         # Show confirmation dialog
-        confirm_dialog = CustomDialog(self.window, "Confirm Delete", f"Are you sure you want to delete '{title}'?\n\nThis action cannot be undone.")
-        confirm_dialog.input_field.setVisible(False)
-        confirm_dialog.input_field.setMaximumHeight(0)
-        
-        # Change button text for confirmation
-        for child in confirm_dialog.children():
-            if isinstance(child, QHBoxLayout):
-                for i in range(child.count()):
-                    widget = child.itemAt(i).widget()
-                    if isinstance(widget, QPushButton):
-                        if widget.text() == "Confirm":
-                            widget.setText("Delete")
-                            widget.setStyleSheet("""
-                                QPushButton {
-                                    background-color: #d9534f;
-                                    border: none;
-                                    padding: 8px 16px;
-                                    border-radius: 8px;
-                                    color: white;
-                                    font-size: 13px;
-                                }
-                                QPushButton:hover {
-                                    background-color: #c9302c;
-                                }
-                            """)
-                        elif widget.text() == "Cancel":
-                            widget.setText("Cancel")
-        
-        if confirm_dialog.exec() == QDialog.DialogCode.Accepted:
+        if self.dialogs.confirm("Confirm Delete", f"Are you sure you want to delete '{title}'?\n\nThis action cannot be undone.",
+                                confirm_text="Delete", danger=True):
             try:
                 # Delete the file
-                file_path = os.path.join(NOTES_DIR, note['filename'])
-                if os.path.exists(file_path):
-                    os.remove(file_path)
+                self.storage.delete(note.filename)
+                self.watcher.acknowledge(note.filename)
+                self.index.remove(note.filename)
+                self.history.delete(note.filename)
+                self.history_pending.discard(note.filename)
+                self.schedule_index_flush()
                 
                 # Clear current note if it was the deleted one
-                if hasattr(self, 'current_filename') and self.current_filename == note['filename']:
+                if hasattr(self, 'current_filename') and self.current_filename == note.filename:
                     self.disable_text_edit()
                 
-                # Reload notes list
-                self.load_notes()
+                # Drop it from the notes list
+                self._remove_note_entry(note.filename)
                 
                 # Show success message
-                success_dialog = CustomMessageDialog(self.window, "Note Deleted", f"'{title}' has been deleted successfully.")
-                success_dialog.exec()
+                self.dialogs.notify(f"'{title}' has been deleted successfully.")
                 
             except Exception as e:
-                error_dialog = CustomMessageDialog(self.window, "Error", f"Failed to delete note: {e}")
-                error_dialog.exec()
+                self.dialogs.message("Error", f"Failed to delete note: {e}")
 
     def setup_connections(self):
         self.window.new_file_button.clicked.connect(self.create_new_note)
         self.window.save_button.clicked.connect(self.save_current_note)
         self.window.list_widget.itemClicked.connect(self.load_note)
-        self.window.export_button.clicked.connect(self.export_all_notes)
+        self.window.export_folder_action.triggered.connect(self.export_all_notes)
+        self.window.export_archive_action.triggered.connect(self.export_archive)
+        self.window.backup_action.triggered.connect(self.backup_vault)
+        self.window.check_action.triggered.connect(self.check_integrity)
         self.window.delete_button.clicked.connect(self.delete_note)
+        self.window.import_button.clicked.connect(self.import_notes)
+        self.window.history_button.clicked.connect(self.show_history)
+        self.window.profile_shortcut.activated.connect(self.toggle_profiling)
+        self.window.lock_shortcut.activated.connect(lambda: self.lock_vault(requested=True))
         self.window.text_edit.textChanged.connect(self.on_text_changed)
+        self.window.plain_edit.textChanged.connect(self.on_text_changed)
+        self.watcher.changed.connect(self.on_external_changes)
+        self.window.sort_combo.currentIndexChanged.connect(
+            lambda i: self.set_sort_order(SORT_ORDERS[i]))
 
     def on_text_changed(self):
-        self.auto_save_timer.stop()
-        self.auto_save_timer.start()
+        if self.read_only or not hasattr(self, 'current_filename'):
+            return
+        self.autosave.note_changed(self.window.editor.document().characterCount())
+
+    def lock_vault(self, requested=False):
+        # Drops the key and every decrypted note from memory, keeping the note list, index
+        # and which note was open, so unlocking only has to derive the key again.
+        # `requested`: the user asked for it, rather than the idle timer
+        if self.locked or self.key is None:
+            return
+        tasks = (("import", self.import_thread), ("export", self.export_thread), ("backup", self.backup_thread),
+                 ("history cleanup", self.history_thread), ("integrity check", self.check_thread),
+                 ("note upgrade", self.upgrade_thread))
+        running = [name for name, thread in tasks if thread]
+        if running or QApplication.activeModalWidget() is not None:
+            # Never pull the key from under a running task or an open dialog
+            if requested:
+                waiting_for = f"the {running[0]} finishes" if running else "the open dialog is closed"
+                self.window.show_status(f"Locking as soon as {waiting_for}...", 0)
+                self.lock_retry_timer.start()
+            else:
+                self.idle_monitor.start()
+            return
+        self.lock_retry_timer.stop()
+        editor = self.window.editor
+        self.auto_save()
+        if hasattr(self, 'current_filename') and editor.document().isModified() and not self.read_only:
+            self.dialogs.notify("Not locked: the open note could not be saved.", 5000)
+            self.idle_monitor.start()
+            return
+        self.flush_index()
+        self.index_flush_timer.stop()
+        self.history_prune_timer.stop()
+        self.lock_state = None
+        if hasattr(self, 'current_filename'):
+            self.lock_state = (self.current_filename, editor.textCursor().position(),
+                               editor.verticalScrollBar().value())
+        # Clearing the documents also drops the decrypted images Qt cached for them
+        self.disable_text_edit()
+        editor.document().clear()
+        if hasattr(self, 'history_dialog'):
+            self.history_dialog.preview.clear()
+        # Changes made meanwhile are picked up by one scan after unlocking
+        self.watcher.suspend()
+        encryption.wipe(self.key)
+        self.key = None
+        self.password_verified = False
+        self.locked = True
+        self.window.hide()
+        QTimer.singleShot(0, self.unlock_vault)
+
+    def unlock_vault(self):
+        if not self.login_dialog("Notes Locked"):
+            self.app.quit()
+            return
+        self.locked = False
+        self.window.show()
+        self.watcher.resume()
+        state, self.lock_state = self.lock_state, None
+        if state and self._find_note_row(state[0]) >= 0:
+            filename, position, scroll = state
+            self.select_note_in_list(filename)
+            editor = self.window.editor
+            cursor = editor.textCursor()
+            cursor.setPosition(min(position, editor.document().characterCount() - 1))
+            editor.setTextCursor(cursor)
+            editor.verticalScrollBar().setValue(scroll)
+        self.watcher.scan()
+        if self.history_pending:
+            self.history_prune_timer.start()
+        self.idle_monitor.start()
+
+    def flush_autosave(self):
+        # Save pending edits now, e.g. before another note replaces them in the editor
+        if self.autosave.pending:
+            self.autosave.cancel()
+            self.auto_save()
 
     def auto_save(self):
-        if not hasattr(self, 'current_filename'):
+        if self.read_only or not hasattr(self, 'current_filename'):
             return
-        content = self.window.text_edit.toHtml()
-        if content != self.last_saved_content:
+        # The modified flag is cleared on load/save (and by undoing back to that state), so
+        # an unchanged note costs no serialisation here
+        if self.window.editor.document().isModified():
             self.save_current_note(auto=True)
 
+    def _is_dirty(self):
+        if not hasattr(self, 'current_filename'):
+            return False
+        if self.window.large_mode:
+            # Hashing megabytes on every check isn't worth it; undoing back to the saved
+            # state clears the flag too
+            return self.window.plain_edit.document().isModified()
+        return self._content_hash(self._editor_html()) != self.last_saved_hash
+
+    def on_external_changes(self, added, removed, modified):
+        current = getattr(self, 'current_filename', None)
+        for fname in removed:
+            if fname == current:
+                if self._is_dirty():
+                    # Keep the entry; the next save recreates the file
+                    self.dialogs.notify("Open note was deleted on disk; saving will restore it.", 5000)
+                    continue
+                self.disable_text_edit()
+            self._remove_note_entry(fname)
+            self.index.remove(fname)
+        # Only the changed files are read; all but the open note just for their header
+        for fname in added + modified:
+            try:
+                if fname == current:
+                    decrypted = self._read_note_file(fname)
+                    header = {'title': note_title(decrypted)}
+                else:
+                    header = read_header(self.storage, self.key, fname)
+            except Exception:
+                continue
+            title = header['title']
+            self._index_note(fname, title, header.get('modified'), header.get('created'))
+            self._upsert_note_entry(fname, title)
+            if fname == current:
+                self._merge_external_edit(decrypted)
+        self.schedule_index_flush()
+
+    def _merge_external_edit(self, decrypted):
+        disk_hash = self._content_hash(decrypted)
+        if disk_hash == self.current_disk_hash:
+            return
+        if self._is_dirty():
+            reload = self.dialogs.confirm(
+                "Note Changed on Disk",
+                "This note was changed outside the app.\n\nReload it and discard your unsaved edits?",
+                confirm_text="Reload")
+            if not reload:
+                # Keep local edits; the next save deliberately overwrites the external version
+                self.current_disk_hash = disk_hash
+                return
+        self.autosave.cancel()
+        if self.window.large_mode:
+            self._show_large_note(self.current_filename, text_chunks(self._note_body(decrypted)))
+        else:
+            self._set_editor_html(self._note_body(decrypted))
+            self.last_saved_hash = self._content_hash(self._editor_html())
+            self.window.text_edit.document().setModified(False)
+        self.current_disk_hash = disk_hash
+        row = self._find_note_row(self.current_filename)
+        if row >= 0:
+            self.window.list_widget.setCurrentRow(row)
+        self.dialogs.notify("Note reloaded from disk.")
+
+def load_settings(path=CONFIG_FILE):
+    settings = Settings(path)
+    for problem in settings.problems:
+        print(f"{path}: {problem}", file=sys.stderr)
+    return settings
+
+def migrate_storage(target_kind):
+    # Headless: move every note to another storage backend and switch the config over
+    config = load_settings()
+    if config.damaged:
+        # The switch couldn't be recorded, leaving the notes where the config doesn't look
+        print(f"{CONFIG_FILE} is damaged; fix or restore it before migrating.")
+        return 1
+    if not config.configured:
+        print("No vault configured yet; nothing to migrate.")
+        return 1
+    source_kind = config.get('storage', 'directory')
+    if source_kind == target_kind:
+        print(f"Vault already uses the {target_kind} backend.")
+        return 0
+    lock = VaultLock(LOCK_FILE)
+    if not lock.acquire():
+        print("The vault is open in another instance; close it before migrating.")
+        return 1
+    try:
+        source = open_backend(source_kind, NOTES_DIR, VAULT_DB)
+        target = open_backend(target_kind, NOTES_DIR, VAULT_DB)
+        copied = migrate(source, target, progress=lambda done, total: print(f"\r{done}/{total} notes", end=''))
+        print()
+        source.close()
+        target.close()
+        config['storage'] = target_kind
+        config.save()
+        print(f"Migrated {copied} notes from {source_kind} to {target_kind}. The {source_kind} data was left in place.")
+        return 0
+    finally:
+        lock.release()
+
+def unlock_headless(config):
+    if config.damaged:
+        # Every password would be rejected and count against the backoff
+        print(f"{CONFIG_FILE} is damaged: {'; '.join(config.problems)}. Fix or restore it first.")
+        return None
+    throttle = verification.LoginThrottle(LOGIN_STATE_FILE)
+    wait = throttle.remaining()
+    if wait > 0:
+        print(f"Wrong password too many times. Try again in {int(wait) + 1} s.")
+        return None
+    password = getpass.getpass("Password: ")
+    key = verification.unlock(config, password) if password else None
+    if key is None:
+        if password:
+            throttle.failed()
+        print("Password incorrect.")
+        return None
+    throttle.succeeded()
+    return key
+
+def import_headless(folder, workers=None):
+    config = load_settings()
+    if not config.configured:
+        print("No vault configured yet; launch the app once to set a password.")
+        return 1
+    key = unlock_headless(config)
+    if key is None:
+        return 1
+    lock = VaultLock(LOCK_FILE)
+    if not lock.acquire():
+        print("The vault is open in another instance; close it before importing.")
+        return 1
+    storage = open_backend(config.get('storage', 'directory'), NOTES_DIR, VAULT_DB)
+    try:
+        index = NoteIndex(storage)
+        index.load(key)
+        result = import_folder(storage, key, folder, index=index, workers=workers,
+                               progress=lambda done, total: print(f"\r{done}/{total} files", end=''))
+        print()
+        for path, error in result['failed']:
+            print(f"Failed: {path}: {error}")
+        print(f"Imported {len(result['imported'])} notes, skipped {result['skipped']} already imported, "
+              f"{len(result['failed'])} failed.")
+        return 0 if not result['failed'] else 2
+    finally:
+        storage.close()
+        lock.release()
+
+def export_headless(path, fmt, encrypt=False):
+    config = load_settings()
+    if not config.configured:
+        print("No vault configured yet; nothing to export.")
+        return 1
+    key = unlock_headless(config)
+    if key is None:
+        return 1
+    password = None
+    if encrypt:
+        password = getpass.getpass("Export password: ")
+        if not password or password != getpass.getpass("Repeat export password: "):
+            print("Export passwords are empty or don't match.")
+            return 1
+    qt_app = None
+    if fmt != 'html':
+        # Text and Markdown are rendered through QTextDocument, which needs a GUI application
+        # for as long as the export runs (an unreferenced one is destroyed straight away)
+        from PyQt6.QtGui import QGuiApplication
+        qt_app = QGuiApplication(sys.argv[:1])
+    storage = open_backend(config.get('storage', 'directory'), NOTES_DIR, VAULT_DB)
+    try:
+        index = NoteIndex(storage)
+        index.load(key)
+        note_ids = index.sorted_ids(storage.list_notes(), 'created')
+        notes = [(note_id, index.entries.get(note_id, {}).get('title', "Untitled")) for note_id in note_ids]
+        result = export_archive(storage, key, notes, path, fmt, password,
+                                progress=lambda done, total: print(f"\r{done}/{total} notes", end=''))
+        print()
+        for note_id, error in result['failed']:
+            print(f"Failed: {note_id}: {error}")
+        print(f"Exported {result['exported']} notes to {result['path']}, {len(result['failed'])} failed.")
+        return 0 if not result['failed'] else 2
+    finally:
+        storage.close()
+        del qt_app
+
+def decrypt_export_headless(src, dst):
+    try:
+        decrypt_export(src, dst, getpass.getpass("Export password: "))
+    except Exception as e:
+        if os.path.exists(dst):
+            os.remove(dst)
+        print(f"Could not decrypt export: {str(e) or 'wrong password or corrupted file'}")
+        return 1
+    print(f"Decrypted archive written to {dst}.")
+    return 0
+
+def backup_headless(backup_dir, keep=None):
+    config = load_settings()
+    if not config.configured:
+        print("No vault configured yet; nothing to back up.")
+        return 1
+    key = unlock_headless(config)
+    if key is None:
+        return 1
+    storage = open_backend(config.get('storage', 'directory'), NOTES_DIR, VAULT_DB)
+    try:
+        result = create_snapshot(storage, key, backup_dir, CONFIG_FILE,
+                                 progress=lambda done, total: print(f"\r{done}/{total} notes", end=''))
+        print()
+        print(f"Snapshot {result['snapshot']}: {result['notes']} notes, {result['copied']} copied "
+              f"({result['bytes_copied'] / 1024:.1f} KiB), {result['reused']} unchanged.")
+        if keep:
+            snapshots, objects = prune_snapshots(backup_dir, key, keep)
+            if snapshots:
+                print(f"Pruned {snapshots} old snapshots and {objects} unreferenced notes.")
+        return 0
+    finally:
+        storage.close()
+
+def restore_headless(backup_dir, snapshot=None, note_id=None, list_only=False):
+    config = load_settings()
+    if not config.configured or config.damaged:
+        # Restoring onto a fresh install, or over a damaged config: take the one saved with the backups
+        config = load_settings(os.path.join(backup_dir, os.path.basename(CONFIG_FILE)))
+        if not config.configured or config.damaged:
+            print("No vault config here or in the backup folder.")
+            return 1
+        config.save_as(CONFIG_FILE)
+    snapshots = list_snapshots(backup_dir)
+    if not snapshots:
+        print("No snapshots found.")
+        return 1
+    key = unlock_headless(config)
+    if key is None:
+        return 1
+    if list_only:
+        for name in snapshots:
+            try:
+                print(f"{name}  {len(load_snapshot(backup_dir, key, name)['notes'])} notes")
+            except Exception:
+                print(f"{name}  (unreadable)")
+        return 0
+    snapshot = snapshot or snapshots[-1]
+    if snapshot not in snapshots:
+        print(f"No snapshot named {snapshot}.")
+        return 1
+    lock = VaultLock(LOCK_FILE)
+    if not lock.acquire():
+        print("The vault is open in another instance; close it before restoring.")
+        return 1
+    storage = open_backend(config.get('storage', 'directory'), NOTES_DIR, VAULT_DB)
+    try:
+        if note_id:
+            note_id = note_id if note_id.endswith('.enc') else note_id + '.enc'
+            restore_note(storage, key, backup_dir, snapshot, note_id)
+            print(f"Restored {note_id} from {snapshot}.")
+        else:
+            result = restore_vault(storage, key, backup_dir, snapshot,
+                                   progress=lambda done, total: print(f"\r{done}/{total} notes", end=''))
+            print()
+            print(f"Restored {snapshot}: {result['restored']} notes rewritten, {result['unchanged']} unchanged, "
+                  f"{result['removed']} newer notes removed.")
+        return 0
+    except Exception as e:
+        print(f"Restore failed: {e}")
+        return 1
+    finally:
+        storage.close()
+        lock.release()
+
+def check_headless(move_bad=False, workers=None):
+    config = load_settings()
+    if not config.configured:
+        print("No vault configured yet; nothing to check.")
+        return 1
+    key = unlock_headless(config)
+    if key is None:
+        return 1
+    lock = None
+    if move_bad:
+        lock = VaultLock(LOCK_FILE)
+        if not lock.acquire():
+            print("The vault is open in another instance; close it before quarantining.")
+            return 1
+    kind = config.get('storage', 'directory')
+    storage = open_backend(kind, NOTES_DIR, VAULT_DB)
+    try:
+        index = NoteIndex(storage)
+        index.load(key)
+        result = scan_vault(storage, key, kind, NOTES_DIR, VAULT_DB, index=index, workers=workers,
+                            progress=lambda done, total: print(f"\r{done}/{total} notes", end=''))
+        print()
+        print(format_report(result))
+        bad = [note_id for note_id, status, _detail in result['problems'] if status in QUARANTINABLE]
+        if move_bad and (bad or result['orphans']):
+            moved, failed = quarantine(storage, bad, QUARANTINE_DIR, index=index)
+            history = NoteHistory(storage)
+            for note_id in moved:
+                history.delete(note_id)
+            index.prune(storage.list_notes())
+            index.save(key)
+            print(f"Moved {len(moved)} notes to {QUARANTINE_DIR}, dropped {len(result['orphans'])} orphaned index entries.")
+            for note_id, error in failed:
+                print(f"  left in place, could not copy {note_id}: {error}")
+        if move_bad:
+            removed = sweep_attachments(storage, key, result)
+            if removed:
+                print(f"Removed {removed} images no note uses any more.")
+        return 0 if not result['problems'] else 2
+    finally:
+        storage.close()
+        if lock:
+            lock.release()
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Encrypted notepad")
+    parser.add_argument('--metrics-out', default=None, metavar='FILE',
+                        help="write hot-path timings (p50/p95, bytes) as JSON when the app exits")
+    parser.add_argument('--profile', default=os.environ.get(PROFILE_ENV_VAR), metavar='FILE',
+                        help=f"profile the whole session into FILE (.pstats: cProfile, .json: speedscope samples); "
+                             f"also ${PROFILE_ENV_VAR}")
+    commands = parser.add_subparsers(dest='command')
+    migrate_cmd = commands.add_parser('migrate', help="move all notes to another storage backend")
+    migrate_cmd.add_argument('backend', choices=BACKENDS)
+    import_cmd = commands.add_parser('import', help="import a folder of .txt/.md/.html files")
+    import_cmd.add_argument('folder')
+    import_cmd.add_argument('--workers', type=int, default=None, help="encryption processes (default: CPU count)")
+    export_cmd = commands.add_parser('export', help="stream all notes into one .zip/.tar.gz/.tar archive")
+    export_cmd.add_argument('path')
+    export_cmd.add_argument('--format', choices=tuple(EXPORT_FORMATS), default='txt')
+    export_cmd.add_argument('--encrypt', action='store_true', help="encrypt the archive with a separate export password")
+    decrypt_cmd = commands.add_parser('decrypt-export', help="decrypt an archive made with export --encrypt")
+    decrypt_cmd.add_argument('source')
+    decrypt_cmd.add_argument('destination')
+    backup_cmd = commands.add_parser('backup', help="write an incremental snapshot of the vault")
+    backup_cmd.add_argument('folder')
+    backup_cmd.add_argument('--keep', type=int, default=None, help="prune all but the newest N snapshots")
+    restore_cmd = commands.add_parser('restore', help="restore the vault (or one note) from a snapshot")
+    restore_cmd.add_argument('folder')
+    restore_cmd.add_argument('--snapshot', default=None, help="snapshot name (default: newest)")
+    restore_cmd.add_argument('--note', default=None, help="only restore this note id")
+    restore_cmd.add_argument('--list', action='store_true', help="list snapshots and exit")
+    check_cmd = commands.add_parser('check', help="verify every note and report damaged ones")
+    check_cmd.add_argument('--quarantine', action='store_true', help=f"move damaged notes to {QUARANTINE_DIR}/ and remove unused images")
+    check_cmd.add_argument('--workers', type=int, default=None, help="verification processes (default: CPU count)")
+    # Unknown arguments are left for Qt
+    return parser.parse_known_args(argv)[0]
+
 if __name__ == "__main__":
+    args = parse_args(sys.argv[1:])
+    if args.metrics_out:
+        atexit.register(metrics.dump, args.metrics_out)
+    if args.profile:
+        profiler.start(args.profile)
+        atexit.register(profiler.stop)
+    if args.command == 'migrate':
+        sys.exit(migrate_storage(args.backend))
+    if args.command == 'import':
+        sys.exit(import_headless(args.folder, args.workers))
+    if args.command == 'export':
+        sys.exit(export_headless(args.path, args.format, args.encrypt))
+    if args.command == 'decrypt-export':
+        sys.exit(decrypt_export_headless(args.source, args.destination))
+    if args.command == 'check':
+        sys.exit(check_headless(args.quarantine, args.workers))
+    if args.command == 'backup':
+        sys.exit(backup_headless(args.folder, args.keep))
+    if args.command == 'restore':
+        sys.exit(restore_headless(args.folder, args.snapshot, args.note, args.list))
     app = EncryptedNotesApp()
     app.run()
@@ -0,0 +1,104 @@
+import json
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+# In-process timers and counters for the hot paths. Every metric keeps totals plus the
+# most recent SAMPLE_LIMIT durations, which is what the percentiles are computed from,
+# so memory stays flat however long the app runs. Recording is a perf_counter pair and
+# a deque append; cheap enough to leave on all the time.
+
+SAMPLE_LIMIT = 2048
+
+_lock = threading.Lock()
+_metrics = {}
+
+
+class _Metric:
+    __slots__ = ('count', 'total', 'max', 'bytes', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.samples = deque(maxlen=SAMPLE_LIMIT)
+
+
+def record(name, seconds, nbytes=0):
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = _Metric()
+        metric.count += 1
+        metric.total += seconds
+        metric.bytes += nbytes
+        if seconds > metric.max:
+            metric.max = seconds
+        metric.samples.append(seconds)
+
+
+class _Timing:
+    __slots__ = ('nbytes',)
+
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+
+@contextmanager
+def timed(name, nbytes=0):
+    # `nbytes` can also be set on the yielded object once the size is known
+    timing = _Timing(nbytes)
+    start = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        record(name, time.perf_counter() - start, timing.nbytes)
+
+
+def instrument(name, size_of=None):
+    # Decorator; size_of(result) gives the bytes processed by one call
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = fn(*args, **kwargs)
+            record(name, time.perf_counter() - start, size_of(result) if size_of else 0)
+            return result
+        return wrapper
+    return decorate
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def summary():
+    # {name: {count, total_ms, p50_ms, p95_ms, max_ms, bytes}}
+    with _lock:
+        snapshot = {name: (m.count, m.total, m.max, m.bytes, sorted(m.samples)) for name, m in _metrics.items()}
+    return {
+        name: {
+            'count': count,
+            'total_ms': round(total * 1000, 3),
+            'p50_ms': round(_percentile(ordered, 0.50) * 1000, 3),
+            'p95_ms': round(_percentile(ordered, 0.95) * 1000, 3),
+            'max_ms': round(peak * 1000, 3),
+            'bytes': nbytes,
+        }
+        for name, (count, total, peak, nbytes, ordered) in sorted(snapshot.items())
+    }
+
+
+def reset():
+    with _lock:
+        _metrics.clear()
+
+
+def dump(path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'created': int(time.time() * 1000), 'metrics': summary()}, f, indent=2)
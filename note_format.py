@@ -0,0 +1,235 @@
+import io
+import json
+import time
+import struct
+import itertools
+
+import encryption
+from note_ids import created_ms
+from storage import note_write_lock
+
+# On-disk layout of a note. Version 2 files start with a small header that is encrypted
+# on its own:
+#   MAGIC | header length (4 bytes, big endian) | header token | body token
+# The header is JSON {title, created, modified, size}; the body is the whole note as
+# before ('# title' line + HTML). Listing a vault only has to read and decrypt the
+# headers, whatever the size of the notes.
+#
+# The header's 'format' says what the body holds: 'html' (the default, also for headers
+# without it) or 'text', plain text written by the large-document editor. A text body is
+# a run of separately encrypted chunks, each framed as length (4 bytes) + token, so it can
+# be decrypted a piece at a time while it is read. Chunk 0 is the '# title' line; every
+# chunk starts with its own index and the header holds the count, so chunks that were
+# reordered, dropped or added fail to load.
+#
+# Version 1 files are a single Fernet token of the whole note. They are still read
+# everywhere, and rewritten as version 2 on their next save or by the background upgrade.
+
+MAGIC = b'ENCNOTE2'
+_LENGTH = struct.Struct('>I')
+PREFIX_SIZE = len(MAGIC) + _LENGTH.size
+# Enough for the header of any normal title in one read
+HEADER_READ_SIZE = 1024
+
+FORMAT_HTML = 'html'
+FORMAT_TEXT = 'text'
+# Characters per chunk of a text body
+TEXT_CHUNK_CHARS = 256 * 1024
+_INDEX = struct.Struct('>I')
+
+
+def note_title(text):
+    end = text.find('\n')
+    first_line = (text if end < 0 else text[:end]).strip()
+    return first_line[1:].strip() if first_line.startswith('#') else "Untitled"
+
+
+def is_current(blob):
+    return blob.startswith(MAGIC)
+
+
+def body_format(header):
+    return header.get('format', FORMAT_HTML)
+
+
+def _pack_header(key, header):
+    header_token = encryption.encrypt_data(key, json.dumps(header, separators=(',', ':')).encode('utf-8'))
+    return MAGIC + _LENGTH.pack(len(header_token)) + header_token
+
+
+def pack_note(key, text, created=None, modified=None):
+    body = text.encode('utf-8')
+    now = int(time.time() * 1000)
+    header = {
+        'title': note_title(text),
+        'created': now if created is None else created,
+        'modified': now if modified is None else modified,
+        'size': len(body),
+    }
+    return _pack_header(key, header) + encryption.encrypt_data(key, body)
+
+
+def text_chunks(text, start=0):
+    # `text` from `start` on in TEXT_CHUNK_CHARS pieces
+    for offset in range(start, len(text), TEXT_CHUNK_CHARS):
+        yield text[offset:offset + TEXT_CHUNK_CHARS]
+
+
+def pack_text_note(key, title, chunks, created=None, modified=None):
+    # A text note whose body is the strings in `chunks`, as a list of byte strings to write
+    # one after another (see StorageBackend.write_parts)
+    frames = []
+    size = 0
+    for index, chunk in enumerate(itertools.chain([f"# {title}\n\n"], chunks)):
+        data = chunk.encode('utf-8')
+        size += len(data)
+        token = encryption.encrypt_data(key, _INDEX.pack(index) + data)
+        frames.append(_LENGTH.pack(len(token)))
+        frames.append(token)
+    now = int(time.time() * 1000)
+    header = {
+        'title': title,
+        'created': now if created is None else created,
+        'modified': now if modified is None else modified,
+        'size': size,
+        'format': FORMAT_TEXT,
+        'chunks': len(frames) // 2,
+    }
+    return [_pack_header(key, header)] + frames
+
+
+def split_tokens(blob):
+    # (header token, body token) of a version 2 note; (None, blob) for version 1
+    if not is_current(blob):
+        return None, blob
+    if len(blob) < PREFIX_SIZE:
+        raise ValueError("note header is cut short")
+    (length,) = _LENGTH.unpack_from(blob, len(MAGIC))
+    end = PREFIX_SIZE + length
+    if len(blob) < end:
+        raise ValueError("note header is cut short")
+    return blob[PREFIX_SIZE:end], blob[end:]
+
+
+def text_frames(body):
+    # The chunk tokens of a text body, split but not checked
+    frames = []
+    offset = 0
+    while offset < len(body):
+        if offset + _LENGTH.size > len(body):
+            raise ValueError("note chunk is cut short")
+        (length,) = _LENGTH.unpack_from(body, offset)
+        offset += _LENGTH.size
+        if offset + length > len(body):
+            raise ValueError("note chunk is cut short")
+        frames.append(body[offset:offset + length])
+        offset += length
+    return frames
+
+
+def unpack_note(key, blob):
+    return unpack_note_and_format(key, blob)[0]
+
+
+def unpack_note_and_format(key, blob):
+    # (text, format) of a note
+    header_token, body = split_tokens(blob)
+    if header_token is not None:
+        header = _decrypt_header(key, header_token)
+        if body_format(header) == FORMAT_TEXT:
+            return ''.join(_text_chunks(key, io.BytesIO(body), header)), FORMAT_TEXT
+    return encryption.decrypt_data(key, body).decode('utf-8'), FORMAT_HTML
+
+
+def _read_exact(stream, size):
+    data = stream.read(size)
+    if len(data) != size:
+        raise ValueError("note is cut short")
+    return data
+
+
+def _text_chunks(key, stream, header):
+    for index in range(header['chunks']):
+        (length,) = _LENGTH.unpack(_read_exact(stream, _LENGTH.size))
+        data = encryption.decrypt_data(key, _read_exact(stream, length))
+        if _INDEX.unpack_from(data)[0] != index:
+            raise ValueError("note chunks are out of order")
+        yield data[_INDEX.size:].decode('utf-8')
+    if stream.read(1):
+        raise ValueError("unexpected data after the last chunk")
+
+
+def open_note(key, stream):
+    # (header, iterator over the note's text) from a file-like object. Text notes are read
+    # and decrypted a chunk at a time as the iterator is consumed; other notes come as a
+    # single piece. Version 1 notes get a header with only the format set.
+    magic = stream.read(len(MAGIC))
+    if magic != MAGIC:
+        text = encryption.decrypt_data(key, magic + stream.read()).decode('utf-8')
+        return {'format': FORMAT_HTML}, iter([text])
+    (length,) = _LENGTH.unpack(_read_exact(stream, _LENGTH.size))
+    header = _decrypt_header(key, _read_exact(stream, length))
+    if body_format(header) == FORMAT_TEXT:
+        return header, _text_chunks(key, stream, header)
+    return header, iter([encryption.decrypt_data(key, stream.read()).decode('utf-8')])
+
+
+def _decrypt_header(key, token):
+    header = json.loads(encryption.decrypt_data(key, token).decode('utf-8'))
+    if not isinstance(header, dict) or not isinstance(header.get('title'), str):
+        raise ValueError("malformed note header")
+    return header
+
+
+def read_header(storage, key, note_id):
+    # The header of a note, reading only the start of a version 2 file. Version 1 notes
+    # are decrypted in full and get a header with only the title (and size) set.
+    prefix = storage.read_prefix(note_id, HEADER_READ_SIZE)
+    if is_current(prefix):
+        if len(prefix) >= PREFIX_SIZE:
+            (length,) = _LENGTH.unpack_from(prefix, len(MAGIC))
+            if len(prefix) < PREFIX_SIZE + length:
+                prefix = storage.read_prefix(note_id, PREFIX_SIZE + length)
+        return _decrypt_header(key, split_tokens(prefix)[0])
+    plaintext = encryption.decrypt_data(key, storage.read(note_id))
+    # Only the first line is decoded; the rest of the plaintext is dropped right away
+    end = plaintext.find(b'\n')
+    title = note_title(plaintext[:end if end >= 0 else len(plaintext)].decode('utf-8'))
+    return {'title': title, 'created': None, 'modified': None, 'size': len(plaintext)}
+
+
+def upgrade_notes(storage, key, times, skip=(), progress=None, should_stop=None):
+    # Rewrites version 1 notes as version 2, keeping their content and times. `times` maps
+    # note id -> (created, modified) in ms, e.g. from the title index. Returns
+    # [(note_id, stamp, header)] for the notes rewritten.
+    upgraded = []
+    note_ids = sorted(storage.list_notes())
+    for done, note_id in enumerate(note_ids, 1):
+        if should_stop and should_stop():
+            break
+        if progress:
+            progress(done, len(note_ids))
+        if note_id in skip:
+            continue
+        try:
+            if is_current(storage.read_prefix(note_id, len(MAGIC))):
+                continue
+            stamp = storage.stamp(note_id)
+            text = encryption.decrypt_data(key, storage.read(note_id)).decode('utf-8')
+        except Exception:
+            # Unreadable notes are for the integrity check, not for us
+            continue
+        created, modified = times.get(note_id, (None, None))
+        if created is None:
+            created = created_ms(note_id)
+        if modified is None and stamp is not None:
+            modified = stamp[0] // 1_000_000
+        blob = pack_note(key, text, created, modified)
+        with note_write_lock:
+            # A save may have got in since the note was read; it wins
+            if storage.stamp(note_id) != stamp:
+                continue
+            storage.write(note_id, blob)
+        header = {'title': note_title(text), 'created': created, 'modified': modified}
+        upgraded.append((note_id, storage.stamp(note_id), header))
+    return upgraded
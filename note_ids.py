@@ -0,0 +1,62 @@
+import time
+import secrets
+import datetime
+
+# ULID-style note ids: 48-bit millisecond timestamp + 80 random bits from `secrets`,
+# Crockford base32 encoded to 26 characters. Ids sort lexicographically by creation
+# time, and ids made within the same millisecond by this process stay ordered.
+
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_DECODE = {c: i for i, c in enumerate(_ALPHABET)}
+_RANDOM_BITS = 80
+
+_last_ms = -1
+_last_random = 0
+
+
+def _encode(value, length):
+    chars = []
+    for _ in range(length):
+        chars.append(_ALPHABET[value & 31])
+        value >>= 5
+    return ''.join(reversed(chars))
+
+
+def new_note_id(now_ms=None):
+    global _last_ms, _last_random
+    ms = int(time.time() * 1000) if now_ms is None else now_ms
+    if ms <= _last_ms:
+        # Same (or earlier, if the clock stepped back) millisecond: keep monotonic order
+        ms = _last_ms
+        rand = _last_random + 1
+        if rand >> _RANDOM_BITS:
+            ms += 1
+            rand = secrets.randbits(_RANDOM_BITS)
+    else:
+        rand = secrets.randbits(_RANDOM_BITS)
+    _last_ms, _last_random = ms, rand
+    return _encode(ms, 10) + _encode(rand, 16)
+
+
+def new_note_filename(exists=None):
+    # `exists(filename)` lets the caller rule out collisions with stored notes
+    while True:
+        filename = f"{new_note_id()}.enc"
+        if exists is None or not exists(filename):
+            return filename
+
+
+def created_ms(note_id):
+    # Creation time encoded in the id, in ms; None if the id carries none
+    stem = note_id[:-4] if note_id.endswith('.enc') else note_id
+    if len(stem) == 26 and all(c in _DECODE for c in stem):
+        ms = 0
+        for c in stem[:10]:
+            ms = (ms << 5) | _DECODE[c]
+        return ms
+    # Legacy `YYYYMMDD_random` names only carry the day
+    try:
+        day = datetime.datetime.strptime(stem.split('_', 1)[0], "%Y%m%d")
+    except ValueError:
+        return None
+    return int(day.timestamp() * 1000)
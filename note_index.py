@@ -0,0 +1,112 @@
+import json
+
+import encryption
+from note_ids import created_ms
+
+# Encrypted title index shared by every instance opened on the same vault. Entries are
+# keyed by note id and carry the storage stamp the title was read at, so a note only
+# needs decrypting again when it has changed since. The blob lives in the storage
+# backend's metadata area.
+#
+# Entries also record created/modified times (ms), so the note list can be ordered
+# without statting or decrypting anything.
+
+INDEX_VERSION = 2
+SORT_ORDERS = ('modified', 'created', 'title')
+
+
+class NoteRecord:
+    # One row of the note list. Slots instead of a dict per note: on a large vault the
+    # list is kept for the whole session, and the title is the index entry's own string.
+    __slots__ = ('filename', 'title')
+
+    def __init__(self, filename, title):
+        self.filename = filename
+        self.title = title
+
+
+class NoteIndex:
+    def __init__(self, storage):
+        self.storage = storage
+        self.entries = {}
+        self.dirty = False
+
+    def load(self, key, data=None):
+        # A missing or unreadable index only costs a full scan, never an error. `data` is
+        # the encrypted index if the caller has already read it.
+        self.entries = {}
+        self.dirty = False
+        try:
+            payload = encryption.decrypt_data(key, data if data is not None else self.storage.read_meta('index'))
+            data = json.loads(payload.decode('utf-8'))
+        except Exception:
+            return False
+        version = data.get('version')
+        if version not in (1, INDEX_VERSION):
+            return False
+        self.entries = data.get('entries', {})
+        if version == 1:
+            # v1 had no timestamps; derive them once from the id and stamp
+            for fname, entry in self.entries.items():
+                self._fill_times(fname, entry)
+            self.dirty = True
+        return True
+
+    def save(self, key):
+        payload = json.dumps({'version': INDEX_VERSION, 'entries': self.entries}, separators=(',', ':'))
+        enc_data = encryption.encrypt_data(key, payload.encode('utf-8'))
+        self.storage.write_meta('index', enc_data)
+        self.dirty = False
+
+    def lookup(self, fname, stamp):
+        entry = self.entries.get(fname)
+        if entry is None or (entry['mtime'], entry['size']) != tuple(stamp):
+            return None
+        return entry['title']
+
+    @staticmethod
+    def _fill_times(fname, entry):
+        stamp_ms = entry['mtime'] // 1_000_000
+        entry.setdefault('modified', stamp_ms)
+        if entry.get('created') is None:
+            created = created_ms(fname)
+            entry['created'] = created if created is not None else stamp_ms
+
+    def update(self, fname, title, stamp, modified=None, created=None):
+        # `modified` (ms) is passed for local saves and read from note headers; otherwise an
+        # existing entry keeps its time unless the stamp moved, in which case the storage
+        # mtime is used
+        old = self.entries.get(fname)
+        entry = {'title': title, 'mtime': stamp[0], 'size': stamp[1]}
+        if modified is not None:
+            entry['modified'] = modified
+        elif old is not None and (old['mtime'], old['size']) == tuple(stamp):
+            entry['modified'] = old['modified']
+        if created is not None:
+            entry['created'] = created
+        elif old is not None:
+            entry['created'] = old['created']
+        self._fill_times(fname, entry)
+        if old != entry:
+            self.entries[fname] = entry
+            self.dirty = True
+
+    def sort_key(self, fname, order):
+        entry = self.entries.get(fname)
+        if entry is None:
+            return (0, '', fname)
+        if order == 'title':
+            return (0, entry['title'].casefold(), fname)
+        # Newest first for time orders
+        return (-entry[order], '', fname)
+
+    def sorted_ids(self, fnames, order='modified'):
+        return sorted(fnames, key=lambda fname: self.sort_key(fname, order))
+
+    def remove(self, fname):
+        if self.entries.pop(fname, None) is not None:
+            self.dirty = True
+
+    def prune(self, existing):
+        for fname in [f for f in self.entries if f not in existing]:
+            self.remove(fname)
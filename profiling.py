@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+
+# Opt-in profiling of the UI thread. Two recorders, picked by output file name:
+#   *.pstats / *.prof  -> cProfile (deterministic), open with pstats, snakeviz, etc.
+#   *.json             -> sampling profile in speedscope's format (https://speedscope.app)
+# The sampler runs in its own thread and only looks at the thread that started it, so it
+# records what the Qt event loop and our handlers were doing, at a fixed low overhead.
+
+ENV_VAR = 'NOTES_PROFILE'
+DEFAULT_DIR = 'profiles'
+SAMPLE_INTERVAL = 0.001
+
+
+class _Sampler:
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.target = threading.get_ident()
+        self.frames = []
+        self.frame_ids = {}
+        self.samples = []
+        self.weights = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _frame_id(self, code):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        frame_id = self.frame_ids.get(key)
+        if frame_id is None:
+            frame_id = self.frame_ids[key] = len(self.frames)
+            self.frames.append({'name': code.co_name, 'file': code.co_filename, 'line': code.co_firstlineno})
+        return frame_id
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            now = time.perf_counter()
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.samples.append(stack)
+            self.weights.append(now - last)
+            last = now
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self.started
+
+    def write(self, path):
+        profile = {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': self.frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': 'UI thread',
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': self.elapsed,
+                'samples': self.samples,
+                'weights': self.weights,
+            }],
+            'exporter': 'encrypted-notepad',
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(profile, f)
+
+
+class Profiler:
+    def __init__(self):
+        self.path = None
+        self._recorder = None
+
+    @property
+    def active(self):
+        return self._recorder is not None
+
+    @staticmethod
+    def default_path(extension='.pstats'):
+        return os.path.join(DEFAULT_DIR, f"profile-{time.strftime('%Y%m%d-%H%M%S')}{extension}")
+
+    def start(self, path):
+        # Profiles the calling thread until stop()
+        if self.active:
+            return
+        self.path = path
+        if path.lower().endswith('.json'):
+            self._recorder = _Sampler()
+            self._recorder.start()
+        else:
+            self._recorder = cProfile.Profile()
+            self._recorder.enable()
+
+    def stop(self):
+        # Writes the profile and returns its path (None if nothing was running)
+        if not self.active:
+            return None
+        recorder, self._recorder = self._recorder, None
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if isinstance(recorder, _Sampler):
+            recorder.stop()
+            recorder.write(self.path)
+        else:
+            recorder.disable()
+            recorder.dump_stats(self.path)
+        return self.path
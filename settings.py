@@ -0,0 +1,199 @@
+import os
+import json
+from collections.abc import MutableMapping
+
+from storage import BACKENDS
+from history import DEFAULT_POLICY as HISTORY_POLICY
+from autosave import DEFAULT_POLICY as AUTOSAVE_POLICY
+from autolock import DEFAULT_POLICY as AUTOLOCK_POLICY
+from large_notes import DEFAULT_POLICY as LARGE_NOTE_POLICY
+
+# The app settings (config.json). The file is parsed and validated once, when a Settings
+# is created; from then on the in-memory copy is what the app reads, and save() writes it
+# back atomically (temporary file + rename), so a crash mid-save leaves the old file
+# rather than a truncated one that would look like a fresh install.
+#
+# The file carries a "version". Older files are brought up to date by MIGRATIONS when
+# loaded and written in the new format on the next save. Entries that fail validation are
+# dropped (the app falls back to its defaults) and listed in `problems`; keys this version
+# doesn't know are kept untouched, so settings from a newer app survive an older one.
+#
+# The password entries are the exception: without them every note is unreadable, and
+# falling back to "no password set yet" would let a new one be set over the old salt. A
+# bad or incomplete set marks the settings damaged instead, and is kept as it is.
+
+SETTINGS_VERSION = 2
+CREDENTIALS = ('salt', 'verifier', 'hash')
+
+
+def _text(value):
+    return isinstance(value, str) and value != ''
+
+
+def _choice(*options):
+    return lambda value: value in options
+
+
+def _policy(defaults):
+    # A partial override of one of the DEFAULT_POLICY dicts: known keys, numbers >= 0
+    def check(value):
+        return isinstance(value, dict) and all(
+            name in defaults and isinstance(number, (int, float)) and not isinstance(number, bool) and number >= 0
+            for name, number in value.items())
+    return check
+
+
+def _integers(value, count=None):
+    return isinstance(value, list) and (count is None or len(value) == count) and all(
+        isinstance(number, int) and not isinstance(number, bool) for number in value)
+
+
+def _window_state(value):
+    # MainWindowUI.save_state()
+    if not isinstance(value, dict) or not set(value) <= {'scale', 'geometry', 'splitter'}:
+        return False
+    scale = value.get('scale', 100)
+    geometry = value.get('geometry', [0, 0, 1, 1])
+    splitter = value.get('splitter', [])
+    return (isinstance(scale, int) and not isinstance(scale, bool) and 80 <= scale <= 300
+            and _integers(geometry, 4) and min(geometry[2:]) > 0
+            and _integers(splitter) and all(size >= 0 for size in splitter))
+
+
+SCHEMA = {
+    'salt': _text,
+    'verifier': _text,
+    # Older configs kept the key itself here; replaced by 'verifier' on the next unlock
+    'hash': _text,
+    'storage': _choice(*BACKENDS),
+    'backup_dir': _text,
+    'history': _policy(HISTORY_POLICY),
+    'autosave': _policy(AUTOSAVE_POLICY),
+    'autolock': _policy(AUTOLOCK_POLICY),
+    'large_notes': _policy(LARGE_NOTE_POLICY),
+    'window': _window_state,
+    # The note open when the app was last closed
+    'last_note': _text,
+}
+
+
+def _from_v1(data):
+    # Version 1 is the unversioned file written by encryption.save_config; its entries
+    # carried over unchanged
+    return data
+
+
+# version -> function turning that version's entries into the next version's
+MIGRATIONS = {
+    1: _from_v1,
+}
+
+
+class Settings(MutableMapping):
+    def __init__(self, path):
+        self.path = path
+        self.problems = []
+        self.version = SETTINGS_VERSION
+        self.dirty = False
+        # The file exists but couldn't be parsed; saving over it would lose the salt
+        self.damaged = False
+        self._values = {}
+        data = self._read()
+        if data is not None:
+            self._values = self._upgrade(data)
+            for name in [name for name in self._values if name in SCHEMA and not SCHEMA[name](self._values[name])]:
+                if name in CREDENTIALS:
+                    # Not echoed: older configs keep the key itself in 'hash'
+                    self.problems.append(f"invalid {name!r}")
+                    self.damaged = True
+                else:
+                    self.problems.append(f"ignoring invalid {name!r}: {self._values.pop(name)!r}")
+            has_salt = 'salt' in self._values
+            if has_salt != ('verifier' in self._values or 'hash' in self._values):
+                self.problems.append("password salt without a verifier" if has_salt else "password verifier without a salt")
+                self.damaged = True
+
+    @property
+    def configured(self):
+        # A password has been set
+        return 'salt' in self._values
+
+    def __getitem__(self, name):
+        return self._values[name]
+
+    def __setitem__(self, name, value):
+        if name == 'version' or (name in SCHEMA and not SCHEMA[name](value)):
+            raise ValueError(f"invalid setting {name!r}: {value!r}")
+        if self._values.get(name, object()) != value:
+            self._values[name] = value
+            self.dirty = True
+
+    def __delitem__(self, name):
+        del self._values[name]
+        self.dirty = True
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def save(self):
+        # Writes the settings if anything changed since they were loaded or last saved.
+        # Damaged settings are never written over: that would lose what's left of them.
+        if not self.dirty or self.damaged:
+            return False
+        self._write(self.path)
+        self.dirty = False
+        return True
+
+    def save_as(self, path):
+        self._write(path)
+        self.path = path
+        self.dirty = False
+
+    def _read(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                text = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            self.problems.append(f"could not read: {e}")
+            self.damaged = True
+            return None
+        if not text.strip():
+            return None
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            self.problems.append(f"not valid JSON: {e}")
+            self.damaged = True
+            return None
+        if not isinstance(data, dict):
+            self.problems.append("not a JSON object")
+            self.damaged = True
+            return None
+        return data
+
+    def _upgrade(self, data):
+        version = data.pop('version', 1)
+        if not isinstance(version, int) or version < 1:
+            self.problems.append(f"unknown version {version!r}, read as version 1")
+            version = 1
+        while version in MIGRATIONS:
+            data = MIGRATIONS[version](data)
+            version += 1
+            self.dirty = True
+        # A newer file keeps its version, so its own migrations don't run twice
+        self.version = max(version, SETTINGS_VERSION)
+        return data
+
+    def _write(self, path):
+        data = dict(self._values, version=self.version)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
@@ -0,0 +1,354 @@
+import io
+import os
+import time
+import sqlite3
+import threading
+
+# Storage backends hold opaque encrypted blobs keyed by note id, plus a few named
+# metadata blobs (e.g. the encrypted title index). Encryption stays in the caller, so
+# moving notes between backends never needs the password to re-encrypt anything.
+#
+# Attachments (e.g. pasted images) are further opaque blobs, named by the caller's
+# content hash and never rewritten once stored.
+#
+# A stamp is a (mtime_ns, size) tuple that changes whenever a note is rewritten; it
+# is what the watcher and the index compare instead of decrypting.
+
+# Held by the UI save path and by background rewrites of existing notes (the format
+# upgrade), so a rewrite can check that a note is unchanged and replace it in one step
+note_write_lock = threading.RLock()
+
+
+class StorageBackend:
+    name = None
+
+    def list_notes(self):
+        # {note_id: stamp}
+        raise NotImplementedError
+
+    def stamp(self, note_id):
+        raise NotImplementedError
+
+    def read(self, note_id):
+        raise NotImplementedError
+
+    def read_prefix(self, note_id, size):
+        # The first `size` bytes of a note (fewer if it is shorter)
+        return self.read(note_id)[:size]
+
+    def read_stream(self, note_id):
+        # A binary file-like object over a note, for readers that consume it in pieces
+        return io.BytesIO(self.read(note_id))
+
+    def write(self, note_id, data):
+        raise NotImplementedError
+
+    def write_parts(self, note_id, parts):
+        # Writes the concatenation of the byte strings in `parts`
+        self.write(note_id, b''.join(parts))
+
+    def write_many(self, items):
+        for note_id, data in items:
+            self.write(note_id, data)
+
+    def delete(self, note_id):
+        raise NotImplementedError
+
+    def read_meta(self, name):
+        raise NotImplementedError
+
+    def write_meta(self, name, data):
+        raise NotImplementedError
+
+    def delete_meta(self, name):
+        raise NotImplementedError
+
+    def list_meta(self):
+        raise NotImplementedError
+
+    def has_attachment(self, name):
+        raise NotImplementedError
+
+    def read_attachment(self, name):
+        raise NotImplementedError
+
+    def write_attachment(self, name, data):
+        raise NotImplementedError
+
+    def delete_attachment(self, name):
+        raise NotImplementedError
+
+    def list_attachments(self):
+        raise NotImplementedError
+
+    def watch_paths(self):
+        # Filesystem paths whose change events may mean the vault changed
+        return []
+
+    def note_path(self, note_id):
+        # File holding a single note, if the backend has one
+        return None
+
+    def close(self):
+        pass
+
+
+class DirectoryBackend(StorageBackend):
+    # One `<id>` file per note in a folder; the historical layout
+    name = 'directory'
+
+    def __init__(self, notes_dir):
+        self.notes_dir = notes_dir
+        os.makedirs(notes_dir, exist_ok=True)
+        # Beside the notes folder rather than in it, so listing notes never walks them
+        self.attachments_dir = os.path.join(os.path.dirname(os.path.abspath(notes_dir)), 'attachments')
+
+    def list_notes(self):
+        notes = {}
+        with os.scandir(self.notes_dir) as it:
+            for entry in it:
+                if entry.name.endswith('.enc') and entry.is_file():
+                    st = entry.stat()
+                    notes[entry.name] = (st.st_mtime_ns, st.st_size)
+        return notes
+
+    def stamp(self, note_id):
+        try:
+            st = os.stat(os.path.join(self.notes_dir, note_id))
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def read(self, note_id):
+        with open(os.path.join(self.notes_dir, note_id), 'rb') as f:
+            return f.read()
+
+    def read_prefix(self, note_id, size):
+        with open(os.path.join(self.notes_dir, note_id), 'rb') as f:
+            return f.read(size)
+
+    def read_stream(self, note_id):
+        return open(os.path.join(self.notes_dir, note_id), 'rb')
+
+    def write(self, note_id, data):
+        self.write_parts(note_id, [data])
+
+    def write_parts(self, note_id, parts):
+        # Straight to a temporary file, without joining a large note in memory first, then
+        # renamed over the note: a crash mid-write or a concurrent reader never sees half a
+        # note
+        path = os.path.join(self.notes_dir, note_id)
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                f.writelines(parts)
+                f.flush()
+                os.fsync(f.fileno())
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        os.replace(tmp, path)
+
+    def delete(self, note_id):
+        path = os.path.join(self.notes_dir, note_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _meta_path(self, name):
+        return os.path.join(self.notes_dir, f"{name}.dat")
+
+    def read_meta(self, name):
+        try:
+            with open(self._meta_path(name), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def write_meta(self, name, data):
+        path = self._meta_path(name)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def delete_meta(self, name):
+        try:
+            os.remove(self._meta_path(name))
+        except FileNotFoundError:
+            pass
+
+    def list_meta(self):
+        return sorted(name[:-len('.dat')] for name in os.listdir(self.notes_dir) if name.endswith('.dat'))
+
+    def has_attachment(self, name):
+        return os.path.exists(os.path.join(self.attachments_dir, name))
+
+    def read_attachment(self, name):
+        with open(os.path.join(self.attachments_dir, name), 'rb') as f:
+            return f.read()
+
+    def write_attachment(self, name, data):
+        os.makedirs(self.attachments_dir, exist_ok=True)
+        path = os.path.join(self.attachments_dir, name)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def delete_attachment(self, name):
+        try:
+            os.remove(os.path.join(self.attachments_dir, name))
+        except FileNotFoundError:
+            pass
+
+    def list_attachments(self):
+        try:
+            return sorted(name for name in os.listdir(self.attachments_dir) if not name.endswith('.tmp'))
+        except FileNotFoundError:
+            return []
+
+    def watch_paths(self):
+        return [self.notes_dir]
+
+    def note_path(self, note_id):
+        return os.path.join(self.notes_dir, note_id)
+
+
+class SQLiteBackend(StorageBackend):
+    # Every note and metadata blob in one SQLite file. Listing is a single indexed
+    # query instead of a directory walk, and small notes don't each waste a disk block.
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS notes ("
+            "id TEXT PRIMARY KEY, data BLOB NOT NULL, mtime INTEGER NOT NULL, size INTEGER NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, data BLOB NOT NULL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS attachments (name TEXT PRIMARY KEY, data BLOB NOT NULL)")
+        self.conn.commit()
+
+    def list_notes(self):
+        return {row[0]: (row[1], row[2]) for row in self.conn.execute("SELECT id, mtime, size FROM notes")}
+
+    def stamp(self, note_id):
+        row = self.conn.execute("SELECT mtime, size FROM notes WHERE id = ?", (note_id,)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def read(self, note_id):
+        row = self.conn.execute("SELECT data FROM notes WHERE id = ?", (note_id,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(note_id)
+        return row[0]
+
+    def read_prefix(self, note_id, size):
+        row = self.conn.execute("SELECT substr(data, 1, ?) FROM notes WHERE id = ?", (size, note_id)).fetchone()
+        if row is None:
+            raise FileNotFoundError(note_id)
+        return bytes(row[0])
+
+    def read_stream(self, note_id):
+        if not hasattr(self.conn, 'blobopen'):
+            # Incremental blob reads need Python 3.11
+            return super().read_stream(note_id)
+        row = self.conn.execute("SELECT rowid FROM notes WHERE id = ?", (note_id,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(note_id)
+        return self.conn.blobopen('notes', 'data', row[0], readonly=True)
+
+    def write(self, note_id, data):
+        self.write_many([(note_id, data)])
+
+    def write_many(self, items):
+        # One transaction for the whole batch
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO notes (id, data, mtime, size) VALUES (?, ?, ?, ?)",
+                [(note_id, data, time.time_ns(), len(data)) for note_id, data in items])
+
+    def delete(self, note_id):
+        with self.conn:
+            self.conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
+
+    def read_meta(self, name):
+        row = self.conn.execute("SELECT data FROM meta WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def write_meta(self, name, data):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (name, data) VALUES (?, ?)", (name, data))
+
+    def delete_meta(self, name):
+        with self.conn:
+            self.conn.execute("DELETE FROM meta WHERE name = ?", (name,))
+
+    def list_meta(self):
+        return [row[0] for row in self.conn.execute("SELECT name FROM meta ORDER BY name")]
+
+    def has_attachment(self, name):
+        return self.conn.execute("SELECT 1 FROM attachments WHERE name = ?", (name,)).fetchone() is not None
+
+    def read_attachment(self, name):
+        row = self.conn.execute("SELECT data FROM attachments WHERE name = ?", (name,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(name)
+        return row[0]
+
+    def write_attachment(self, name, data):
+        with self.conn:
+            self.conn.execute("INSERT OR IGNORE INTO attachments (name, data) VALUES (?, ?)", (name, data))
+
+    def delete_attachment(self, name):
+        with self.conn:
+            self.conn.execute("DELETE FROM attachments WHERE name = ?", (name,))
+
+    def list_attachments(self):
+        return [row[0] for row in self.conn.execute("SELECT name FROM attachments ORDER BY name")]
+
+    def watch_paths(self):
+        return [self.path]
+
+    def close(self):
+        self.conn.close()
+
+
+BACKENDS = ('directory', 'sqlite')
+
+
+def open_backend(kind, notes_dir, db_path):
+    if kind == 'sqlite':
+        return SQLiteBackend(db_path)
+    if kind == 'directory':
+        return DirectoryBackend(notes_dir)
+    raise ValueError(f"Unknown storage backend: {kind}")
+
+
+def migrate(source, target, batch_size=500, progress=None):
+    # Copies ciphertext as-is (no password needed); returns the number of notes copied
+    note_ids = sorted(source.list_notes())
+    batch = []
+    copied = 0
+    for note_id in note_ids:
+        batch.append((note_id, source.read(note_id)))
+        if len(batch) >= batch_size:
+            target.write_many(batch)
+            copied += len(batch)
+            batch = []
+            if progress:
+                progress(copied, len(note_ids))
+    if batch:
+        target.write_many(batch)
+        copied += len(batch)
+        if progress:
+            progress(copied, len(note_ids))
+    for name in source.list_attachments():
+        if not target.has_attachment(name):
+            target.write_attachment(name, source.read_attachment(name))
+    # Revision histories, the import manifest and the like. The title index is not
+    # copied: its stamps belong to the source backend, so the target rebuilds it on first open
+    for name in source.list_meta():
+        if name != 'index':
+            target.write_meta(name, source.read_meta(name))
+    return copied
@@ -0,0 +1,304 @@
+from PyQt6.QtGui import QFont
+
+# Application-wide theme. The whole stylesheet is installed once on the QApplication,
+# widgets pick their look through the `role` and `variant` dynamic properties instead
+# of carrying inline stylesheets. Sizes that follow the UI scale slider are applied
+# as fonts / fixed sizes in code so scaling never re-parses CSS.
+
+APP_STYLESHEET = """
+QWidget {
+    background-color: #0b1a2d;
+    color: white;
+    font-family: 'Inter', 'Segoe UI Variable', 'Segoe UI', 'Roboto', Tahoma, Geneva, Verdana, sans-serif;
+    border-radius: 12px;
+}
+QListWidget {
+    background-color: #102a4c;
+    border: none;
+    border-radius: 10px;
+}
+QTextEdit, QPlainTextEdit {
+    background-color: #081229;
+    border: none;
+    color: white;
+    border-radius: 10px;
+}
+QPushButton, QToolButton {
+    background-color: #1a3a6d;
+    border: none;
+    padding: 8px;
+    border-radius: 8px;
+}
+QPushButton:hover, QToolButton:hover {
+    background-color: #3366cc;
+}
+QLineEdit {
+    background-color: #102a4c;
+    border: none;
+    color: white;
+    padding: 6px;
+    border-radius: 8px;
+}
+QLabel {
+    color: #aad8ff;
+    border-radius: 8px;
+}
+QComboBox {
+    background-color: #102a4c;
+    border: none;
+    color: #aad8ff;
+    padding: 2px 8px;
+    border-radius: 6px;
+}
+QComboBox QAbstractItemView {
+    background-color: #102a4c;
+    color: white;
+    selection-background-color: #3366cc;
+}
+QMenu {
+    background-color: #102a4c;
+    color: white;
+    border: 1px solid #1b3b66;
+    padding: 4px;
+}
+QMenu::item {
+    padding: 4px 16px;
+    border-radius: 4px;
+}
+QMenu::item:selected {
+    background-color: #3366cc;
+}
+QTableWidget {
+    background-color: #081229;
+    color: white;
+    gridline-color: #1b3b66;
+    border: none;
+}
+QHeaderView::section {
+    background-color: #102a4c;
+    color: #aad8ff;
+    border: none;
+    padding: 4px 6px;
+}
+QToolButton::menu-indicator {
+    image: none;
+}
+
+/* Main window title bar */
+*[role="titlebar"], *[role="titlebar"] QLabel {
+    background: #12213a;
+    border-top-left-radius: 12px;
+    border-top-right-radius: 12px;
+}
+QLabel[role="window-title"] {
+    font-weight: bold;
+    color: #aad8ff;
+}
+QToolButton[role="window-button"] {
+    background: none;
+    color: #aad8ff;
+    border-radius: 6px;
+}
+QToolButton[role="window-button"]:hover {
+    background: #224477;
+}
+QToolButton[role="window-close"] {
+    background: none;
+    color: #aad8ff;
+    border-radius: 6px;
+}
+QToolButton[role="window-close"]:hover {
+    background: #d9534f;
+    color: white;
+}
+
+/* Formatting toolbar */
+QToolButton[role="format-button"] {
+    color: #aad8ff;
+    background: #12213a;
+    border-radius: 6px;
+    padding: 2px 6px;
+}
+QToolButton[role="format-button"]:hover {
+    background: #3366cc;
+    color: #fff;
+}
+
+QToolButton[variant="danger"] {
+    color: #ff6b6b;
+}
+QToolButton[variant="danger"]:hover {
+    background-color: #d9534f;
+    color: white;
+}
+
+QFrame[role="resize-handle"] {
+    background: transparent;
+}
+
+QLabel[role="status"] {
+    color: #aad8ff;
+    padding-left: 12px;
+}
+
+QLabel[role="slider-label"] {
+    color: #aad8ff;
+    padding: 0 2px;
+}
+QSlider {
+    background: transparent;
+    border-radius: 10px;
+    padding: 0 4px;
+}
+QSlider::groove:horizontal {
+    border: 1.5px solid #3366cc;
+    height: 5px;
+    background: #1a3a6d;
+    border-radius: 3px;
+}
+QSlider::handle:horizontal {
+    background: #aad8ff;
+    border: 3px solid #3366cc;
+    width: 16px;
+    height: 16px;
+    margin: -6px 0;
+    border-radius: 8px;
+}
+QSlider::handle:horizontal:hover {
+    background: #66b3ff;
+    border: 3px solid #aad8ff;
+}
+
+QListWidget QScrollBar:vertical, QListWidget QScrollBar:horizontal,
+QTextEdit QScrollBar:vertical, QTextEdit QScrollBar:horizontal,
+QPlainTextEdit QScrollBar:vertical, QPlainTextEdit QScrollBar:horizontal {
+    background: transparent;
+    border: none;
+    width: 12px;
+    height: 12px;
+    margin: 0px;
+}
+QScrollBar::handle:vertical, QScrollBar::handle:horizontal {
+    background: #aad8ff;
+    border: none;
+    border-radius: 6px;
+    min-height: 32px;
+    min-width: 32px;
+}
+QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical,
+QScrollBar::add-line:horizontal, QScrollBar::sub-line:horizontal {
+    background: transparent;
+    border: none;
+    height: 16px;
+    width: 16px;
+    border-radius: 8px;
+}
+QScrollBar::add-page:vertical, QScrollBar::sub-page:vertical,
+QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
+    background: transparent;
+    border: none;
+}
+
+/* Dialogs */
+QDialog[role="dialog"] {
+    background-color: #0b1a2d;
+    color: white;
+    border-radius: 12px;
+    border: 2px solid #3366cc;
+}
+*[role="dialog-titlebar"], *[role="dialog-titlebar"] QLabel {
+    background: #12213a;
+    border-top-left-radius: 10px;
+    border-top-right-radius: 10px;
+}
+QLabel[role="dialog-title"] {
+    font-weight: bold;
+    font-size: 14px;
+    color: #aad8ff;
+}
+QToolButton[role="dialog-close"] {
+    background: none;
+    font-size: 16px;
+    color: #aad8ff;
+    border-radius: 6px;
+}
+QToolButton[role="dialog-close"]:hover {
+    background: #d9534f;
+    color: white;
+}
+QLabel[role="dialog-message"] {
+    color: #aad8ff;
+    font-size: 13px;
+    margin: 10px 0;
+}
+QLabel[role="dialog-prompt"] {
+    color: #aad8ff;
+    font-size: 13px;
+    margin-bottom: 10px;
+}
+QLineEdit[role="dialog-input"] {
+    background-color: #102a4c;
+    border: 2px solid #3366cc;
+    color: white;
+    padding: 10px;
+    border-radius: 8px;
+    font-size: 14px;
+    min-height: 20px;
+}
+QLineEdit[role="dialog-input"]:focus {
+    border: 2px solid #aad8ff;
+}
+QPushButton[role="dialog-button"] {
+    background-color: #1a3a6d;
+    border: none;
+    padding: 8px 16px;
+    border-radius: 8px;
+    color: white;
+    font-size: 13px;
+}
+QPushButton[role="dialog-button"]:hover {
+    background-color: #3366cc;
+}
+QPushButton[role="dialog-button"][variant="danger"] {
+    background-color: #d9534f;
+}
+QPushButton[role="dialog-button"][variant="danger"]:hover {
+    background-color: #c9302c;
+}
+"""
+
+_themed_app = None
+
+
+def apply_theme(app):
+    # Idempotent: the stylesheet is only handed to Qt (and parsed) once per application
+    global _themed_app
+    if _themed_app is app:
+        return
+    app.setStyle("Fusion")
+    font = app.font()
+    font.setPixelSize(15)
+    app.setFont(font)
+    app.setStyleSheet(APP_STYLESHEET)
+    _themed_app = app
+
+
+def set_role(widget, role):
+    widget.setProperty('role', role)
+
+
+def set_variant(widget, variant):
+    # Dynamic property selectors are only re-evaluated on polish, so re-polish the
+    # one widget that changed instead of touching any stylesheet
+    if widget.property('variant') == variant:
+        return
+    widget.setProperty('variant', variant)
+    widget.style().unpolish(widget)
+    widget.style().polish(widget)
+    widget.update()
+
+
+def scaled_font(widget, pixel_size, scale=1.0):
+    font = QFont(widget.font())
+    font.setPixelSize(max(1, int(pixel_size * scale)))
+    return font
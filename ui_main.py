@@ -1,27 +1,30 @@
 from PyQt6.QtWidgets import (
-    QWidget, QListWidget, QTextEdit, QVBoxLayout, QHBoxLayout,
+    QWidget, QListWidget, QTextEdit, QPlainTextEdit, QVBoxLayout, QHBoxLayout,
     QPushButton, QLineEdit, QLabel, QFileDialog, QSplitter, QToolButton, QSplitterHandle, QFrame, QSlider, QApplication,
-    QDialog, QMessageBox
+    QDialog, QMessageBox, QComboBox, QMenu, QTableWidget, QTableWidgetItem, QHeaderView
 )
-from PyQt6.QtGui import QFont, QColor, QAction, QIcon, QPixmap, QPen, QTextCharFormat, QTextCursor, QKeySequence, QShortcut
-from PyQt6.QtCore import Qt, QSize
+from PyQt6.QtGui import (
+    QFont, QColor, QAction, QIcon, QPixmap, QPen, QTextCharFormat, QTextCursor, QKeySequence, QShortcut,
+    QTextDocument, QTextImageFormat
+)
+from PyQt6.QtCore import Qt, QObject, QSize, QPoint, QRect, QTimer, QBuffer, QIODevice
 from PyQt6.QtGui import QPainter, QImage, QBrush
 import sys
+import time
+
+from styles import apply_theme, set_role, set_variant, scaled_font
+from attachments import attachment_url, digest_from_url, externalize_images
+from large_notes import MarkupHighlighter
+import metrics
 
 class CustomDialog(QDialog):
     def __init__(self, parent=None, title="", message=""):
         super().__init__(parent)
+        apply_theme(QApplication.instance())
         self.setWindowTitle(title)
         self.setWindowFlag(Qt.WindowType.FramelessWindowHint)
         self.setFixedSize(400, 200)
-        self.setStyleSheet("""
-            QDialog {
-                background-color: #0b1a2d;
-                color: white;
-                border-radius: 12px;
-                border: 2px solid #3366cc;
-            }
-        """)
+        set_role(self, 'dialog')
         
         layout = QVBoxLayout(self)
         layout.setContentsMargins(20, 20, 20, 20)
@@ -30,96 +33,52 @@ class CustomDialog(QDialog):
         # Title bar
         title_bar = QWidget()
         title_bar.setFixedHeight(35)
-        title_bar.setStyleSheet("background: #12213a; border-top-left-radius: 10px; border-top-right-radius: 10px;")
+        set_role(title_bar, 'dialog-titlebar')
         title_layout = QHBoxLayout(title_bar)
         title_layout.setContentsMargins(15, 0, 15, 0)
         
-        title_label = QLabel(title)
-        title_label.setStyleSheet("font-weight: bold; font-size: 14px; color: #aad8ff;")
-        title_layout.addWidget(title_label)
+        self.title_label = QLabel(title)
+        set_role(self.title_label, 'dialog-title')
+        title_layout.addWidget(self.title_label)
         title_layout.addStretch(1)
         
         close_btn = QToolButton()
         close_btn.setText("×")
         close_btn.setToolTip("Cancel")
-        close_btn.setStyleSheet("""
-            QToolButton {
-                background: none; font-size: 16px; color: #aad8ff; border-radius: 6px;
-            }
-            QToolButton:hover {
-                background: #d9534f; color: white;
-            }
-        """)
+        set_role(close_btn, 'dialog-close')
         close_btn.clicked.connect(self.reject)
         title_layout.addWidget(close_btn)
         
         layout.addWidget(title_bar)
         
         # Message
-        if message:
-            msg_label = QLabel(message)
-            msg_label.setStyleSheet("color: #aad8ff; font-size: 13px; margin-bottom: 10px;")
-            layout.addWidget(msg_label)
+        self.msg_label = QLabel(message)
+        set_role(self.msg_label, 'dialog-prompt')
+        self.msg_label.setVisible(bool(message))
+        layout.addWidget(self.msg_label)
         
         # Input field
         self.input_field = QLineEdit()
         self.input_field.setMinimumHeight(40)
-        self.input_field.setStyleSheet("""
-            QLineEdit {
-                background-color: #102a4c;
-                border: 2px solid #3366cc;
-                color: white;
-                padding: 10px;
-                border-radius: 8px;
-                font-size: 14px;
-                min-height: 20px;
-            }
-            QLineEdit:focus {
-                border: 2px solid #aad8ff;
-            }
-        """)
+        set_role(self.input_field, 'dialog-input')
         layout.addWidget(self.input_field)
         
         # Buttons
         button_layout = QHBoxLayout()
         button_layout.addStretch(1)
         
-        cancel_btn = QPushButton("Cancel")
-        cancel_btn.setMinimumHeight(35)
-        cancel_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #1a3a6d;
-                border: none;
-                padding: 8px 16px;
-                border-radius: 8px;
-                color: white;
-                font-size: 13px;
-            }
-            QPushButton:hover {
-                background-color: #3366cc;
-            }
-        """)
-        cancel_btn.clicked.connect(self.reject)
+        self.cancel_btn = QPushButton("Cancel")
+        self.cancel_btn.setMinimumHeight(35)
+        set_role(self.cancel_btn, 'dialog-button')
+        self.cancel_btn.clicked.connect(self.reject)
         
-        confirm_btn = QPushButton("Confirm")
-        confirm_btn.setMinimumHeight(35)
-        confirm_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #1a3a6d;
-                border: none;
-                padding: 8px 16px;
-                border-radius: 8px;
-                color: white;
-                font-size: 13px;
-            }
-            QPushButton:hover {
-                background-color: #3366cc;
-            }
-        """)
-        confirm_btn.clicked.connect(self.accept)
+        self.confirm_btn = QPushButton("Confirm")
+        self.confirm_btn.setMinimumHeight(35)
+        set_role(self.confirm_btn, 'dialog-button')
+        self.confirm_btn.clicked.connect(self.accept)
         
-        button_layout.addWidget(cancel_btn)
-        button_layout.addWidget(confirm_btn)
+        button_layout.addWidget(self.cancel_btn)
+        button_layout.addWidget(self.confirm_btn)
         layout.addLayout(button_layout)
         
         # Make dialog draggable
@@ -150,23 +109,37 @@ class CustomDialog(QDialog):
         self._drag_active = False
         event.accept()
     
+    def set_danger(self, danger=True):
+        set_variant(self.confirm_btn, 'danger' if danger else None)
+    
+    def configure(self, title, message, password=False, show_input=True, confirm_text="Confirm", danger=False):
+        # Reset every per-use attribute so a pooled dialog never leaks state between uses
+        self.setWindowTitle(title)
+        self.title_label.setText(title)
+        self.msg_label.setText(message)
+        self.msg_label.setVisible(bool(message))
+        self.input_field.clear()
+        self.input_field.setEchoMode(QLineEdit.EchoMode.Password if password else QLineEdit.EchoMode.Normal)
+        self.input_field.setVisible(show_input)
+        self.input_field.setMaximumHeight(16777215 if show_input else 0)
+        self.confirm_btn.setText(confirm_text)
+        self.set_danger(danger)
+        if show_input:
+            self.input_field.setFocus()
+        else:
+            self.confirm_btn.setFocus()
+    
     def get_text(self):
         return self.input_field.text().strip()
 
 class CustomMessageDialog(QDialog):
     def __init__(self, parent=None, title="", message="", icon_type="info"):
         super().__init__(parent)
+        apply_theme(QApplication.instance())
         self.setWindowTitle(title)
         self.setWindowFlag(Qt.WindowType.FramelessWindowHint)
         self.setFixedSize(400, 180)
-        self.setStyleSheet("""
-            QDialog {
-                background-color: #0b1a2d;
-                color: white;
-                border-radius: 12px;
-                border: 2px solid #3366cc;
-            }
-        """)
+        set_role(self, 'dialog')
         
         layout = QVBoxLayout(self)
         layout.setContentsMargins(20, 20, 20, 20)
@@ -175,36 +148,29 @@ class CustomMessageDialog(QDialog):
         # Title bar
         title_bar = QWidget()
         title_bar.setFixedHeight(35)
-        title_bar.setStyleSheet("background: #12213a; border-top-left-radius: 10px; border-top-right-radius: 10px;")
+        set_role(title_bar, 'dialog-titlebar')
         title_layout = QHBoxLayout(title_bar)
         title_layout.setContentsMargins(15, 0, 15, 0)
         
-        title_label = QLabel(title)
-        title_label.setStyleSheet("font-weight: bold; font-size: 14px; color: #aad8ff;")
-        title_layout.addWidget(title_label)
+        self.title_label = QLabel(title)
+        set_role(self.title_label, 'dialog-title')
+        title_layout.addWidget(self.title_label)
         title_layout.addStretch(1)
         
         close_btn = QToolButton()
         close_btn.setText("×")
         close_btn.setToolTip("Close")
-        close_btn.setStyleSheet("""
-            QToolButton {
-                background: none; font-size: 16px; color: #aad8ff; border-radius: 6px;
-            }
-            QToolButton:hover {
-                background: #d9534f; color: white;
-            }
-        """)
+        set_role(close_btn, 'dialog-close')
         close_btn.clicked.connect(self.accept)
         title_layout.addWidget(close_btn)
         
         layout.addWidget(title_bar)
         
         # Message
-        msg_label = QLabel(message)
-        msg_label.setWordWrap(True)
-        msg_label.setStyleSheet("color: #aad8ff; font-size: 13px; margin: 10px 0;")
-        layout.addWidget(msg_label)
+        self.msg_label = QLabel(message)
+        self.msg_label.setWordWrap(True)
+        set_role(self.msg_label, 'dialog-message')
+        layout.addWidget(self.msg_label)
         
         # OK button
         button_layout = QHBoxLayout()
@@ -212,19 +178,7 @@ class CustomMessageDialog(QDialog):
         
         ok_btn = QPushButton("OK")
         ok_btn.setMinimumHeight(35)
-        ok_btn.setStyleSheet("""
-            QPushButton {
-                background-color: #1a3a6d;
-                border: none;
-                padding: 8px 16px;
-                border-radius: 8px;
-                color: white;
-                font-size: 13px;
-            }
-            QPushButton:hover {
-                background-color: #3366cc;
-            }
-        """)
+        set_role(ok_btn, 'dialog-button')
         ok_btn.clicked.connect(self.accept)
         
         button_layout.addWidget(ok_btn)
@@ -251,6 +205,363 @@ class CustomMessageDialog(QDialog):
     def _title_mouse_release(self, event):
         self._drag_active = False
         event.accept()
+    
+    def configure(self, title, message):
+        self.setWindowTitle(title)
+        self.title_label.setText(title)
+        self.msg_label.setText(message)
+
+class HistoryDialog(QDialog):
+    # Revision list on the left, read-only preview on the right. The owner fills the
+    # preview when `revision_changed` fires, so only the revision on screen is decrypted.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        apply_theme(QApplication.instance())
+        self.setWindowTitle("Note History")
+        self.setWindowFlag(Qt.WindowType.FramelessWindowHint)
+        self.resize(760, 480)
+        set_role(self, 'dialog')
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(15)
+
+        title_bar = QWidget()
+        title_bar.setFixedHeight(35)
+        set_role(title_bar, 'dialog-titlebar')
+        title_layout = QHBoxLayout(title_bar)
+        title_layout.setContentsMargins(15, 0, 15, 0)
+        self.title_label = QLabel("Note History")
+        set_role(self.title_label, 'dialog-title')
+        title_layout.addWidget(self.title_label)
+        title_layout.addStretch(1)
+        close_btn = QToolButton()
+        close_btn.setText("×")
+        close_btn.setToolTip("Close")
+        set_role(close_btn, 'dialog-close')
+        close_btn.clicked.connect(self.reject)
+        title_layout.addWidget(close_btn)
+        layout.addWidget(title_bar)
+
+        body = QHBoxLayout()
+        self.revision_list = QListWidget()
+        self.revision_list.setFixedWidth(220)
+        body.addWidget(self.revision_list)
+        self.preview = NoteTextEdit()
+        self.preview.setReadOnly(True)
+        body.addWidget(self.preview, 1)
+        layout.addLayout(body, 1)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch(1)
+        cancel_btn = QPushButton("Close")
+        cancel_btn.setMinimumHeight(35)
+        set_role(cancel_btn, 'dialog-button')
+        cancel_btn.clicked.connect(self.reject)
+        self.restore_btn = QPushButton("Restore")
+        self.restore_btn.setMinimumHeight(35)
+        set_role(self.restore_btn, 'dialog-button')
+        self.restore_btn.clicked.connect(self.accept)
+        button_layout.addWidget(cancel_btn)
+        button_layout.addWidget(self.restore_btn)
+        layout.addLayout(button_layout)
+
+        self.revision_changed = self.revision_list.currentRowChanged
+        self._drag_active = False
+        self._drag_pos = None
+        title_bar.mousePressEvent = self._title_mouse_press
+        title_bar.mouseMoveEvent = self._title_mouse_move
+        title_bar.mouseReleaseEvent = self._title_mouse_release
+
+    _title_mouse_press = CustomMessageDialog._title_mouse_press
+    _title_mouse_move = CustomMessageDialog._title_mouse_move
+    _title_mouse_release = CustomMessageDialog._title_mouse_release
+
+    def configure(self, title, labels):
+        self.title_label.setText(title)
+        self.preview.clear()
+        self.revision_list.blockSignals(True)
+        self.revision_list.clear()
+        self.revision_list.addItems(labels)
+        self.revision_list.blockSignals(False)
+        self.restore_btn.setEnabled(False)
+
+    def show_preview(self, html):
+        self.preview.setHtml(html)
+        self.restore_btn.setEnabled(True)
+
+class BusyDialog(QDialog):
+    # Spinner shown while the UI waits, e.g. on key derivation (which can't be cancelled)
+    # or out a login backoff (which can)
+    FRAMES = "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        apply_theme(QApplication.instance())
+        self.setWindowFlag(Qt.WindowType.FramelessWindowHint)
+        self.setFixedSize(340, 130)
+        set_role(self, 'dialog')
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(15)
+
+        title_bar = QWidget()
+        title_bar.setFixedHeight(35)
+        set_role(title_bar, 'dialog-titlebar')
+        title_layout = QHBoxLayout(title_bar)
+        title_layout.setContentsMargins(15, 0, 15, 0)
+        self.title_label = QLabel()
+        set_role(self.title_label, 'dialog-title')
+        title_layout.addWidget(self.title_label)
+        title_layout.addStretch(1)
+        self.close_btn = QToolButton()
+        self.close_btn.setText("×")
+        self.close_btn.setToolTip("Cancel")
+        set_role(self.close_btn, 'dialog-close')
+        self.close_btn.clicked.connect(self.reject)
+        title_layout.addWidget(self.close_btn)
+        layout.addWidget(title_bar)
+
+        self.msg_label = QLabel()
+        self.msg_label.setWordWrap(True)
+        set_role(self.msg_label, 'dialog-message')
+        layout.addWidget(self.msg_label)
+
+        self.cancellable = False
+        self._message = ""
+        self._frame = 0
+        self._spin_timer = QTimer(self)
+        self._spin_timer.setInterval(80)
+        self._spin_timer.timeout.connect(self._spin)
+
+        self._drag_active = False
+        self._drag_pos = None
+        title_bar.mousePressEvent = self._title_mouse_press
+        title_bar.mouseMoveEvent = self._title_mouse_move
+        title_bar.mouseReleaseEvent = self._title_mouse_release
+
+    _title_mouse_press = CustomMessageDialog._title_mouse_press
+    _title_mouse_move = CustomMessageDialog._title_mouse_move
+    _title_mouse_release = CustomMessageDialog._title_mouse_release
+
+    def configure(self, title, message, cancellable=False):
+        self.setWindowTitle(title)
+        self.title_label.setText(title)
+        self.cancellable = cancellable
+        self.close_btn.setVisible(cancellable)
+        self._frame = 0
+        self.set_message(message)
+
+    def set_message(self, message):
+        self._message = message
+        self.msg_label.setText(f"{self.FRAMES[self._frame % len(self.FRAMES)]}  {message}")
+
+    def _spin(self):
+        self.msg_label.setText(f"{self.FRAMES[self._frame % len(self.FRAMES)]}  {self._message}")
+        self._frame += 1
+
+    def showEvent(self, event):
+        self._spin_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self._spin_timer.stop()
+        super().hideEvent(event)
+
+    def reject(self):
+        # Escape can't cancel work that isn't cancellable, so it doesn't close the spinner
+        if self.cancellable:
+            super().reject()
+
+class MetricsPanel(QDialog):
+    # Non-modal table of the hot-path timings, refreshed while it is open
+    COLUMNS = ("Metric", "Calls", "p50 ms", "p95 ms", "Max ms", "MB")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        apply_theme(QApplication.instance())
+        self.setWindowTitle("Performance")
+        self.setWindowFlag(Qt.WindowType.FramelessWindowHint)
+        self.setModal(False)
+        self.resize(560, 360)
+        set_role(self, 'dialog')
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(20, 20, 20, 20)
+        layout.setSpacing(15)
+
+        title_bar = QWidget()
+        title_bar.setFixedHeight(35)
+        set_role(title_bar, 'dialog-titlebar')
+        title_layout = QHBoxLayout(title_bar)
+        title_layout.setContentsMargins(15, 0, 15, 0)
+        title_label = QLabel("Performance")
+        set_role(title_label, 'dialog-title')
+        title_layout.addWidget(title_label)
+        title_layout.addStretch(1)
+        close_btn = QToolButton()
+        close_btn.setText("×")
+        close_btn.setToolTip("Close")
+        set_role(close_btn, 'dialog-close')
+        close_btn.clicked.connect(self.hide)
+        title_layout.addWidget(close_btn)
+        layout.addWidget(title_bar)
+
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().setVisible(False)
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.setSelectionMode(QTableWidget.SelectionMode.NoSelection)
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeMode.ResizeToContents)
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table, 1)
+
+        button_layout = QHBoxLayout()
+        button_layout.addStretch(1)
+        reset_btn = QPushButton("Reset")
+        reset_btn.setMinimumHeight(35)
+        set_role(reset_btn, 'dialog-button')
+        reset_btn.clicked.connect(self._reset)
+        button_layout.addWidget(reset_btn)
+        layout.addLayout(button_layout)
+
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setInterval(1000)
+        self._refresh_timer.timeout.connect(self.refresh)
+
+        self._drag_active = False
+        self._drag_pos = None
+        title_bar.mousePressEvent = self._title_mouse_press
+        title_bar.mouseMoveEvent = self._title_mouse_move
+        title_bar.mouseReleaseEvent = self._title_mouse_release
+
+    _title_mouse_press = CustomMessageDialog._title_mouse_press
+    _title_mouse_move = CustomMessageDialog._title_mouse_move
+    _title_mouse_release = CustomMessageDialog._title_mouse_release
+
+    def _reset(self):
+        metrics.reset()
+        self.refresh()
+
+    def refresh(self):
+        rows = metrics.summary()
+        self.table.setRowCount(len(rows))
+        for row, (name, stats) in enumerate(rows.items()):
+            values = (name, str(stats['count']), f"{stats['p50_ms']:.2f}", f"{stats['p95_ms']:.2f}",
+                      f"{stats['max_ms']:.2f}", f"{stats['bytes'] / (1024 * 1024):.2f}" if stats['bytes'] else "")
+            for column, value in enumerate(values):
+                item = self.table.item(row, column)
+                if item is None:
+                    item = QTableWidgetItem()
+                    self.table.setItem(row, column, item)
+                item.setText(value)
+
+    def showEvent(self, event):
+        self.refresh()
+        self._refresh_timer.start()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self._refresh_timer.stop()
+        super().hideEvent(event)
+
+class DialogManager:
+    # Builds each dialog kind once and reuses it. A fresh dialog is only created when
+    # the pooled one is already on screen (e.g. an error raised from inside a prompt).
+    def __init__(self, parent):
+        self.parent = parent
+        self._input_dialog = None
+        self._message_dialog = None
+        self._busy_dialog = None
+
+    def _get_input_dialog(self):
+        if self._input_dialog is None:
+            self._input_dialog = CustomDialog(self.parent)
+        if self._input_dialog.isVisible():
+            return CustomDialog(self.parent)
+        return self._input_dialog
+
+    def _get_busy_dialog(self):
+        if self._busy_dialog is None:
+            self._busy_dialog = BusyDialog(self.parent)
+        return self._busy_dialog
+
+    def _get_message_dialog(self):
+        if self._message_dialog is None:
+            self._message_dialog = CustomMessageDialog(self.parent)
+        if self._message_dialog.isVisible():
+            return CustomMessageDialog(self.parent)
+        return self._message_dialog
+
+    def prompt(self, title, message, password=False):
+        # Returns the entered text, or None if the dialog was cancelled
+        dialog = self._get_input_dialog()
+        dialog.configure(title, message, password=password)
+        if dialog.exec() == QDialog.DialogCode.Accepted:
+            text = dialog.get_text()
+            dialog.input_field.clear()
+            return text
+        dialog.input_field.clear()
+        return None
+
+    def confirm(self, title, message, confirm_text="Confirm", danger=False):
+        dialog = self._get_input_dialog()
+        dialog.configure(title, message, show_input=False, confirm_text=confirm_text, danger=danger)
+        return dialog.exec() == QDialog.DialogCode.Accepted
+
+    def wait(self, title, message, thread, work=None):
+        # Starts `thread` and shows a spinner until it finishes. `work()`, if given, runs
+        # on the UI thread in the meantime.
+        dialog = self._get_busy_dialog()
+        dialog.configure(title, message)
+        thread.finished.connect(dialog.accept)
+        try:
+            thread.start()
+            dialog.show()
+            QApplication.processEvents()
+            if work is not None:
+                work()
+            if thread.isRunning():
+                dialog.exec()
+            thread.wait()
+        finally:
+            thread.finished.disconnect(dialog.accept)
+            dialog.hide()
+
+    def countdown(self, title, message, seconds):
+        # Waits `seconds` without blocking the event loop; {seconds} in `message` counts
+        # down. Returns False if the user cancelled.
+        dialog = self._get_busy_dialog()
+        deadline = time.monotonic() + seconds
+        dialog.configure(title, message.format(seconds=int(seconds + 0.999)), cancellable=True)
+        ticker = QTimer(dialog)
+        ticker.setInterval(200)
+
+        def tick():
+            left = deadline - time.monotonic()
+            if left <= 0:
+                dialog.accept()
+            else:
+                dialog.set_message(message.format(seconds=int(left + 0.999)))
+        ticker.timeout.connect(tick)
+        ticker.start()
+        try:
+            return dialog.exec() == QDialog.DialogCode.Accepted
+        finally:
+            ticker.stop()
+            ticker.deleteLater()
+
+    def message(self, title, message):
+        dialog = self._get_message_dialog()
+        dialog.configure(title, message)
+        dialog.exec()
+
+    def notify(self, message, timeout=2500):
+        # Non-modal confirmation for frequent operations, shown in the window's status area
+        if hasattr(self.parent, 'show_status'):
+            self.parent.show_status(message, timeout)
 
 def colorize_icon(path, color):
     pixmap = QPixmap(path)
@@ -307,7 +618,7 @@ class ResizeHandle(QFrame):
         super().__init__(parent)
         self.position = position  # e.g., 'left', 'right', 'top', 'bottom', 'topleft', etc.
         self.setMouseTracking(True)
-        self.setStyleSheet("background: transparent;")
+        set_role(self, 'resize-handle')
         self._hover = False
 
     def enterEvent(self, event):
@@ -338,90 +649,219 @@ class ResizeHandle(QFrame):
             painter.drawRect(self.rect())
         super().paintEvent(event)
 
+# Resize handle position -> edges for QWindow.startSystemResize
+_RESIZE_EDGES = {
+    'left': Qt.Edge.LeftEdge,
+    'right': Qt.Edge.RightEdge,
+    'top': Qt.Edge.TopEdge,
+    'bottom': Qt.Edge.BottomEdge,
+    'topleft': Qt.Edge.TopEdge | Qt.Edge.LeftEdge,
+    'topright': Qt.Edge.TopEdge | Qt.Edge.RightEdge,
+    'bottomleft': Qt.Edge.BottomEdge | Qt.Edge.LeftEdge,
+    'bottomright': Qt.Edge.BottomEdge | Qt.Edge.RightEdge,
+}
+
+class WindowResizer(QObject):
+    # Moves and resizes a frameless window. Where the platform can, the drag is handed to
+    # the window manager (QWindow.startSystemMove/startSystemResize) and Qt only sees the
+    # final sizes. Otherwise the geometry follows the cursor, but is applied at most once
+    # per display frame: mouse moves in between only update the target, so a drag costs one
+    # layout and repaint per frame however fast the mouse reports.
+    MIN_SIZE = (400, 300)
+
+    def __init__(self, window):
+        super().__init__(window)
+        self.window = window
+        self._edge = None
+        self._start_geom = None
+        self._start_pos = None
+        self._min_size = self.MIN_SIZE
+        self._pending = None
+        self._frame_timer = QTimer(self)
+        self._frame_timer.setSingleShot(True)
+        self._frame_timer.timeout.connect(self._next_frame)
+        self.counts = {'requested': 0, 'applied': 0}
+
+    @property
+    def active(self):
+        return self._edge is not None
+
+    def start_move(self, global_pos):
+        handle = self.window.windowHandle()
+        if handle is not None and handle.startSystemMove():
+            return
+        self._start('move', global_pos)
+
+    def start_resize(self, edge, global_pos):
+        handle = self.window.windowHandle()
+        if handle is not None and handle.startSystemResize(_RESIZE_EDGES[edge]):
+            return
+        self._start(edge, global_pos)
+
+    def drag_to(self, global_pos):
+        if self._edge is None:
+            return
+        self.counts['requested'] += 1
+        self._pending = self._target(global_pos)
+        if not self._frame_timer.isActive():
+            # The first move of a frame goes out right away; the rest wait for the next one
+            self._next_frame()
+
+    def finish(self):
+        if self._edge is None:
+            return
+        self._frame_timer.stop()
+        self._apply()
+        self._edge = None
+
+    def _start(self, edge, global_pos):
+        self._edge = edge
+        self._start_geom = self.window.geometry()
+        self._start_pos = global_pos
+        self._pending = None
+        # The layout won't go below its own minimum; clamping to it keeps the opposite edge still
+        minimum = self.window.minimumSize().expandedTo(self.window.minimumSizeHint())
+        self._min_size = (max(self.MIN_SIZE[0], minimum.width()), max(self.MIN_SIZE[1], minimum.height()))
+        screen = self.window.screen()
+        rate = screen.refreshRate() if screen is not None else 0
+        self._frame_timer.setInterval(max(1, int(1000 / rate)) if rate > 0 else 16)
+
+    def _target(self, global_pos):
+        delta = global_pos - self._start_pos
+        x, y, w, h = self._start_geom.getRect()
+        if self._edge == 'move':
+            return QRect(x + delta.x(), y + delta.y(), w, h)
+        min_w, min_h = self._min_size
+        if 'left' in self._edge:
+            new_w = max(w - delta.x(), min_w)
+            x, w = x + w - new_w, new_w
+        elif 'right' in self._edge:
+            w = max(w + delta.x(), min_w)
+        if 'top' in self._edge:
+            new_h = max(h - delta.y(), min_h)
+            y, h = y + h - new_h, new_h
+        elif 'bottom' in self._edge:
+            h = max(h + delta.y(), min_h)
+        return QRect(x, y, w, h)
+
+    def _next_frame(self):
+        if self._apply():
+            self._frame_timer.start()
+
+    def _apply(self):
+        geometry, self._pending = self._pending, None
+        if geometry is None or geometry == self.window.geometry():
+            return False
+        self.counts['applied'] += 1
+        with metrics.timed('window_geometry'):
+            if geometry.size() == self.window.size():
+                self.window.move(geometry.topLeft())
+            else:
+                self.window.setGeometry(geometry)
+        return True
+
+class NoteTextEdit(QTextEdit):
+    # Pasted images are handed to attachment_saver(bytes) -> digest and only referenced
+    # from the note; attachment_loader(digest) -> bytes is asked for an image when Qt first
+    # paints it. Both are set by the app.
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.attachment_saver = None
+        self.attachment_loader = None
+
+    def loadResource(self, kind, url):
+        digest = digest_from_url(url.toString())
+        if digest is None or kind != QTextDocument.ResourceType.ImageResource.value:
+            return super().loadResource(kind, url)
+        image = QImage()
+        if self.attachment_loader is not None:
+            try:
+                with metrics.timed('load_attachment'):
+                    image.loadFromData(self.attachment_loader(digest))
+            except Exception:
+                pass
+        # Qt keeps the result with the document, so each image is decrypted once per load
+        return image
+
+    def canInsertFromMimeData(self, source):
+        if self.attachment_saver is not None and source.hasImage():
+            return True
+        return super().canInsertFromMimeData(source)
+
+    def insertFromMimeData(self, source):
+        if self.attachment_saver is not None:
+            if source.hasHtml() and 'data:image' in source.html():
+                self.insertHtml(externalize_images(source.html(), self.attachment_saver))
+                return
+            if source.hasImage() and not source.hasText():
+                image = QImage(source.imageData())
+                if not image.isNull():
+                    self.insert_image(image)
+                    return
+        super().insertFromMimeData(source)
+
+    def insert_image(self, image):
+        buffer = QBuffer()
+        buffer.open(QIODevice.OpenModeFlag.WriteOnly)
+        image.save(buffer, 'PNG')
+        fmt = QTextImageFormat()
+        fmt.setName(attachment_url(self.attachment_saver(bytes(buffer.data()))))
+        # A known size lets the layout skip the image until it is scrolled into view
+        fmt.setWidth(image.width())
+        fmt.setHeight(image.height())
+        self.textCursor().insertImage(fmt)
+
+class LargeNoteEdit(QPlainTextEdit):
+    # The editor for large-document mode (see large_notes.py)
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.highlighter = None
+
+    def set_highlighting(self, enabled):
+        if enabled and self.highlighter is None:
+            self.highlighter = MarkupHighlighter(self.document())
+        elif not enabled and self.highlighter is not None:
+            self.highlighter.setDocument(None)
+            self.highlighter = None
+
+
 class MainWindowUI(QWidget):
-    def __init__(self):
+    def __init__(self, state=None):
+        # `state` is what save_state() returned last time; applied while the window is
+        # built, so it is laid out and styled once at the saved scale
         super().__init__()
+        state = state or {}
+
+        # Install the application theme before any widgets are created
+        app = QApplication.instance() or QApplication(sys.argv)
+        apply_theme(app)
 
         self.setWindowTitle("Encrypted Notes")
-        self.resize(900, 600)
+        self._restore_geometry(state.get('geometry'))
         self.setWindowFlag(Qt.WindowType.FramelessWindowHint)
 
-        self.setStyleSheet("""
-            QWidget {
-                background-color: #0b1a2d;
-                color: white;
-                font-family: 'Inter', 'Segoe UI Variable', 'Segoe UI', 'Roboto', Tahoma, Geneva, Verdana, sans-serif;
-                font-size: 15px;
-                border-radius: 12px;
-            }
-            QListWidget {
-                background-color: #102a4c;
-                border: none;
-                border-radius: 10px;
-            }
-            QTextEdit {
-                background-color: #081229;
-                border: none;
-                color: white;
-                border-radius: 10px;
-            }
-            QPushButton, QToolButton {
-                background-color: #1a3a6d;
-                border: none;
-                padding: 8px;
-                border-radius: 8px;
-            }
-            QPushButton:hover, QToolButton:hover {
-                background-color: #3366cc;
-            }
-            QLineEdit {
-                background-color: #102a4c;
-                border: none;
-                color: white;
-                padding: 6px;
-                border-radius: 8px;
-            }
-            QLabel {
-                color: #aad8ff;
-                border-radius: 8px;
-            }
-        """)
-
         self.title_bar = QWidget()
         self.title_bar.setFixedHeight(36)
-        self.title_bar.setStyleSheet("background: #12213a; border-top-left-radius: 12px; border-top-right-radius: 12px;")
+        set_role(self.title_bar, 'titlebar')
         title_layout = QHBoxLayout(self.title_bar)
         title_layout.setContentsMargins(8, 0, 8, 0)
         self.title_label = QLabel("Encrypted Notes")
-        self.title_label.setStyleSheet("font-weight: bold; font-size: 16px; color: #aad8ff;")
+        set_role(self.title_label, 'window-title')
         title_layout.addWidget(self.title_label)
         title_layout.addStretch(1)
         self.min_btn = QToolButton()
         self.min_btn.setText("–")
         self.min_btn.setToolTip("Minimize")
-        self.min_btn.setStyleSheet("""
-            QToolButton {
-                background: none; font-size: 18px; color: #aad8ff; border-radius: 6px;
-            }
-            QToolButton:hover {
-                background: #224477;
-            }
-        """)
+        set_role(self.min_btn, 'window-button')
         self.close_btn = QToolButton()
         self.close_btn.setText("×")
         self.close_btn.setToolTip("Close")
-        self.close_btn.setStyleSheet("""
-            QToolButton {
-                background: none; font-size: 18px; color: #aad8ff; border-radius: 6px;
-            }
-            QToolButton:hover {
-                background: #d9534f; color: white;
-            }
-        """)
+        set_role(self.close_btn, 'window-close')
         title_layout.addWidget(self.min_btn)
         title_layout.addWidget(self.close_btn)
 
         main_splitter = CustomSplitter(Qt.Orientation.Horizontal)
+        self.main_splitter = main_splitter
         side_widget = QWidget()
         side_layout = QVBoxLayout(side_widget)
         editor_widget = QWidget()
@@ -437,12 +877,25 @@ class MainWindowUI(QWidget):
         self.new_file_button.setText("")
         self.new_file_button.setAutoRaise(True)
 
-        side_layout.addWidget(QLabel("Notes"))
+        self.notes_label = QLabel("Notes")
+        self.sort_combo = QComboBox()
+        self.sort_combo.addItems(["Modified", "Created", "Title"])
+        self.sort_combo.setToolTip("Sort notes by")
+        notes_header = QHBoxLayout()
+        notes_header.addWidget(self.notes_label)
+        notes_header.addStretch(1)
+        notes_header.addWidget(self.sort_combo)
+        side_layout.addLayout(notes_header)
         side_layout.addWidget(self.list_widget)
         side_layout.addWidget(self.new_file_button)
 
-        self.text_edit = QTextEdit()
+        self.text_edit = NoteTextEdit()
         self.text_edit.setReadOnly(True)
+        # Takes the rich editor's place for large notes (see set_large_mode)
+        self.plain_edit = LargeNoteEdit()
+        self.plain_edit.setReadOnly(True)
+        self.plain_edit.hide()
+        self.large_mode = False
 
         self.save_button = QToolButton()
         self.save_button.setIcon(colorize_icon("media/save.png", bright_color))
@@ -454,67 +907,47 @@ class MainWindowUI(QWidget):
         self.export_button.setIconSize(QSize(20, 20))
         self.export_button.setToolTip("Export All Notes")
         self.export_button.setAutoRaise(True)
+        self.export_menu = QMenu(self.export_button)
+        self.export_folder_action = self.export_menu.addAction("Folder of text files…")
+        self.export_archive_action = self.export_menu.addAction("Single archive (text/Markdown/HTML)…")
+        self.export_menu.addSeparator()
+        self.backup_action = self.export_menu.addAction("Back up vault (incremental snapshot)…")
+        self.check_action = self.export_menu.addAction("Check vault integrity")
+        self.export_button.setMenu(self.export_menu)
+        self.export_button.setPopupMode(QToolButton.ToolButtonPopupMode.InstantPopup)
+
+        self.import_button = QToolButton()
+        self.import_button.setText("📥")
+        self.import_button.setToolTip("Import Folder (.txt/.md/.html)")
+        self.import_button.setAutoRaise(True)
+
+        self.history_button = QToolButton()
+        self.history_button.setText("🕘")
+        self.history_button.setToolTip("Note History")
+        self.history_button.setAutoRaise(True)
 
         self.delete_button = QToolButton()
         self.delete_button.setText("🗑")
         self.delete_button.setIconSize(QSize(20, 20))
         self.delete_button.setToolTip("Delete Selected Note")
         self.delete_button.setAutoRaise(True)
-        self.delete_button.setStyleSheet("""
-            QToolButton {
-                background-color: #1a3a6d;
-                border: none;
-                padding: 8px;
-                border-radius: 8px;
-                color: #ff6b6b;
-                font-size: 16px;
-            }
-            QToolButton:hover {
-                background-color: #d9534f;
-                color: white;
-            }
-        """)
+        set_variant(self.delete_button, 'danger')
 
         self.ui_scale_slider = QSlider(Qt.Orientation.Horizontal)
         self.ui_scale_slider.setMinimum(80)
         self.ui_scale_slider.setMaximum(300)
-        self.ui_scale_slider.setValue(100)
+        self.ui_scale_slider.setValue(state.get('scale', 100))
         self.ui_scale_slider.setFixedWidth(120)
         self.ui_scale_slider.setFixedHeight(20)
         self.ui_scale_slider.setMinimumHeight(20)
         self.ui_scale_slider.setMaximumHeight(20)
         self.ui_scale_slider.setToolTip("UI Scale")
         self.ui_scale_slider.valueChanged.connect(self._update_ui_scale)
-        self.ui_scale_slider.setStyleSheet('''
-            QSlider {
-                background: transparent;
-                border-radius: 10px;
-                padding: 0 4px;
-            }
-            QSlider::groove:horizontal {
-                border: 1.5px solid #3366cc;
-                height: 5px;
-                background: #1a3a6d;
-                border-radius: 3px;
-            }
-            QSlider::handle:horizontal {
-                background: #aad8ff;
-                border: 3px solid #3366cc;
-                width: 16px;
-                height: 16px;
-                margin: -6px 0;
-                border-radius: 8px;
-            }
-            QSlider::handle:horizontal:hover {
-                background: #66b3ff;
-                border: 3px solid #aad8ff;
-            }
-        ''')
 
         self.slider_minus = QLabel("−")
-        self.slider_minus.setStyleSheet("color: #aad8ff; font-size: 16px; padding-right: 2px;")
+        set_role(self.slider_minus, 'slider-label')
         self.slider_plus = QLabel("+")
-        self.slider_plus.setStyleSheet("color: #aad8ff; font-size: 16px; padding-left: 2px;")
+        set_role(self.slider_plus, 'slider-label')
         self.slider_group = QHBoxLayout()
         self.slider_group.setContentsMargins(0, 0, 0, 0)
         self.slider_group.setSpacing(0)
@@ -524,11 +957,21 @@ class MainWindowUI(QWidget):
         self.slider_group_widget = QWidget()
         self.slider_group_widget.setLayout(self.slider_group)
 
+        # Status area for non-modal notifications (see show_status)
+        self.status_label = QLabel("")
+        set_role(self.status_label, 'status')
+        self._status_timer = QTimer(self)
+        self._status_timer.setSingleShot(True)
+        self._status_timer.timeout.connect(self.status_label.clear)
+
         button_layout = QHBoxLayout()
+        button_layout.addWidget(self.status_label)
         button_layout.addStretch(1)
         button_layout.addWidget(self.new_file_button)
         button_layout.addWidget(self.save_button)
         button_layout.addWidget(self.export_button)
+        button_layout.addWidget(self.import_button)
+        button_layout.addWidget(self.history_button)
         button_layout.addWidget(self.delete_button)
         button_layout.addStretch(1)
         button_layout.addWidget(self.slider_group_widget)
@@ -538,154 +981,34 @@ class MainWindowUI(QWidget):
         self.format_toolbar = QHBoxLayout()
         self.format_toolbar.setContentsMargins(0, 0, 0, 0)
         self.format_toolbar.setSpacing(4)
-        self.bold_btn = QToolButton()
-        self.bold_btn.setText('B')
-        self.bold_btn.setToolTip('Bold')
-        self.bold_btn.setCheckable(True)
-        self.bold_btn.setStyleSheet('''
-            QToolButton {
-                font-weight: bold;
-                font-size: 16px;
-                color: #aad8ff;
-                background: #12213a;
-                border-radius: 6px;
-                padding: 2px 6px;
-                min-width: 32px;
-                min-height: 32px;
-                max-width: 32px;
-                max-height: 32px;
-            }
-            QToolButton:hover { background: #3366cc; color: #fff; }
-        ''')
-        self.italic_btn = QToolButton()
-        self.italic_btn.setText('I')
-        self.italic_btn.setToolTip('Italic')
-        self.italic_btn.setCheckable(True)
-        self.italic_btn.setStyleSheet('''
-            QToolButton {
-                font-style: italic;
-                font-size: 16px;
-                color: #aad8ff;
-                background: #12213a;
-                border-radius: 6px;
-                padding: 2px 6px;
-                min-width: 32px;
-                min-height: 32px;
-                max-width: 32px;
-                max-height: 32px;
-            }
-            QToolButton:hover { background: #3366cc; color: #fff; }
-        ''')
-        self.underline_btn = QToolButton()
-        self.underline_btn.setText('U')
-        self.underline_btn.setToolTip('Underline')
-        self.underline_btn.setCheckable(True)
-        self.underline_btn.setStyleSheet('''
-            QToolButton {
-                text-decoration: underline;
-                font-size: 16px;
-                color: #aad8ff;
-                background: #12213a;
-                border-radius: 6px;
-                padding: 2px 6px;
-                min-width: 32px;
-                min-height: 32px;
-                max-width: 32px;
-                max-height: 32px;
-            }
-            QToolButton:hover { background: #3366cc; color: #fff; }
-        ''')
+        self.bold_btn = self._make_format_button('B', 'Bold', checkable=True, bold=True)
+        self.italic_btn = self._make_format_button('I', 'Italic', checkable=True, italic=True)
+        self.underline_btn = self._make_format_button('U', 'Underline', checkable=True, underline=True)
         self.format_toolbar.addWidget(self.bold_btn)
         self.format_toolbar.addWidget(self.italic_btn)
         self.format_toolbar.addWidget(self.underline_btn)
-        self.h1_btn = QToolButton()
-        self.h1_btn.setText('H1')
-        self.h1_btn.setToolTip('Heading 1')
-        self.h1_btn.setStyleSheet('''
-            QToolButton {
-                font-weight: bold;
-                font-size: 16px;
-                color: #aad8ff;
-                background: #12213a;
-                border-radius: 6px;
-                padding: 2px 6px;
-                min-width: 32px;
-                min-height: 32px;
-                max-width: 32px;
-                max-height: 32px;
-            }
-            QToolButton:hover { background: #3366cc; color: #fff; }
-        ''')
-        self.h2_btn = QToolButton()
-        self.h2_btn.setText('H2')
-        self.h2_btn.setToolTip('Heading 2')
-        self.h2_btn.setStyleSheet('''
-            QToolButton {
-                font-weight: bold;
-                font-size: 16px;
-                color: #aad8ff;
-                background: #12213a;
-                border-radius: 6px;
-                padding: 2px 6px;
-                min-width: 32px;
-                min-height: 32px;
-                max-width: 32px;
-                max-height: 32px;
-            }
-            QToolButton:hover { background: #3366cc; color: #fff; }
-        ''')
-        self.h3_btn = QToolButton()
-        self.h3_btn.setText('H3')
-        self.h3_btn.setToolTip('Heading 3')
-        self.h3_btn.setStyleSheet('''
-            QToolButton {
-                font-weight: bold;
-                font-size: 16px;
-                color: #aad8ff;
-                background: #12213a;
-                border-radius: 6px;
-                padding: 2px 6px;
-                min-width: 32px;
-                min-height: 32px;
-                max-width: 32px;
-                max-height: 32px;
-            }
-            QToolButton:hover { background: #3366cc; color: #fff; }
-        ''')
+        self.h1_btn = self._make_format_button('H1', 'Heading 1', bold=True)
+        self.h2_btn = self._make_format_button('H2', 'Heading 2', bold=True)
+        self.h3_btn = self._make_format_button('H3', 'Heading 3', bold=True)
         self.format_toolbar.addWidget(self.h1_btn)
         self.format_toolbar.addWidget(self.h2_btn)
         self.format_toolbar.addWidget(self.h3_btn)
         # Normal button
-        self.normal_btn = QToolButton()
-        self.normal_btn.setText('Tx')
-        self.normal_btn.setToolTip('Normal Text')
-        self.normal_btn.setStyleSheet('''
-            QToolButton {
-                font-size: 16px;
-                color: #aad8ff;
-                background: #12213a;
-                border-radius: 6px;
-                padding: 2px 6px;
-                min-width: 32px;
-                min-height: 32px;
-                max-width: 32px;
-                max-height: 32px;
-            }
-            QToolButton:hover { background: #3366cc; color: #fff; }
-        ''')
+        self.normal_btn = self._make_format_button('Tx', 'Normal Text')
         self.format_toolbar.addWidget(self.normal_btn)
         self.format_toolbar.addStretch(1)
         # Insert the toolbar above the text area
         editor_layout.insertLayout(0, self.format_toolbar)
 
         editor_layout.addWidget(self.text_edit)
+        editor_layout.addWidget(self.plain_edit)
         editor_layout.addLayout(button_layout)
         editor_layout.setStretch(0, 1)  # Make QTextEdit expand
         editor_layout.setStretch(1, 0)  # Button bar does not expand
 
         main_splitter.addWidget(side_widget)
         main_splitter.addWidget(editor_widget)
-        main_splitter.setSizes([270, 630])  # 30%/70% split
+        main_splitter.setSizes(state.get('splitter') or [270, 630])  # 30%/70% split by default
         main_layout = QVBoxLayout(self)
         main_layout.setContentsMargins(0, 0, 0, 0)
         main_layout.setSpacing(0)
@@ -694,16 +1017,13 @@ class MainWindowUI(QWidget):
 
         self.close_btn.clicked.connect(self.close)
         self.min_btn.clicked.connect(self.showMinimized)
-        # Variables for dragging
-        self._drag_active = False
-        self._drag_pos = None
+        # Title bar drags and edge/handle resizes (see WindowResizer)
+        self.resizer = WindowResizer(self)
         self.title_bar.mousePressEvent = self._title_mouse_press
         self.title_bar.mouseMoveEvent = self._title_mouse_move
         self.title_bar.mouseReleaseEvent = self._title_mouse_release
         # --- Custom window resizing logic ---
         self._resize_margin = 4
-        self._resizing = False
-        self._resize_dir = None
         self.setMouseTracking(True)
         # --- Custom resize handles ---
         self._handles = {}
@@ -713,80 +1033,41 @@ class MainWindowUI(QWidget):
             handle.raise_()
             handle.show()
             self._handles[pos] = handle
-        self._resize_active = False
-        self._resize_start_geom = None
-        self._resize_start_pos = None
         self._handle_size = 8
         self._update_handles()
-        # Store scale factor
-        self._ui_scale = 1.0
 
-        # At the top of the file, before any widgets are created
-        app = QApplication.instance() or QApplication(sys.argv)
-        app.setStyle("Fusion")
-
-        # After creating self.list_widget and self.text_edit
-        scrollbar_style = """
-QScrollBar:vertical, QScrollBar:horizontal {
-    background: transparent;
-    border: none;
-    box-shadow: none;
-    width: 12px;
-    height: 12px;
-    margin: 0px;
-}
-QScrollBar::handle:vertical, QScrollBar::handle:horizontal {
-    background: #aad8ff;
-    border: none;
-    border-radius: 6px;
-    box-shadow: none;
-    min-height: 32px;
-    min-width: 32px;
-}
-QScrollBar::add-line:vertical, QScrollBar::sub-line:vertical,
-QScrollBar::add-line:horizontal, QScrollBar::sub-line:horizontal {
-    background: transparent;
-    border: none;
-    box-shadow: none;
-    height: 16px;
-    width: 16px;
-    border-radius: 8px;
-}
-QScrollBar::up-arrow, QScrollBar::down-arrow, QScrollBar::left-arrow, QScrollBar::right-arrow {
-    background: transparent;
-    border: none;
-    box-shadow: none;
-    width: 10px;
-    height: 10px;
-    border-radius: 5px;
-}
-QScrollBar::up-arrow {
-    image: url(data:image/svg+xml;utf8,<svg width='10' height='10' xmlns='http://www.w3.org/2000/svg'><polygon points='5,2 9,8 1,8' fill='%2366b3ff'/></svg>);
-}
-QScrollBar::down-arrow {
-    image: url(data:image/svg+xml;utf8,<svg width='10' height='10' xmlns='http://www.w3.org/2000/svg'><polygon points='5,8 9,2 1,2' fill='%2366b3ff'/></svg>);
-}
-QScrollBar::left-arrow {
-    image: url(data:image/svg+xml;utf8,<svg width='10' height='10' xmlns='http://www.w3.org/2000/svg'><polygon points='2,5 8,9 8,1' fill='%2366b3ff'/></svg>);
-}
-QScrollBar::right-arrow {
-    image: url(data:image/svg+xml;utf8,<svg width='10' height='10' xmlns='http://www.w3.org/2000/svg'><polygon points='8,5 2,9 2,1' fill='%2366b3ff'/></svg>);
-}
-QScrollBar::add-page:vertical, QScrollBar::sub-page:vertical,
-QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
-    background: transparent;
-    border: none;
-    box-shadow: none;
-}
-"""
-        self.list_widget.setStyleSheet(scrollbar_style)
-        self.text_edit.setStyleSheet(scrollbar_style)
+        # Base pixel font sizes of everything that follows the UI scale slider. The theme
+        # stylesheet carries no scaled sizes, so scaling only swaps fonts here.
+        self._scaled_font_sizes = {
+            self.list_widget: 15,
+            self.text_edit: 15,
+            self.plain_edit: 15,
+            self.notes_label: 15,
+            self.sort_combo: 13,
+            self.status_label: 13,
+            self.title_label: 16,
+            self.min_btn: 18,
+            self.close_btn: 18,
+            self.delete_button: 16,
+            self.import_button: 16,
+            self.history_button: 16,
+            self.slider_minus: 16,
+            self.slider_plus: 16,
+        }
+        for btn in self._format_buttons():
+            self._scaled_font_sizes[btn] = 16
+        # Store scale factor
+        self._ui_scale = self.ui_scale_slider.value() / 100.0
+        self.metrics_panel = None
+        self._apply_scaled_sizes(self._ui_scale)
+        if self._ui_scale != 1.0:
+            self._apply_scaled_chrome(self._ui_scale)
 
         # Connect formatting buttons
         self.bold_btn.clicked.connect(self.toggle_bold)
         self.italic_btn.clicked.connect(self.toggle_italic)
         self.underline_btn.clicked.connect(self.toggle_underline)
-        self.text_edit.cursorPositionChanged.connect(self.update_format_buttons)
+        self.text_edit.cursorPositionChanged.connect(self._schedule_format_update)
         self.h1_btn.clicked.connect(lambda: self.set_heading(28))
         self.h2_btn.clicked.connect(lambda: self.set_heading(22))
         self.h3_btn.clicked.connect(lambda: self.set_heading(16))
@@ -798,24 +1079,122 @@ QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
         QShortcut(QKeySequence('Ctrl+U'), self, activated=self.underline_btn.click)
         QShortcut(QKeySequence('Ctrl+N'), self, activated=self.new_file_button.click)
         QShortcut(QKeySequence('Ctrl+S'), self, activated=self.save_button.click)
-        QShortcut(QKeySequence('Ctrl+E'), self, activated=self.export_button.click)
+        QShortcut(QKeySequence('Ctrl+E'), self, activated=self.export_button.showMenu)
+        QShortcut(QKeySequence('Ctrl+Shift+I'), self, activated=self.import_button.click)
+        QShortcut(QKeySequence('Ctrl+H'), self, activated=self.history_button.click)
+        QShortcut(QKeySequence('Ctrl+Shift+M'), self, activated=self.toggle_metrics_panel)
+        self.profile_shortcut = QShortcut(QKeySequence('Ctrl+Shift+P'), self)
+        self.lock_shortcut = QShortcut(QKeySequence('Ctrl+L'), self)
         QShortcut(QKeySequence('Delete'), self, activated=self.delete_button.click)
         # Underline leading spaces workaround
         self._block_underline_leading_spaces = False
 
+        # Coalesced toolbar state updates: cursor moves only mark the state dirty,
+        # the buttons are refreshed once on the next event loop tick
+        self._format_update_timer = QTimer(self)
+        self._format_update_timer.setSingleShot(True)
+        self._format_update_timer.setInterval(0)
+        self._format_update_timer.timeout.connect(self.update_format_buttons)
+        self._last_format_state = None
+        self.format_update_counts = {'requested': 0, 'evaluated': 0, 'applied': 0}
+
+    def _make_format_button(self, text, tooltip, checkable=False, bold=False, italic=False, underline=False):
+        btn = QToolButton()
+        btn.setText(text)
+        btn.setToolTip(tooltip)
+        btn.setCheckable(checkable)
+        set_role(btn, 'format-button')
+        font = btn.font()
+        font.setBold(bold)
+        font.setItalic(italic)
+        font.setUnderline(underline)
+        btn.setFont(font)
+        return btn
+
+    def _format_buttons(self):
+        return (self.bold_btn, self.italic_btn, self.underline_btn,
+                self.h1_btn, self.h2_btn, self.h3_btn, self.normal_btn)
+
+    def _apply_scaled_sizes(self, scale):
+        for widget, pixel_size in self._scaled_font_sizes.items():
+            widget.setFont(scaled_font(widget, pixel_size, scale))
+        button_size = int(32 * scale)
+        for btn in self._format_buttons():
+            # Content box plus the theme's 2px/6px padding
+            btn.setFixedSize(button_size + 12, button_size + 4)
+        # Update icon sizes
+        icon_size = int(20 * scale)
+        self.new_file_button.setIconSize(QSize(icon_size, icon_size))
+        self.save_button.setIconSize(QSize(icon_size, icon_size))
+        self.export_button.setIconSize(QSize(icon_size, icon_size))
+        self.delete_button.setIconSize(QSize(icon_size, icon_size))
+        # Update title bar height
+        self.title_bar.setFixedHeight(int(36*scale))
+
+    def _apply_scaled_chrome(self, scale):
+        # Update splitter handle width
+        for widget in self.findChildren(QSplitterHandle):
+            widget.setMinimumWidth(int(18*scale))
+        # Update resize handle size
+        self._handle_size = int(8*scale)
+        self._update_handles()
+        # Update QTextEdit font size
+        for editor in (self.text_edit, self.plain_edit):
+            font = editor.font()
+            font.setPointSizeF(14 * scale)
+            editor.setFont(font)
+
+    @property
+    def editor(self):
+        return self.plain_edit if self.large_mode else self.text_edit
+
+    def set_large_mode(self, large):
+        if large == self.large_mode:
+            return
+        self.large_mode = large
+        self.text_edit.setVisible(not large)
+        self.plain_edit.setVisible(large)
+        for btn in self._format_buttons():
+            btn.setEnabled(not large)
+
+    def _restore_geometry(self, geometry):
+        if geometry:
+            x, y, width, height = geometry
+            # Only where a screen still is; a monitor may have been unplugged since
+            if QApplication.screenAt(QPoint(x + width // 2, y + height // 2)) is not None:
+                self.setGeometry(x, y, width, height)
+                return
+            self.resize(width, height)
+        else:
+            self.resize(900, 600)
+
+    def save_state(self):
+        geometry = self.geometry()
+        return {
+            'scale': self.ui_scale_slider.value(),
+            'geometry': [geometry.x(), geometry.y(), geometry.width(), geometry.height()],
+            'splitter': self.main_splitter.sizes(),
+        }
+
+    def show_status(self, message, timeout=2500):
+        self.status_label.setText(message)
+        if timeout:
+            self._status_timer.start(timeout)
+        else:
+            self._status_timer.stop()
+
     def _title_mouse_press(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
-            self._drag_active = True
-            self._drag_pos = event.globalPosition().toPoint() - self.frameGeometry().topLeft()
+            self.resizer.start_move(event.globalPosition().toPoint())
             event.accept()
 
     def _title_mouse_move(self, event):
-        if self._drag_active and event.buttons() & Qt.MouseButton.LeftButton:
-            self.move(event.globalPosition().toPoint() - self._drag_pos)
+        if event.buttons() & Qt.MouseButton.LeftButton:
+            self.resizer.drag_to(event.globalPosition().toPoint())
             event.accept()
 
     def _title_mouse_release(self, event):
-        self._drag_active = False
+        self.resizer.finish()
         event.accept()
 
     def mousePressEvent(self, event):
@@ -827,28 +1206,26 @@ QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
             # Determine which edge/corner is being pressed
             if x <= pos.x() <= x + margin:
                 if y <= pos.y() <= y + margin:
-                    self._resize_dir = 'topleft'
+                    edge = 'topleft'
                 elif y + h - margin <= pos.y() <= y + h:
-                    self._resize_dir = 'bottomleft'
+                    edge = 'bottomleft'
                 else:
-                    self._resize_dir = 'left'
+                    edge = 'left'
             elif x + w - margin <= pos.x() <= x + w:
                 if y <= pos.y() <= y + margin:
-                    self._resize_dir = 'topright'
+                    edge = 'topright'
                 elif y + h - margin <= pos.y() <= y + h:
-                    self._resize_dir = 'bottomright'
+                    edge = 'bottomright'
                 else:
-                    self._resize_dir = 'right'
+                    edge = 'right'
             elif y <= pos.y() <= y + margin:
-                self._resize_dir = 'top'
+                edge = 'top'
             elif y + h - margin <= pos.y() <= y + h:
-                self._resize_dir = 'bottom'
+                edge = 'bottom'
             else:
-                self._resize_dir = None
-            if self._resize_dir:
-                self._resizing = True
-                self._resize_start_geom = self.geometry()
-                self._resize_start_pos = event.globalPosition().toPoint()
+                edge = None
+            if edge:
+                self.resizer.start_resize(edge, event.globalPosition().toPoint())
                 event.accept()
                 return
         super().mousePressEvent(event)
@@ -859,7 +1236,7 @@ QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
         rect = self.rect()
         x, y, w, h = rect.x(), rect.y(), rect.width(), rect.height()
         cursor_set = False
-        if not self._resizing:
+        if not self.resizer.active:
             if x <= pos.x() <= x + margin:
                 if y <= pos.y() <= y + margin:
                     self.setCursor(Qt.CursorShape.SizeFDiagCursor)
@@ -888,38 +1265,14 @@ QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
                 cursor_set = True
             if not cursor_set:
                 self.setCursor(Qt.CursorShape.ArrowCursor)
-        if self._resizing:
-            delta = event.globalPosition().toPoint() - self._resize_start_pos
-            geom = self._resize_start_geom
-            new_geom = geom
-            if self._resize_dir == 'left':
-                new_geom.setLeft(geom.left() + delta.x())
-            elif self._resize_dir == 'right':
-                new_geom.setRight(geom.right() + delta.x())
-            elif self._resize_dir == 'top':
-                new_geom.setTop(geom.top() + delta.y())
-            elif self._resize_dir == 'bottom':
-                new_geom.setBottom(geom.bottom() + delta.y())
-            elif self._resize_dir == 'topleft':
-                new_geom.setTop(geom.top() + delta.y())
-                new_geom.setLeft(geom.left() + delta.x())
-            elif self._resize_dir == 'topright':
-                new_geom.setTop(geom.top() + delta.y())
-                new_geom.setRight(geom.right() + delta.x())
-            elif self._resize_dir == 'bottomleft':
-                new_geom.setBottom(geom.bottom() + delta.y())
-                new_geom.setLeft(geom.left() + delta.x())
-            elif self._resize_dir == 'bottomright':
-                new_geom.setBottom(geom.bottom() + delta.y())
-                new_geom.setRight(geom.right() + delta.x())
-            self.setGeometry(new_geom)
+        if self.resizer.active:
+            self.resizer.drag_to(event.globalPosition().toPoint())
             event.accept()
             return
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
-        self._resizing = False
-        self._resize_dir = None
+        self.resizer.finish()
         self.setCursor(Qt.CursorShape.ArrowCursor)
         super().mouseReleaseEvent(event)
 
@@ -943,162 +1296,27 @@ QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
     def eventFilter(self, obj, event):
         if isinstance(obj, ResizeHandle):
             if event.type() == event.Type.MouseButtonPress and event.button() == Qt.MouseButton.LeftButton:
-                self._resize_active = True
-                self._resize_dir = obj.position
-                self._resize_start_geom = self.geometry()
-                self._resize_start_pos = event.globalPosition().toPoint()
+                self.resizer.start_resize(obj.position, event.globalPosition().toPoint())
                 return True
-            elif event.type() == event.Type.MouseMove and self._resize_active:
-                delta = event.globalPosition().toPoint() - self._resize_start_pos
-                geom = self._resize_start_geom
-                new_geom = geom.getRect()  # returns (x, y, w, h)
-                x, y, w, h = new_geom
-                min_w, min_h = 400, 300
-                if self._resize_dir == 'left':
-                    new_x = min(x + delta.x(), x + w - min_w)
-                    new_w = max(w - delta.x(), min_w)
-                    self.setGeometry(new_x, y, new_w, h)
-                elif self._resize_dir == 'right':
-                    new_w = max(w + delta.x(), min_w)
-                    self.setGeometry(x, y, new_w, h)
-                elif self._resize_dir == 'top':
-                    new_y = min(y + delta.y(), y + h - min_h)
-                    new_h = max(h - delta.y(), min_h)
-                    self.setGeometry(x, new_y, w, new_h)
-                elif self._resize_dir == 'bottom':
-                    new_h = max(h + delta.y(), min_h)
-                    self.setGeometry(x, y, w, new_h)
-                elif self._resize_dir == 'topleft':
-                    new_x = min(x + delta.x(), x + w - min_w)
-                    new_w = max(w - delta.x(), min_w)
-                    new_y = min(y + delta.y(), y + h - min_h)
-                    new_h = max(h - delta.y(), min_h)
-                    self.setGeometry(new_x, new_y, new_w, new_h)
-                elif self._resize_dir == 'topright':
-                    new_w = max(w + delta.x(), min_w)
-                    new_y = min(y + delta.y(), y + h - min_h)
-                    new_h = max(h - delta.y(), min_h)
-                    self.setGeometry(x, new_y, new_w, new_h)
-                elif self._resize_dir == 'bottomleft':
-                    new_x = min(x + delta.x(), x + w - min_w)
-                    new_w = max(w - delta.x(), min_w)
-                    new_h = max(h + delta.y(), min_h)
-                    self.setGeometry(new_x, y, new_w, new_h)
-                elif self._resize_dir == 'bottomright':
-                    new_w = max(w + delta.x(), min_w)
-                    new_h = max(h + delta.y(), min_h)
-                    self.setGeometry(x, y, new_w, new_h)
+            elif event.type() == event.Type.MouseMove and self.resizer.active:
+                self.resizer.drag_to(event.globalPosition().toPoint())
                 return True
             elif event.type() == event.Type.MouseButtonRelease:
-                self._resize_active = False
-                self._resize_dir = None
+                self.resizer.finish()
                 return True
         return super().eventFilter(obj, event)
 
+    def toggle_metrics_panel(self):
+        if self.metrics_panel is None:
+            self.metrics_panel = MetricsPanel(self)
+        self.metrics_panel.setVisible(not self.metrics_panel.isVisible())
+
+    @metrics.instrument('_update_ui_scale')
     def _update_ui_scale(self, value):
         self._ui_scale = value / 100.0
         scale = self._ui_scale
-        # Update stylesheet with scaled values
-        self.setStyleSheet(f"""
-            QWidget {{
-                background-color: #0b1a2d;
-                color: white;
-                font-family: 'Inter', 'Segoe UI Variable', 'Segoe UI', 'Roboto', Tahoma, Geneva, Verdana, sans-serif;
-                font-size: {int(15*scale)}px;
-                border-radius: {int(12*scale)}px;
-            }}
-            QListWidget {{
-                background-color: #102a4c;
-                border: none;
-                border-radius: {int(10*scale)}px;
-            }}
-            QTextEdit {{
-                background-color: #081229;
-                border: none;
-                color: white;
-                border-radius: {int(10*scale)}px;
-            }}
-            QPushButton, QToolButton {{
-                background-color: #1a3a6d;
-                border: none;
-                padding: {int(8*scale)}px;
-                border-radius: {int(8*scale)}px;
-            }}
-            QPushButton:hover, QToolButton:hover {{
-                background-color: #3366cc;
-            }}
-            QLineEdit {{
-                background-color: #102a4c;
-                border: none;
-                color: white;
-                padding: {int(6*scale)}px;
-                border-radius: {int(8*scale)}px;
-            }}
-            QLabel {{
-                color: #aad8ff;
-                border-radius: {int(8*scale)}px;
-            }}
-        """)
-        # Update icon sizes
-        icon_size = int(20 * scale)
-        self.new_file_button.setIconSize(QSize(icon_size, icon_size))
-        self.save_button.setIconSize(QSize(icon_size, icon_size))
-        self.export_button.setIconSize(QSize(icon_size, icon_size))
-        self.delete_button.setIconSize(QSize(icon_size, icon_size))
-        # Update title bar height
-        self.title_bar.setFixedHeight(int(36*scale))
-        self.title_label.setStyleSheet(f"font-weight: bold; font-size: {int(16*scale)}px; color: #aad8ff;")
-        self.min_btn.setStyleSheet(f"""
-            QToolButton {{
-                background: none; font-size: {int(18*scale)}px; color: #aad8ff; border-radius: {int(6*scale)}px;
-            }}
-            QToolButton:hover {{
-                background: #224477;
-            }}
-        """)
-        self.close_btn.setStyleSheet(f"""
-            QToolButton {{
-                background: none; font-size: {int(18*scale)}px; color: #aad8ff; border-radius: {int(6*scale)}px;
-            }}
-            QToolButton:hover {{
-                background: #d9534f; color: white;
-            }}
-        """)
-        # Update splitter handle width
-        for widget in self.findChildren(QSplitterHandle):
-            widget.setMinimumWidth(int(18*scale))
-        # Update resize handle size
-        self._handle_size = int(8*scale)
-        self._update_handles()
-        # Update QTextEdit font size
-        font = self.text_edit.font()
-        font.setPointSizeF(14 * scale)
-        self.text_edit.setFont(font)
-        # Update formatting toolbar button font sizes
-        button_size = int(32 * scale)
-        button_font = int(16 * scale)
-        button_style = f'''
-            QToolButton {{
-                font-weight: bold;
-                font-size: {button_font}px;
-                color: #aad8ff;
-                background: #12213a;
-                border-radius: 6px;
-                padding: 2px 6px;
-                min-width: {button_size}px;
-                min-height: {button_size}px;
-                max-width: {button_size}px;
-                max-height: {button_size}px;
-            }}
-            QToolButton:hover {{ background: #3366cc; color: #fff; }}
-        '''
-        self.bold_btn.setStyleSheet(button_style)
-        self.italic_btn.setStyleSheet(button_style)
-        self.underline_btn.setStyleSheet(button_style)
-        self.h1_btn.setStyleSheet(button_style)
-        self.h2_btn.setStyleSheet(button_style)
-        self.h3_btn.setStyleSheet(button_style)
-        self.normal_btn.setStyleSheet(button_style)
+        self._apply_scaled_sizes(scale)
+        self._apply_scaled_chrome(scale)
         # Update all text in QTextEdit to scale font size
         doc = self.text_edit.document()
         cursor = QTextCursor(doc)
@@ -1129,12 +1347,26 @@ QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
             cursor.select(QTextCursor.SelectionType.WordUnderCursor)
         cursor.mergeCharFormat(fmt)
         self.text_edit.mergeCurrentCharFormat(fmt)
+        # Buttons were toggled by hand, so the cached state no longer matches them
+        self._last_format_state = None
+
+    def _schedule_format_update(self):
+        self.format_update_counts['requested'] += 1
+        if not self._format_update_timer.isActive():
+            self._format_update_timer.start()
 
     def update_format_buttons(self):
+        self.format_update_counts['evaluated'] += 1
         fmt = self.text_edit.currentCharFormat()
-        self.bold_btn.setChecked(fmt.fontWeight() > 50)
-        self.italic_btn.setChecked(fmt.fontItalic())
-        self.underline_btn.setChecked(fmt.fontUnderline())
+        state = (fmt.fontWeight() > 50, fmt.fontItalic(), fmt.fontUnderline())
+        if state == self._last_format_state:
+            return
+        self._last_format_state = state
+        self.format_update_counts['applied'] += 1
+        bold, italic, underline = state
+        self.bold_btn.setChecked(bold)
+        self.italic_btn.setChecked(italic)
+        self.underline_btn.setChecked(underline)
 
     def _underline_leading_spaces(self):
         if self._block_underline_leading_spaces:
@@ -1173,6 +1405,7 @@ QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
             cursor.select(QTextCursor.SelectionType.LineUnderCursor)
             cursor.mergeCharFormat(fmt)
         self.text_edit.mergeCurrentCharFormat(fmt)
+        self._schedule_format_update()
 
     def set_normal_text(self):
         cursor = self.text_edit.textCursor()
@@ -1185,3 +1418,4 @@ QScrollBar::add-page:horizontal, QScrollBar::sub-page:horizontal {
             cursor.select(QTextCursor.SelectionType.LineUnderCursor)
             cursor.mergeCharFormat(fmt)
         self.text_edit.mergeCurrentCharFormat(fmt)
+        self._schedule_format_update()
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import socket
+
+# Advisory vault lock. The lock file is created exclusively and records who holds it;
+# the holder refreshes a heartbeat while running. A lock whose owner process is gone
+# (same host) or whose heartbeat is older than `stale_after` seconds is taken over.
+
+HEARTBEAT_INTERVAL = 10  # seconds
+STALE_AFTER = 60  # seconds
+
+
+def _pid_alive(pid):
+    if pid <= 0:
+        return False
+    if sys.platform == 'win32':
+        import ctypes
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return False
+        try:
+            code = ctypes.c_ulong()
+            if not kernel32.GetExitCodeProcess(handle, ctypes.byref(code)):
+                return False
+            return code.value == STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class VaultLock:
+    def __init__(self, path, stale_after=STALE_AFTER):
+        self.path = path
+        self.stale_after = stale_after
+        self.held = False
+        self._token = None
+
+    def _owner_info(self):
+        return {
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'token': self._token,
+            'started': time.time(),
+            'heartbeat': time.time(),
+        }
+
+    def read_owner(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_stale(self, owner):
+        if owner is None:
+            # Unreadable/half-written lock: only stale once it is old enough
+            try:
+                return time.time() - os.path.getmtime(self.path) > self.stale_after
+            except OSError:
+                return True
+        if owner.get('host') == socket.gethostname() and not _pid_alive(owner.get('pid', -1)):
+            return True
+        return time.time() - owner.get('heartbeat', 0) > self.stale_after
+
+    def acquire(self):
+        if self.held:
+            return True
+        self._token = os.urandom(8).hex()
+        info = self._owner_info()
+        try:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        except FileExistsError:
+            if not self.is_stale(self.read_owner()):
+                return False
+            # Take over the stale lock atomically, then make sure no other instance
+            # raced us to the same takeover
+            tmp = f"{self.path}.{self._token}"
+            with open(tmp, 'w') as f:
+                json.dump(info, f)
+            os.replace(tmp, self.path)
+            owner = self.read_owner()
+            self.held = owner is not None and owner.get('token') == self._token
+            return self.held
+        with os.fdopen(fd, 'w') as f:
+            json.dump(info, f)
+        self.held = True
+        return True
+
+    def heartbeat(self):
+        if not self.held:
+            return
+        owner = self.read_owner()
+        if owner is None or owner.get('token') != self._token:
+            # Someone took the lock over (we were considered stale)
+            self.held = False
+            return
+        owner['heartbeat'] = time.time()
+        tmp = f"{self.path}.{self._token}"
+        with open(tmp, 'w') as f:
+            json.dump(owner, f)
+        os.replace(tmp, self.path)
+
+    def release(self):
+        if not self.held:
+            return
+        owner = self.read_owner()
+        if owner is not None and owner.get('token') == self._token:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+        self.held = False
@@ -0,0 +1,113 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+
+import encryption
+
+# Password checking. The config keeps a verifier, an HMAC of a fixed label under the
+# derived key: it tells whether a password is right, but unlike the key itself (which
+# older configs stored as 'hash') it can't decrypt anything. Comparisons are constant
+# time.
+#
+# LoginThrottle adds an exponential delay after repeated wrong passwords, kept in a small
+# state file so restarting the app doesn't reset it. It only slows down guessing through
+# the app; it is not a substitute for a strong password.
+
+VERIFIER_LABEL = b'encrypted-notepad/password-verifier/v1'
+
+DEFAULT_THROTTLE = {
+    # Wrong passwords allowed before any delay
+    'free_attempts': 3,
+    'base_delay_s': 2,
+    'max_delay_s': 300,
+}
+
+
+def make_verifier(key):
+    return base64.b64encode(hmac.new(bytes(key), VERIFIER_LABEL, hashlib.sha256).digest()).decode('ascii')
+
+
+def enroll(password):
+    # New vault: returns (config entries, key)
+    salt = os.urandom(16)
+    key = encryption.derive_key(password, salt)
+    return {'salt': base64.b64encode(salt).decode('utf-8'), 'verifier': make_verifier(key)}, key
+
+
+def check_key(config, key):
+    if 'verifier' in config:
+        return hmac.compare_digest(make_verifier(key).encode('ascii'), config['verifier'].encode('ascii'))
+    if 'hash' in config:
+        # Older configs stored the key itself
+        return hmac.compare_digest(bytes(key), base64.b64decode(config['hash']))
+    return False
+
+
+def unlock(config, password):
+    # The key for `password`, or None if it is wrong. One KDF run.
+    key = encryption.derive_key(password, base64.b64decode(config['salt']))
+    return key if check_key(config, key) else None
+
+
+def upgrade_config(config, key):
+    # Replaces a stored key with a verifier; returns True if `config` changed and needs saving
+    if 'hash' not in config:
+        return False
+    config['verifier'] = make_verifier(key)
+    del config['hash']
+    return True
+
+
+class LoginThrottle:
+    def __init__(self, path, policy=None):
+        self.path = path
+        self.policy = dict(DEFAULT_THROTTLE, **(policy or {}))
+        self.failures = 0
+        self.last_failure = 0.0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.failures = int(state.get('failures', 0))
+            self.last_failure = float(state.get('last_failure', 0.0))
+        except (OSError, ValueError, TypeError, AttributeError):
+            pass
+
+    def delay(self):
+        # Seconds to wait after the current number of failures
+        extra = self.failures - self.policy['free_attempts']
+        if extra < 0:
+            return 0.0
+        return float(min(self.policy['max_delay_s'], self.policy['base_delay_s'] * 2 ** extra))
+
+    def remaining(self):
+        delay = self.delay()
+        if not delay:
+            return 0.0
+        elapsed = time.time() - self.last_failure
+        if elapsed < 0:
+            # Clock was set back; don't let that stretch the wait
+            return delay
+        return max(0.0, delay - elapsed)
+
+    def failed(self):
+        self.failures += 1
+        self.last_failure = time.time()
+        self._save()
+
+    def succeeded(self):
+        if self.failures:
+            self.failures = 0
+            self.last_failure = 0.0
+            self._save()
+
+    def _save(self):
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'failures': self.failures, 'last_failure': self.last_failure}, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            pass
@@ -0,0 +1,83 @@
+from PyQt6.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+
+class NotesWatcher(QObject):
+    # Emits (added, removed, modified) lists of note ids after a burst of filesystem
+    # events has settled. Notes are compared by their storage stamp (mtime, size) so only
+    # the notes that actually changed need to be re-decrypted by the listener.
+    changed = pyqtSignal(list, list, list)
+
+    def __init__(self, storage, debounce_ms=300, parent=None):
+        super().__init__(parent)
+        self.storage = storage
+        self._snapshot = {}
+        self._watched_file = None
+        self._suspended = False
+        self._fs_watcher = QFileSystemWatcher(self)
+        for path in storage.watch_paths():
+            self._fs_watcher.addPath(path)
+        self._fs_watcher.directoryChanged.connect(self._schedule_scan)
+        self._fs_watcher.fileChanged.connect(self._schedule_scan)
+        self._debounce = QTimer(self)
+        self._debounce.setSingleShot(True)
+        self._debounce.setInterval(debounce_ms)
+        self._debounce.timeout.connect(self.scan)
+
+    def stamp(self, note_id):
+        return self.storage.stamp(note_id)
+
+    def reset(self):
+        # Take a fresh baseline, e.g. for a full load_notes(); returns {note_id: stamp}
+        self._debounce.stop()
+        self._snapshot = self.storage.list_notes()
+        return dict(self._snapshot)
+
+    def acknowledge(self, note_id):
+        # Record a write/delete made by this process so it is not reported back
+        stamp = self.stamp(note_id)
+        if stamp is None:
+            self._snapshot.pop(note_id, None)
+        else:
+            self._snapshot[note_id] = stamp
+
+    def is_stale(self, note_id):
+        # Cheap stamp check: has this note changed since the last scan/acknowledge?
+        return self.stamp(note_id) != self._snapshot.get(note_id)
+
+    def watch_file(self, note_id):
+        # Directory events don't cover in-place rewrites, so the open note's file is watched directly
+        if self._watched_file:
+            self._fs_watcher.removePath(self._watched_file)
+        self._watched_file = self.storage.note_path(note_id) if note_id else None
+        if self._watched_file:
+            self._fs_watcher.addPath(self._watched_file)
+
+    def _rearm(self):
+        # Editors that save by rename drop the file from the watch list
+        watched = set(self._fs_watcher.files()) | set(self._fs_watcher.directories())
+        for path in self.storage.watch_paths() + ([self._watched_file] if self._watched_file else []):
+            if path not in watched:
+                self._fs_watcher.addPath(path)
+
+    def suspend(self):
+        # For bulk operations that reload the list themselves afterwards
+        self._suspended = True
+        self._debounce.stop()
+
+    def resume(self):
+        self._suspended = False
+
+    def _schedule_scan(self, _path=None):
+        if not self._suspended:
+            self._debounce.start()
+
+    def scan(self):
+        current = self.storage.list_notes()
+        previous = self._snapshot
+        added = sorted(f for f in current if f not in previous)
+        removed = sorted(f for f in previous if f not in current)
+        modified = sorted(f for f in current if f in previous and current[f] != previous[f])
+        self._snapshot = current
+        self._rearm()
+        if added or removed or modified:
+            self.changed.emit(added, removed, modified)